@@ -0,0 +1,13 @@
+import os
+
+
+def get_app_dir_path():
+    """
+    获取程序数据目录，Windows 下位于 APPDATA，其它系统位于 ~/.config，不存在时自动创建
+    """
+    appdata_path = os.getenv("APPDATA")
+    if appdata_path is None:
+        appdata_path = os.path.join(os.path.expanduser("~"), ".config")
+    app_dir_path = os.path.join(appdata_path, "file_search")
+    os.makedirs(app_dir_path, exist_ok=True)
+    return app_dir_path
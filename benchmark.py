@@ -0,0 +1,247 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from file_index import FileIndex
+from query import Query
+from result_store import ResultStore
+from search_engine import SearchJob
+from traversal import ParallelWalker
+
+ASCII_WORDS = ["report", "final", "data", "image", "backup", "test", "draft", "notes", "config", "log",
+               "photo", "video", "music", "project", "summary", "invoice", "readme", "build", "temp", "archive"]
+CJK_WORDS = ["报告", "最终版", "数据", "图片", "备份", "测试", "草稿", "笔记", "配置", "日志",
+             "照片", "视频", "音乐", "项目", "总结", "发票", "说明", "会议纪要", "合同", "简历"]
+# 扩展名及其出现权重
+DEFAULT_EXTENSIONS = {"txt": 20, "jpg": 15, "png": 8, "pdf": 8, "docx": 6, "py": 6, "mp4": 3, "mp3": 4,
+                      "zip": 2, "log": 8, "json": 5, "": 3}
+DEFAULT_QUERIES = ["report", "报告", "*.jpg", "final data", "ext:py", "size:>100k", "/^test_\\d+/"]
+
+
+def generate_tree(root, depth=4, fanout=5, files_per_dir=40, seed=0, cjk_ratio=0.3, extensions=None):
+    """
+    在 root 下生成确定性的合成目录树，参数与 seed 相同时生成的文件名、大小与修改时间完全一致
+    文件名由若干词语拼接，词语按 Zipf 分布选取（少数词语很常见），其中 cjk_ratio 比例的词语为中文
+    :param extensions: {扩展名: 权重}，默认为 DEFAULT_EXTENSIONS
+    :return: 生成的文件数
+    """
+    rng = random.Random(seed)
+    extensions = extensions or DEFAULT_EXTENSIONS
+    ext_names, ext_weights = list(extensions), list(extensions.values())
+    word_weights = [1 / (rank + 1) for rank in range(len(ASCII_WORDS))]
+    base_time = 1600000000
+    file_count = 0
+
+    def file_name():
+        words = []
+        for i in range(rng.randint(1, 3)):
+            pool = CJK_WORDS if rng.random() < cjk_ratio else ASCII_WORDS
+            words.append(rng.choices(pool, word_weights)[0])
+        name = rng.choice(["_", "-", " "]).join(words)
+        if rng.random() < 0.3:
+            name += f"_{rng.randint(0, 999)}"
+        ext = rng.choices(ext_names, ext_weights)[0]
+        return f"{name}.{ext}" if ext else name
+
+    def fill(dir_path, level):
+        nonlocal file_count
+        os.makedirs(dir_path, exist_ok=True)
+        names = set()
+        while len(names) < files_per_dir:
+            names.add(file_name())
+        for name in sorted(names):
+            file_path = os.path.join(dir_path, name)
+            with open(file_path, "wb"):
+                pass
+            # 以稀疏文件得到不同大小，不实际占用磁盘
+            os.truncate(file_path, int(rng.paretovariate(1.2) * 1024))
+            mtime = base_time + rng.randint(0, 5 * 365 * 86400)
+            os.utime(file_path, (mtime, mtime))
+            file_count += 1
+        if level < depth:
+            for i in range(fanout):
+                fill(os.path.join(dir_path, f"{rng.choice(ASCII_WORDS + CJK_WORDS)}_{i}"), level + 1)
+
+    fill(root, 1)
+    return file_count
+
+
+def measure(function, repeat):
+    """
+    :return: (各次耗时, 最后一次的返回值)
+    """
+    seconds = []
+    result = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        seconds.append(time.perf_counter() - start)
+    return seconds, result
+
+
+def summary(seconds, **extra):
+    result = {"seconds": seconds, "min": min(seconds), "median": statistics.median(seconds)}
+    result.update(extra)
+    return result
+
+
+def bench_traversal(root, repeat):
+    def walk():
+        return sum(len(rows) for rows in ParallelWalker().walk([root]))
+    seconds, count = measure(walk, repeat)
+    return summary(seconds, files=count)
+
+
+def bench_index_build(root, db_path, repeat):
+    def build():
+        if os.path.exists(db_path):
+            os.remove(db_path)
+        file_index = FileIndex(db_path)
+        file_index.build(root)
+        file_index.connection.close()
+    seconds, result = measure(build, repeat)
+    return summary(seconds, db_bytes=os.path.getsize(db_path))
+
+
+def bench_queries(root, db_path, queries, repeat):
+    """
+    冷查询：每个查询使用新打开的索引连接执行一次（sqlite 页缓存为空，但操作系统文件缓存仍在）
+    热查询：在同一连接上重复执行
+    """
+    results = {}
+    for text in queries:
+        query = Query(text, ignore_case=True)
+        file_index = FileIndex(db_path)
+
+        def run():
+            return sum(len(rows) for rows in SearchJob(query, root, file_index).batches())
+        cold, count = measure(run, 1)
+        warm, count = measure(run, repeat)
+        file_index.connection.close()
+        disk, disk_count = measure(lambda: sum(len(rows) for rows in SearchJob(query, root).batches()), 1)
+        results[text] = {"results": count, "cold": cold[0], "warm": summary(warm), "disk_walk": disk[0],
+                         "disk_walk_results": disk_count}
+    return results
+
+
+def bench_result_memory(root):
+    """
+    比较每条结果的内存占用：旧版本的 [文件名, 完整路径, 创建时间文本, 修改时间文本] 列表与 ResultStore
+    """
+    records = [row for rows in ParallelWalker().walk([root]) for row in rows]
+    # 逐条复制，避免与遍历结果共用字符串对象而少算
+    records = [(name.encode().decode(), dir_path.encode().decode(), size, ctime, mtime)
+               for name, dir_path, size, ctime, mtime in records]
+
+    def measure_memory(build):
+        tracemalloc.start()
+        result = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return result, size
+
+    def build_lists():
+        return [[name, os.path.join(dir_path, name), time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ctime)),
+                 time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(mtime))]
+                for name, dir_path, size, ctime, mtime in records]
+
+    def build_store():
+        store = ResultStore()
+        store.append(records)
+        return store
+
+    lists, list_bytes = measure_memory(build_lists)
+    del lists
+    store, store_bytes = measure_memory(build_store)
+    rows = max(1, len(records))
+    return {"rows": len(records), "list_bytes_per_row": list_bytes / rows, "store_bytes_per_row": store_bytes / rows,
+            "reduction": list_bytes / max(1, store_bytes)}
+
+
+def bench_bulk_insert(root, repeat, batch_size=2000):
+    """
+    在 Qt offscreen 平台上模拟搜索线程按批交付结果、界面逐批追加到表格
+    """
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    try:
+        from PyQt5 import QtWidgets
+        from result_model import ResultModel
+    except ImportError as e:
+        return {"skipped": str(e)}
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv[:1])
+    records = [row for rows in ParallelWalker().walk([root]) for row in rows]
+
+    def insert():
+        view = QtWidgets.QTableView()
+        model = ResultModel(view)
+        view.setModel(model)
+        view.resize(1000, 800)
+        view.show()
+        for start in range(0, len(records), batch_size):
+            model.append_rows(records[start:start + batch_size])
+            app.processEvents()
+        view.close()
+    seconds, result = measure(insert, repeat)
+    return summary(seconds, rows=len(records), batch_size=batch_size)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="生成合成目录树并测量遍历、建立索引、查询与表格插入的耗时，结果以 JSON 输出")
+    parser.add_argument("--root", help="生成目录树的位置，默认使用临时目录并在结束后删除")
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--fanout", type=int, default=5)
+    parser.add_argument("--files", type=int, default=40, help="每个目录中的文件数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cjk-ratio", type=float, default=0.3, help="文件名中中文词语的比例")
+    parser.add_argument("--repeat", type=int, default=3, help="每项测量的重复次数")
+    parser.add_argument("--query", action="append", help="要测量的查询，可多次指定，默认使用一组内置查询")
+    parser.add_argument("--skip-qt", action="store_true", help="不测量表格插入")
+    parser.add_argument("-o", "--output", help="结果写入的文件，默认输出到标准输出")
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="file_search_bench_")
+    root = args.root or os.path.join(work_dir, "tree")
+    db_path = os.path.join(work_dir, "index.db")
+    params = {"depth": args.depth, "fanout": args.fanout, "files_per_dir": args.files, "seed": args.seed,
+              "cjk_ratio": args.cjk_ratio, "repeat": args.repeat}
+    try:
+        start = time.perf_counter()
+        file_count = generate_tree(root, args.depth, args.fanout, args.files, args.seed, args.cjk_ratio)
+        report = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "params": params,
+            "tree": {"files": file_count, "generate_seconds": time.perf_counter() - start},
+            "traversal": bench_traversal(root, args.repeat),
+            "index_build": bench_index_build(root, db_path, args.repeat),
+            "queries": bench_queries(root, db_path, args.query or DEFAULT_QUERIES, args.repeat),
+            "result_memory": bench_result_memory(root),
+        }
+        if not args.skip_qt:
+            report["bulk_insert"] = bench_bulk_insert(root, args.repeat)
+    finally:
+        # 指定了 --root 时保留生成的目录树，下次使用相同参数可直接复用
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+import fnmatch
+import json
+import os
+import re
+
+from app_data import get_app_dir_path
+
+DEFAULT_DIR_NAMES = [".git", ".hg", ".svn", "node_modules", "__pycache__"]
+
+# 内核提供的虚拟文件系统，其中的"文件"不是磁盘上的文件，遍历既慢又没有意义
+PSEUDO_FILESYSTEMS = {
+    "proc", "sysfs", "devtmpfs", "devpts", "cgroup", "cgroup2", "securityfs", "debugfs", "tracefs", "pstore",
+    "bpf", "configfs", "fusectl", "mqueue", "hugetlbfs", "autofs", "binfmt_misc", "efivarfs", "selinuxfs",
+    "nsfs", "rpc_pipefs", "fuse.gvfsd-fuse", "fuse.portal",
+}
+NETWORK_FILESYSTEMS = {
+    "nfs", "nfs4", "cifs", "smb3", "smbfs", "ncpfs", "afs", "9p", "ceph", "glusterfs", "fuse.sshfs",
+    "fuse.rclone", "fuse.davfs", "davfs", "fuse.s3fs",
+}
+
+
+def read_mounts(mountinfo_path="/proc/self/mountinfo"):
+    """
+    :return: [(挂载点, 文件系统类型), ...]，无法读取时（如 Windows）返回空列表
+    """
+    try:
+        with open(mountinfo_path, "rb") as f:
+            lines = f.readlines()
+    except OSError:
+        return []
+    mounts = []
+    for line in lines:
+        # 格式：编号 父编号 主:次设备号 根 挂载点 选项 [可选字段...] - 类型 来源 超级块选项
+        fields = line.split()
+        try:
+            separator = fields.index(b"-")
+            mount_point, fs_type = fields[4], fields[separator + 1]
+        except (ValueError, IndexError):
+            continue
+        # 挂载点中的空格及非 ASCII 字节以八进制转义，按字节还原后再与 os.scandir 得到的路径一样解码
+        mount_point = re.sub(rb"\\([0-7]{3})", lambda m: bytes([int(m.group(1), 8) & 0xFF]), mount_point)
+        mounts.append((os.fsdecode(mount_point), os.fsdecode(fs_type)))
+    return mounts
+
+
+class ExclusionRules(object):
+    """
+    遍历时排除的目录与文件，在进入目录之前判断，被排除的目录整棵跳过
+    :param dir_names: 按名称排除的目录
+    :param path_globs: 与完整路径匹配的通配符，* 可跨越目录分隔符，同时作用于目录与文件
+    :param one_filesystem: 不进入与搜索路径不在同一文件系统（st_dev 不同）的目录
+    :param skip_pseudo: 跳过 /proc/self/mountinfo 中类型为 /proc、/sys 等虚拟文件系统的挂载点
+    :param skip_network: 跳过网络文件系统的挂载点
+    """
+
+    def __init__(self, dir_names=None, path_globs=None, one_filesystem=False, skip_pseudo=True, skip_network=True):
+        self.dir_names = list(DEFAULT_DIR_NAMES if dir_names is None else dir_names)
+        self.path_globs = list(path_globs or [])
+        self.one_filesystem = one_filesystem
+        self.skip_pseudo = skip_pseudo
+        self.skip_network = skip_network
+
+    def compile(self, roots):
+        """
+        :param roots: 本次遍历的起点，起点本身总是会被遍历
+        :return: PathFilter
+        """
+        skipped_types = set()
+        if self.skip_pseudo:
+            skipped_types |= PSEUDO_FILESYSTEMS
+        if self.skip_network:
+            skipped_types |= NETWORK_FILESYSTEMS
+        excluded_mounts = {mount_point for mount_point, fs_type in read_mounts() if fs_type in skipped_types}
+        devices = None
+        if self.one_filesystem:
+            devices = set()
+            for root in roots:
+                try:
+                    devices.add(os.stat(root).st_dev)
+                except OSError:
+                    pass
+        glob = None
+        if self.path_globs:
+            glob = re.compile("|".join(fnmatch.translate(pattern) for pattern in self.path_globs))
+        return PathFilter(set(self.dir_names), glob, excluded_mounts, devices)
+
+    def to_dict(self):
+        return {"dir_names": self.dir_names, "path_globs": self.path_globs, "one_filesystem": self.one_filesystem,
+                "skip_pseudo": self.skip_pseudo, "skip_network": self.skip_network}
+
+    @classmethod
+    def load(cls, file_path=None):
+        """
+        从程序数据目录中的 exclusions.json 读取，文件不存在或已损坏时使用默认规则
+        """
+        if file_path is None:
+            file_path = os.path.join(get_app_dir_path(), "exclusions.json")
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                return cls(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return cls()
+
+    def save(self, file_path=None):
+        if file_path is None:
+            file_path = os.path.join(get_app_dir_path(), "exclusions.json")
+        with open(file_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+    def update(self, other):
+        """
+        以 other 的规则替换当前规则，已持有本对象的索引与搜索随之使用新规则
+        """
+        self.__dict__.update(other.to_dict())
+
+
+class PathFilter(object):
+    """
+    由 ExclusionRules.compile 生成，遍历线程共用，只读
+    """
+
+    def __init__(self, dir_names, glob, excluded_mounts, devices):
+        self.dir_names = dir_names
+        self.glob = glob
+        self.excluded_mounts = excluded_mounts
+        self.devices = devices
+
+    def allow_dir(self, dir_path):
+        if os.path.basename(dir_path) in self.dir_names or dir_path in self.excluded_mounts:
+            return False
+        if self.glob is not None and self.glob.match(dir_path):
+            return False
+        if self.devices is not None:
+            try:
+                return os.lstat(dir_path).st_dev in self.devices
+            except OSError:
+                return False
+        return True
+
+    def allow_file(self, file_path):
+        return self.glob is None or not self.glob.match(file_path)
@@ -0,0 +1,80 @@
+import struct
+
+# EXIF 数据位于 JPEG 开头的 APP1 段中，段长度不超过 64KB
+HEAD_SIZE = 128 * 1024
+
+ORIENTATION_TAG = 0x0112
+THUMBNAIL_OFFSET_TAG = 0x0201
+THUMBNAIL_LENGTH_TAG = 0x0202
+
+
+def read_ifd(tiff, offset, byte_order):
+    """
+    :return: ({标签: 值}, 下一个 IFD 的偏移量)，只解析 SHORT 与 LONG 类型的单个值
+    """
+    count = struct.unpack_from(byte_order + "H", tiff, offset)[0]
+    tags = {}
+    for i in range(count):
+        tag, value_type, value_count = struct.unpack_from(byte_order + "HHI", tiff, offset + 2 + i * 12)
+        value_offset = offset + 2 + i * 12 + 8
+        if value_count != 1:
+            continue
+        if value_type == 3:
+            tags[tag] = struct.unpack_from(byte_order + "H", tiff, value_offset)[0]
+        elif value_type == 4:
+            tags[tag] = struct.unpack_from(byte_order + "I", tiff, value_offset)[0]
+    next_offset = struct.unpack_from(byte_order + "I", tiff, offset + 2 + count * 12)[0]
+    return tags, next_offset
+
+
+def exif_segment(head):
+    """
+    :param head: JPEG 文件开头的字节
+    :return: APP1 段中的 TIFF 数据，没有 EXIF 时返回 None
+    """
+    if not head.startswith(b"\xff\xd8"):
+        return None
+    position = 2
+    while position + 4 <= len(head):
+        if head[position] != 0xFF:
+            return None
+        marker = head[position + 1]
+        # 图像数据开始，之后不会再有 EXIF
+        if marker == 0xDA:
+            return None
+        length = struct.unpack_from(">H", head, position + 2)[0]
+        segment = head[position + 4:position + 2 + length]
+        if marker == 0xE1 and segment.startswith(b"Exif\x00\x00"):
+            return segment[6:]
+        position += 2 + length
+    return None
+
+
+def read_exif_thumbnail(file_path):
+    """
+    读取 JPEG 中内嵌的 EXIF 缩略图，只读取文件开头
+    :return: (缩略图的 JPEG 字节或 None, 方向标签值)，方向 1 表示无需旋转
+    """
+    with open(file_path, "rb") as f:
+        head = f.read(HEAD_SIZE)
+    tiff = exif_segment(head)
+    if tiff is None or len(tiff) < 8:
+        return None, 1
+    byte_order = {b"II": "<", b"MM": ">"}.get(tiff[:2])
+    if byte_order is None:
+        return None, 1
+    try:
+        ifd0, ifd1_offset = read_ifd(tiff, struct.unpack_from(byte_order + "I", tiff, 4)[0], byte_order)
+        orientation = ifd0.get(ORIENTATION_TAG, 1)
+        if not ifd1_offset:
+            return None, orientation
+        ifd1 = read_ifd(tiff, ifd1_offset, byte_order)[0]
+    except struct.error:
+        return None, 1
+    offset, length = ifd1.get(THUMBNAIL_OFFSET_TAG), ifd1.get(THUMBNAIL_LENGTH_TAG)
+    if offset is None or not length:
+        return None, orientation
+    thumbnail = tiff[offset:offset + length]
+    if len(thumbnail) != length or not thumbnail.startswith(b"\xff\xd8"):
+        return None, orientation
+    return thumbnail, orientation
@@ -0,0 +1,476 @@
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+
+from app_data import get_app_dir_path
+from instrumentation import NULL_STATS
+from traversal import ParallelWalker, is_sub_path
+from trigram import normalize, trigrams, encode_postings, decode_postings
+from query import file_extension
+
+# 索引结构变化时递增，旧版本的索引会被清空重建
+SCHEMA_VERSION = 4
+
+INSERT_FILE = "INSERT INTO files (name, ext, dir_id, size, ctime, mtime) VALUES (?, ?, ?, ?, ?, ?)"
+
+# 倒排表建立后新增的文件先逐条核对，超过此数量时并入倒排表
+TRIGRAM_TAIL_LIMIT = 20000
+# 搜索时 sqlite 每执行这么多条虚拟机指令检查一次是否已取消
+PROGRESS_STEPS = 10000
+
+
+class FileIndex(object):
+    """
+    保存在磁盘上的文件名索引，首次全盘遍历后，搜索直接查询数据库而不再遍历磁盘
+    每条记录包含文件名、所在目录、大小、创建时间与修改时间，目录路径单独存放并以编号引用
+    另为文件名建立三元组倒排表，三个字符及以上的关键字只需核对几个倒排表交集中的文件，
+    扩展名（小写）单独成列并建立索引，相当于每种扩展名一个倒排表，按扩展名搜索无需扫描文件名
+    """
+
+    def __init__(self, db_path=None, exclusions=None):
+        """
+        :param exclusions: 可选的 ExclusionRules，建立与更新索引时跳过被排除的目录
+        """
+        if db_path is None:
+            db_path = os.path.join(get_app_dir_path(), "index.db")
+        self.db_path = db_path
+        self.exclusions = exclusions
+        # sqlite 连接不能跨线程使用，每个线程各自持有一个连接
+        self.local = threading.local()
+        self.write_lock = threading.Lock()
+        self.init_tables()
+
+    @property
+    def connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path)
+            connection.execute("PRAGMA journal_mode=WAL")      # 建立索引时仍可并发查询
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def init_tables(self):
+        connection = self.connection
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        if version == SCHEMA_VERSION:
+            return
+        with self.write_lock, connection:
+            for table in ("roots", "dirs", "files", "meta", "trigrams"):
+                connection.execute(f"DROP TABLE IF EXISTS {table}")
+            connection.execute("CREATE TABLE roots (path TEXT PRIMARY KEY, build_time REAL)")
+            connection.execute("CREATE TABLE dirs (id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, mtime INTEGER)")
+            # AUTOINCREMENT 保证编号不被重复使用，倒排表中已删除文件的编号不会指向新文件
+            connection.execute("CREATE TABLE files (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, "
+                               "ext TEXT NOT NULL, dir_id INTEGER NOT NULL, size INTEGER, ctime INTEGER, mtime INTEGER)")
+            connection.execute("CREATE INDEX files_dir_id ON files(dir_id)")
+            connection.execute("CREATE INDEX files_ext ON files(ext)")
+            connection.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value INTEGER)")
+            connection.execute("CREATE TABLE trigrams (gram TEXT PRIMARY KEY, count INTEGER, postings BLOB) "
+                               "WITHOUT ROWID")
+            connection.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    def roots(self):
+        return [row[0] for row in self.connection.execute("SELECT path FROM roots")]
+
+    def covers(self, path):
+        """
+        判断 path 是否已被某个已建立索引的根目录覆盖
+        """
+        path = os.path.abspath(path)
+        return any(is_sub_path(path, root) for root in self.roots())
+
+    @contextmanager
+    def writing(self):
+        """
+        写事务，所有修改索引的操作都应在此上下文中进行
+        """
+        connection = self.connection
+        with self.write_lock:
+            connection.execute("BEGIN")
+            try:
+                yield connection
+            except BaseException:
+                connection.rollback()
+                raise
+            connection.commit()
+
+    def build(self, root, token=None):
+        """
+        遍历 root 并重建其下所有记录
+        :param token: 可选的 CancellationToken，取消后中止建立索引，已有索引保持不变
+        :return: 建立完成返回 True，被中止返回 False
+        """
+        root = os.path.abspath(root)
+        try:
+            with self.writing() as connection:
+                self.delete_tree(root)
+                self.add_tree(root, token)
+                self.rebuild_trigrams()
+                # 新根目录覆盖的旧根目录不再单独记录
+                for old_root in self.roots():
+                    if is_sub_path(old_root, root):
+                        connection.execute("DELETE FROM roots WHERE path = ?", (old_root,))
+                connection.execute("INSERT OR REPLACE INTO roots VALUES (?, ?)", (root, time.time()))
+        except BuildCancelled:
+            return False
+        return True
+
+    def add_tree(self, root, token=None, parallel=True):
+        """
+        遍历 root 并写入其下所有目录与文件，需在 writing() 中调用
+        :param parallel: 为 False 时在当前线程中逐个目录读取，用于监视线程中新建目录等小范围的增量写入，
+                         不为每个事件启动一组遍历线程
+        :return: 新写入的 (目录编号, 目录路径) 列表
+        """
+        connection = self.connection
+        added_dirs = []
+        if parallel:
+            walk = ParallelWalker(exclusions=self.exclusions).scan([root], token=token)
+        else:
+            walk = [self.scan_tree(root)]
+        for dir_results in walk:
+            for dir_path, files in dir_results:
+                dir_id = self.get_dir_id(dir_path)
+                added_dirs.append((dir_id, dir_path))
+                connection.executemany(INSERT_FILE, [(file_name, file_extension(file_name), dir_id, size, ctime, mtime)
+                                                     for file_name, size, ctime, mtime in files])
+        if token is not None and token.cancelled:
+            raise BuildCancelled()
+        return added_dirs
+
+    def scan_tree(self, root):
+        """
+        在当前线程中用 os.scandir 遍历 root，跳过的目录与文件同 ParallelWalker
+        :return: 生成器，每次产出 (目录路径, [(文件名, 大小, 创建时间, 修改时间), ...])
+        """
+        path_filter = self.path_filter(root)
+        stack = [root]
+        while stack:
+            dir_path = stack.pop()
+            files = []
+            try:
+                with os.scandir(dir_path) as entries:
+                    for entry in entries:
+                        try:
+                            is_dir = entry.is_dir()
+                        except OSError:
+                            is_dir = False
+                        if is_dir:
+                            # 与 os.walk 一致，不进入指向目录的符号链接
+                            if not entry.is_symlink() and (path_filter is None or path_filter.allow_dir(entry.path)):
+                                stack.append(entry.path)
+                            continue
+                        if path_filter is not None and not path_filter.allow_file(entry.path):
+                            continue
+                        try:
+                            stat_info = entry.stat()
+                        except OSError:
+                            continue
+                        files.append((entry.name, stat_info.st_size, int(stat_info.st_ctime),
+                                      int(stat_info.st_mtime)))
+            except OSError:
+                pass
+            yield dir_path, files
+
+    def path_filter(self, path):
+        """
+        :return: 按覆盖 path 的根目录生成的 PathFilter，没有排除规则时返回 None
+        """
+        if self.exclusions is None:
+            return None
+        root = next((root for root in self.roots() if is_sub_path(path, root)), path)
+        return self.exclusions.compile([root])
+
+    def is_excluded(self, dir_path):
+        """
+        判断已索引目录下新出现的目录是否应按排除规则跳过
+        """
+        path_filter = self.path_filter(dir_path)
+        return path_filter is not None and not path_filter.allow_dir(dir_path)
+
+    @staticmethod
+    def stat_row(dir_path, file_name, dir_id):
+        try:
+            stat_info = os.stat(os.path.join(dir_path, file_name))
+        except OSError:
+            return None
+        return (file_name, file_extension(file_name), dir_id, stat_info.st_size,
+                int(stat_info.st_ctime), int(stat_info.st_mtime))
+
+    def get_dir_id(self, dir_path):
+        """
+        获取目录编号，目录不存在时新建记录，并记下目录修改时间以便之后判断目录是否发生变化
+        """
+        connection = self.connection
+        try:
+            dir_mtime = int(os.stat(dir_path).st_mtime)
+        except OSError:
+            dir_mtime = None
+        row = connection.execute("SELECT id FROM dirs WHERE path = ?", (dir_path,)).fetchone()
+        if row is not None:
+            connection.execute("UPDATE dirs SET mtime = ? WHERE id = ?", (dir_mtime, row[0]))
+            return row[0]
+        return connection.execute("INSERT INTO dirs (path, mtime) VALUES (?, ?)", (dir_path, dir_mtime)).lastrowid
+
+    def get_dir_path(self, dir_id):
+        row = self.connection.execute("SELECT path FROM dirs WHERE id = ?", (dir_id,)).fetchone()
+        return None if row is None else row[0]
+
+    def tree_dirs(self, root):
+        """
+        :return: root 及其下所有已索引目录的 (目录编号, 目录路径, 修改时间) 列表
+        """
+        prefix = root if root.endswith(os.sep) else root + os.sep
+        return self.connection.execute("SELECT id, path, mtime FROM dirs WHERE path = ? OR substr(path, 1, ?) = ?",
+                                       (root, len(prefix), prefix)).fetchall()
+
+    def delete_tree(self, root):
+        """
+        删除 root 及其下所有目录与文件记录，需在 writing() 中调用
+        :return: 被删除的目录编号列表
+        """
+        dir_ids = [row[0] for row in self.tree_dirs(root)]
+        for i in range(0, len(dir_ids), 500):
+            chunk = dir_ids[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            self.connection.execute(f"DELETE FROM files WHERE dir_id IN ({placeholders})", chunk)
+            self.connection.execute(f"DELETE FROM dirs WHERE id IN ({placeholders})", chunk)
+        return dir_ids
+
+    def move_tree(self, old_root, new_root):
+        """
+        目录被重命名或移动后更新其下所有目录路径，目录编号保持不变，需在 writing() 中调用
+        """
+        self.delete_tree(new_root)
+        old_prefix = old_root if old_root.endswith(os.sep) else old_root + os.sep
+        self.connection.execute("UPDATE dirs SET path = ? || substr(path, ?) WHERE path = ? OR substr(path, 1, ?) = ?",
+                                (new_root, len(old_root) + 1, old_root, len(old_prefix), old_prefix))
+
+    def update_file(self, dir_path, file_name):
+        """
+        新增或更新单个文件的记录，文件已不存在时删除记录，需在 writing() 中调用
+        :return: 文件存在时返回 True
+        """
+        self.remove_file(dir_path, file_name)
+        row = self.stat_row(dir_path, file_name, self.get_dir_id(dir_path))
+        if row is None:
+            return False
+        self.connection.execute(INSERT_FILE, row)
+        return True
+
+    def remove_file(self, dir_path, file_name):
+        self.connection.execute("DELETE FROM files WHERE name = ? AND dir_id = (SELECT id FROM dirs WHERE path = ?)",
+                                (file_name, dir_path))
+
+    def rescan_dir(self, dir_path):
+        """
+        只重新读取单个目录的内容，新出现的子目录在当前线程中整棵写入，消失的子目录整棵删除，需在 writing() 中调用
+        :return: 新写入的 (目录编号, 目录路径) 列表
+        """
+        if not os.path.isdir(dir_path):
+            self.delete_tree(dir_path)
+            return []
+        dir_id = self.get_dir_id(dir_path)
+        prefix = dir_path if dir_path.endswith(os.sep) else dir_path + os.sep
+        indexed_dirs = set(row[0] for row in self.connection.execute(
+            "SELECT path FROM dirs WHERE substr(path, 1, ?) = ? AND instr(substr(path, ?), ?) = 0",
+            (len(prefix), prefix, len(prefix) + 1, os.sep)))
+        rows = []
+        added_dirs = []
+        current_dirs = set()
+        path_filter = self.path_filter(dir_path)
+        try:
+            entries = list(os.scandir(dir_path))
+        except OSError:
+            entries = []
+        for entry in entries:
+            if entry.is_dir():
+                # 与 os.walk 一致，指向目录的符号链接既不当作文件也不深入，被排除的目录视为已消失
+                if not entry.is_symlink() and (path_filter is None or path_filter.allow_dir(entry.path)):
+                    current_dirs.add(entry.path)
+                    if entry.path not in indexed_dirs:
+                        added_dirs.extend(self.add_tree(entry.path, parallel=False))
+            elif path_filter is None or path_filter.allow_file(entry.path):
+                row = self.stat_row(dir_path, entry.name, dir_id)
+                if row is not None:
+                    rows.append(row)
+        for removed_dir in indexed_dirs - current_dirs:
+            self.delete_tree(removed_dir)
+        self.connection.execute("DELETE FROM files WHERE dir_id = ?", (dir_id,))
+        self.connection.executemany(INSERT_FILE, rows)
+        return added_dirs
+
+    def get_meta(self, key, default=0):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return default if row is None else row[0]
+
+    def set_meta(self, key, value):
+        self.connection.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+    def rebuild_trigrams(self):
+        """
+        重新生成全部三元组倒排表，需在 writing() 中调用
+        """
+        postings = {}
+        covered_id = 0
+        for file_id, file_name in self.connection.execute("SELECT id, name FROM files ORDER BY id"):
+            for gram in trigrams(normalize(file_name)):
+                ids = postings.get(gram)
+                if ids is None:
+                    ids = postings[gram] = array("I")
+                ids.append(file_id)
+            covered_id = file_id
+        self.connection.execute("DELETE FROM trigrams")
+        self.connection.executemany("INSERT INTO trigrams VALUES (?, ?, ?)",
+                                    ((gram, len(ids), encode_postings(ids)) for gram, ids in postings.items()))
+        self.set_meta("trigram_covered_id", covered_id)
+
+    def merge_trigram_tail(self, limit=TRIGRAM_TAIL_LIMIT):
+        """
+        倒排表建立之后新增的文件超过 limit 个时，将它们并入倒排表，需在 writing() 中调用
+        已删除文件的编号留在倒排表中，搜索时与文件表核对后自然被排除
+        """
+        covered_id = self.get_meta("trigram_covered_id")
+        tail_size = self.connection.execute("SELECT count(*) FROM files WHERE id > ?", (covered_id,)).fetchone()[0]
+        if tail_size <= limit:
+            return
+        new_postings = {}
+        for file_id, file_name in self.connection.execute("SELECT id, name FROM files WHERE id > ? ORDER BY id",
+                                                          (covered_id,)):
+            for gram in trigrams(normalize(file_name)):
+                new_postings.setdefault(gram, array("I")).append(file_id)
+            covered_id = file_id
+        for gram, ids in new_postings.items():
+            row = self.connection.execute("SELECT postings FROM trigrams WHERE gram = ?", (gram,)).fetchone()
+            if row is not None:
+                # 新编号都大于已有编号，直接拼接仍然有序
+                ids = array("I", decode_postings(row[0])) + ids
+            self.connection.execute("INSERT OR REPLACE INTO trigrams VALUES (?, ?, ?)",
+                                    (gram, len(ids), encode_postings(ids)))
+        self.set_meta("trigram_covered_id", covered_id)
+
+    def candidate_ids(self, text):
+        """
+        通过倒排表求出名称可能包含 text 的文件编号，只包含倒排表已覆盖的文件
+        :return: 编号集合，text 不足三个字符时返回 None
+        """
+        grams = trigrams(normalize(text))
+        if not grams:
+            return None
+        grams = list(grams)
+        rows = []
+        for i in range(0, len(grams), 500):
+            chunk = grams[i:i + 500]
+            rows.extend(self.connection.execute(
+                f"SELECT count, postings FROM trigrams WHERE gram IN ({','.join('?' * len(chunk))})", chunk))
+        if len(rows) < len(grams):
+            return set()
+        # 从最短的倒排表开始求交集，候选已经很少时不再解压长倒排表，留给逐条核对
+        rows.sort()
+        candidates = set(decode_postings(rows[0][1]))
+        for count, blob in rows[1:]:
+            if not candidates or count > len(candidates) * 64:
+                break
+            candidates.intersection_update(decode_postings(blob))
+        return candidates
+
+    def literal_candidates(self, literal_groups):
+        """
+        组内各文本的候选求交集，各组之间求并集
+        :return: 编号集合，某一组没有可用于倒排表的文本时返回 None
+        """
+        candidates = set()
+        for literals in literal_groups:
+            group_candidates = None
+            for text, ignore_case in literals:
+                ids = self.candidate_ids(text)
+                if ids is not None:
+                    group_candidates = ids if group_candidates is None else group_candidates & ids
+            if group_candidates is None:
+                return None
+            candidates |= group_candidates
+        return candidates
+
+    def search(self, query, path, batch_size=1000, stats=None, token=None):
+        """
+        在索引中搜索 path 下符合 query 的文件
+        :param stats: 可选的 SearchStats，记录从 sqlite 取出并逐条校验的行数
+        :param token: 可选的 CancellationToken，取消后在下一批之前结束，正在执行的 sqlite 查询也会被中断
+        :return: 生成器，每次产出一批 (文件名, 所在目录, 大小, 创建时间, 修改时间)
+        """
+        if stats is None:
+            stats = NULL_STATS
+        connection = self.connection
+        if token is not None:
+            # 扫描整个表的查询可能很久才返回第一行，由 sqlite 定期检查是否已取消
+            connection.set_progress_handler(lambda: token.cancelled, PROGRESS_STEPS)
+        try:
+            yield from self.search_batches(query, path, batch_size, stats, token)
+        except sqlite3.OperationalError:
+            if token is None or not token.cancelled:
+                raise
+        finally:
+            if token is not None:
+                connection.set_progress_handler(None, PROGRESS_STEPS)
+
+    def search_batches(self, query, path, batch_size, stats, token):
+        path = os.path.abspath(path)
+        prefix = path if path.endswith(os.sep) else path + os.sep
+        select = "SELECT f.name, d.path, f.size, f.ctime, f.mtime FROM files f JOIN dirs d ON f.dir_id = d.id"
+        conditions = ["(d.path = ? OR substr(d.path, 1, ?) = ?)"]
+        params = [path, len(prefix), prefix]
+        # 查询中必须满足的扩展名、大小与时间条件直接交给 sqlite，文件名中必然出现的文本用倒排表求候选
+        if query.extensions is not None:
+            conditions.append(f"f.ext IN ({','.join('?' * len(query.extensions))})")
+            params.extend(sorted(query.extensions))
+        for column, low, high in query.bounds:
+            if low is not None:
+                conditions.append(f"f.{column} >= ?")
+                params.append(low)
+            if high is not None:
+                conditions.append(f"f.{column} < ?")
+                params.append(high)
+        for text, ignore_case in query.literals:
+            # 不足三个字符无法使用倒排表，区分大小写时仍可由 sqlite 粗筛
+            if len(text) < 3 and not ignore_case:
+                conditions.append("instr(f.name, ?) > 0")
+                params.append(text)
+        candidates = self.literal_candidates(query.literal_groups)
+        where = " AND ".join(conditions)
+
+        if candidates is not None:
+            # 倒排表覆盖的候选文件，加上倒排表建立后新增、尚未并入的文件
+            candidates = sorted(candidates)
+            cursors = []
+            for i in range(0, len(candidates), 500):
+                chunk = candidates[i:i + 500]
+                cursors.append((f"{select} WHERE f.id IN ({','.join('?' * len(chunk))}) AND {where}",
+                                chunk + params))
+            cursors.append((f"{select} WHERE f.id > ? AND {where}", [self.get_meta("trigram_covered_id")] + params))
+        else:
+            cursors = [(f"{select} WHERE {where}", params)]
+
+        batch = []
+        for sql, params in cursors:
+            cursor = self.connection.execute(sql, params)
+            while True:
+                if token is not None and token.cancelled:
+                    return
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                stats.count("index_rows", len(rows))
+                batch.extend(row for row in rows if query.match(row))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+
+class BuildCancelled(Exception):
+    pass
@@ -0,0 +1,36 @@
+import os
+from collections import OrderedDict
+
+from PyQt5 import QtCore, QtWidgets
+
+from query import file_extension
+
+# 这些文件的图标保存在文件自身中，不能按扩展名共用，改以完整路径缓存
+EMBEDDED_ICON_EXTENSIONS = {"exe", "dll", "ico", "icl", "lnk", "cur", "ani", "scr", "cpl", "msc", "appimage"}
+
+
+class IconCache(object):
+    """
+    文件图标缓存，整个程序共用一个 QFileIconProvider，按扩展名缓存 QIcon，超出 max_size 个时淘汰最久未用的
+    """
+
+    def __init__(self, max_size=512):
+        self.max_size = max_size
+        self.provider = QtWidgets.QFileIconProvider()
+        self.icons = OrderedDict()
+
+    def icon(self, file_path):
+        extension = file_extension(os.path.basename(file_path))
+        key = file_path if extension in EMBEDDED_ICON_EXTENSIONS else extension
+        icon = self.icons.get(key)
+        if icon is not None:
+            self.icons.move_to_end(key)
+            return icon
+        icon = self.provider.icon(QtCore.QFileInfo(file_path))
+        self.icons[key] = icon
+        if len(self.icons) > self.max_size:
+            self.icons.popitem(last=False)
+        return icon
+
+    def clear(self):
+        self.icons.clear()
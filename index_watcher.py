@@ -0,0 +1,272 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+from array import array
+
+# inotify 常量，见 <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK if hasattr(os, "O_NONBLOCK") else 0
+IN_CLOEXEC = 0o2000000
+
+# 只订阅目录结构变化及写入完成事件，不订阅 IN_MODIFY，避免大文件写入时产生大量事件
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE |
+              IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK)
+
+EVENT_HEADER = struct.Struct("iIII")
+READ_SIZE = 64 * 1024
+
+
+def load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+libc = load_libc()
+
+
+def is_supported():
+    return libc is not None
+
+
+class IndexWatcher(object):
+    """
+    通过 inotify 监视已建立索引的目录，将新建、删除、重命名及修改事件增量写入索引
+    事件队列溢出时，只重新扫描修改时间发生变化的目录，不做全盘重建
+    每个监视只在以监视描述符为下标的数组中保存一个目录编号，目录路径由索引查询，
+    因此数十万个监视目录也只占用很少内存，目录重命名时也无需更新监视表；
+    另有目录编号到监视描述符的字典，删除整棵目录时只查找被删除的目录，不扫描整个监视表
+    新建的目录在监视线程中逐个读取，不为每个事件启动一组遍历线程
+    """
+
+    def __init__(self, file_index):
+        self.file_index = file_index
+        self.fd = None
+        self.watch_dirs = array("i")        # 监视描述符 -> 目录编号，-1 表示空闲
+        self.dir_watches = {}               # 目录编号 -> 监视描述符
+        self.watch_count = 0
+        self.watch_limit_reached = False
+        self.pending_roots = []
+        self.pending_lock = threading.Lock()
+        self.wake_read, self.wake_write = None, None
+        self.thread = None
+        self.is_running = False
+
+    def start(self, roots=()):
+        if not is_supported() or self.is_running:
+            return False
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return False
+        self.fd = fd
+        self.wake_read, self.wake_write = os.pipe()
+        self.is_running = True
+        for root in roots:
+            self.watch_root(root)
+        self.thread = threading.Thread(target=self.run, name="IndexWatcher", daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        if not self.is_running:
+            return
+        self.is_running = False
+        os.write(self.wake_write, b"\0")
+        self.thread.join()
+        for fd in (self.fd, self.wake_read, self.wake_write):
+            os.close(fd)
+        self.watch_dirs = array("i")
+        self.dir_watches = {}
+        self.watch_count = 0
+
+    def watch_root(self, root):
+        """
+        请求监视 root 下所有已索引目录，实际的添加在监视线程中进行，可在任意线程调用
+        """
+        with self.pending_lock:
+            self.pending_roots.append(os.path.abspath(root))
+        if self.is_running:
+            os.write(self.wake_write, b"\0")
+
+    def run(self):
+        poller = select.poll()
+        poller.register(self.fd, select.POLLIN)
+        poller.register(self.wake_read, select.POLLIN)
+        while self.is_running:
+            self.add_pending_roots()
+            for fd, event in poller.poll():
+                if fd == self.wake_read:
+                    os.read(self.wake_read, 4096)
+                elif self.is_running:
+                    self.handle_events(self.read_events())
+
+    def add_pending_roots(self):
+        with self.pending_lock:
+            roots, self.pending_roots = self.pending_roots, []
+        for root in roots:
+            for dir_id, dir_path, dir_mtime in self.file_index.tree_dirs(root):
+                self.add_watch(dir_id, dir_path)
+
+    def add_watch(self, dir_id, dir_path):
+        if self.watch_limit_reached:
+            return
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(dir_path), WATCH_MASK)
+        if wd < 0:
+            # 超出 /proc/sys/fs/inotify/max_user_watches 后不再尝试，其余目录只能依赖重建索引
+            if ctypes.get_errno() == errno.ENOSPC:
+                self.watch_limit_reached = True
+            return
+        if wd >= len(self.watch_dirs):
+            self.watch_dirs.extend([-1] * (wd + 1 - len(self.watch_dirs)))
+        if self.watch_dirs[wd] == -1:
+            self.watch_count += 1
+        else:
+            # 同一目录再次添加监视时返回原来的描述符，目录编号可能已改变
+            self.dir_watches.pop(self.watch_dirs[wd], None)
+        self.watch_dirs[wd] = dir_id
+        self.dir_watches[dir_id] = wd
+
+    def remove_watches(self, dir_ids):
+        for dir_id in dir_ids:
+            wd = self.dir_watches.get(dir_id)
+            if wd is not None:
+                libc.inotify_rm_watch(self.fd, wd)
+                self.forget_watch(wd)
+
+    def forget_watch(self, wd):
+        if wd < len(self.watch_dirs) and self.watch_dirs[wd] != -1:
+            self.dir_watches.pop(self.watch_dirs[wd], None)
+            self.watch_dirs[wd] = -1
+            self.watch_count -= 1
+
+    def read_events(self):
+        """
+        一次读尽当前队列中的全部事件
+        :return: (监视描述符, 事件掩码, cookie, 文件名) 列表
+        """
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, READ_SIZE)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                events.append((wd, mask, cookie, os.fsdecode(name)))
+        return events
+
+    def handle_events(self, events):
+        """
+        在一个写事务中应用一批事件
+        重命名事件成对出现时更新路径，只有 IN_MOVED_FROM 时视为移出监视范围而删除
+        处理事件时文件可能已随所在目录一起被移走，这些目录在本批事件应用完后按最新路径重新扫描
+        """
+        new_dirs = []
+        removed_dirs = []
+        moved_from = {}
+        dirty_dirs = set()
+        with self.file_index.writing():
+            for wd, mask, cookie, name in events:
+                if mask & IN_Q_OVERFLOW:
+                    new_dirs.extend(self.rescan_changed_dirs())
+                    continue
+                if mask & IN_IGNORED:
+                    self.forget_watch(wd)
+                    continue
+                if wd >= len(self.watch_dirs) or self.watch_dirs[wd] == -1 or not name:
+                    continue
+                dir_path = self.file_index.get_dir_path(self.watch_dirs[wd])
+                if dir_path is None:
+                    continue
+                path = os.path.join(dir_path, name)
+                is_dir = mask & IN_ISDIR
+
+                if mask & IN_MOVED_FROM:
+                    moved_from[cookie] = (dir_path, name, is_dir)
+                elif mask & IN_MOVED_TO and cookie in moved_from:
+                    old_dir_path, old_name, old_is_dir = moved_from.pop(cookie)
+                    if is_dir:
+                        self.file_index.move_tree(os.path.join(old_dir_path, old_name), path)
+                    else:
+                        self.file_index.remove_file(old_dir_path, old_name)
+                        if not self.file_index.update_file(dir_path, name):
+                            dirty_dirs.add(self.watch_dirs[wd])
+                elif mask & (IN_CREATE | IN_MOVED_TO):
+                    if is_dir and self.file_index.is_excluded(path):
+                        continue
+                    if is_dir:
+                        # 监视建立之前目录中可能已有文件，整棵写入
+                        removed_dirs.extend(self.file_index.delete_tree(path))
+                        new_dirs.extend(self.file_index.add_tree(path, parallel=False))
+                    elif not self.file_index.update_file(dir_path, name):
+                        dirty_dirs.add(self.watch_dirs[wd])
+                elif mask & IN_DELETE:
+                    if is_dir:
+                        removed_dirs.extend(self.file_index.delete_tree(path))
+                    else:
+                        self.file_index.remove_file(dir_path, name)
+                elif mask & (IN_CLOSE_WRITE | IN_ATTRIB) and not is_dir:
+                    if not self.file_index.update_file(dir_path, name):
+                        dirty_dirs.add(self.watch_dirs[wd])
+
+            for old_dir_path, old_name, old_is_dir in moved_from.values():
+                if old_is_dir:
+                    removed_dirs.extend(self.file_index.delete_tree(os.path.join(old_dir_path, old_name)))
+                else:
+                    self.file_index.remove_file(old_dir_path, old_name)
+
+            for dir_id in dirty_dirs:
+                dir_path = self.file_index.get_dir_path(dir_id)
+                if dir_path is not None:
+                    new_dirs.extend(self.file_index.rescan_dir(dir_path))
+
+            self.file_index.merge_trigram_tail()
+
+        self.remove_watches(removed_dirs)
+        for dir_id, dir_path in new_dirs:
+            self.add_watch(dir_id, dir_path)
+
+    def rescan_changed_dirs(self):
+        """
+        事件队列溢出后调用，只重新扫描修改时间与索引记录不同的目录，需在 writing() 中调用
+        :return: 新写入的 (目录编号, 目录路径) 列表
+        """
+        new_dirs = []
+        for root in self.file_index.roots():
+            for dir_id, dir_path, dir_mtime in self.file_index.tree_dirs(root):
+                try:
+                    current_mtime = int(os.stat(dir_path).st_mtime)
+                except OSError:
+                    current_mtime = None
+                if current_mtime != dir_mtime:
+                    new_dirs.extend(self.file_index.rescan_dir(dir_path))
+        return new_dirs
@@ -0,0 +1,127 @@
+import json
+import threading
+import time
+from contextlib import nullcontext
+
+
+class SearchStats(object):
+    """
+    一次搜索的计数器、计时器与最大值，可被多个线程同时更新
+    各处按目录或按批更新，而不是按文件更新，开启时的开销也很小
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start_time = time.perf_counter()
+        self.end_time = None
+        self.counters = {}
+        self.timers = {}
+        self.maximums = {}
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def maximum(self, name, value):
+        with self.lock:
+            if value > self.maximums.get(name, 0):
+                self.maximums[name] = value
+
+    def add_time(self, name, seconds):
+        with self.lock:
+            self.timers[name] = self.timers.get(name, 0) + seconds
+
+    def timer(self, name):
+        """
+        :return: 上下文管理器，把其中代码的耗时累加到 name，多个线程的耗时会相加
+        """
+        return Timer(self, name)
+
+    def finish(self):
+        self.end_time = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        end_time = self.end_time if self.end_time is not None else time.perf_counter()
+        return end_time - self.start_time
+
+    def rate(self, name):
+        elapsed = self.elapsed
+        return self.counters.get(name, 0) / elapsed if elapsed > 0 else 0
+
+    def snapshot(self):
+        with self.lock:
+            counters = dict(self.counters)
+            timers = dict(self.timers)
+            maximums = dict(self.maximums)
+        return {
+            "elapsed": self.elapsed,
+            "counters": counters,
+            "timers": timers,
+            "maximums": maximums,
+            "rates": {f"{name}_per_second": self.rate(name) for name in ("dirs", "entries", "matches")},
+        }
+
+    def summary(self):
+        """
+        状态栏中显示的简要信息
+        """
+        counters = self.counters
+        ui_batches = counters.get("ui_batches", 0)
+        rows_per_tick = counters.get("ui_rows", 0) / ui_batches if ui_batches else 0
+        return (f"目录 {self.rate('dirs'):.0f}/秒  条目 {self.rate('entries'):.0f}/秒  "
+                f"stat {counters.get('stat_calls', 0)}次  匹配 {self.rate('matches'):.0f}/秒  "
+                f"插入 {rows_per_tick:.0f}行/批  队列 {self.maximums.get('queue_depth', 0)}")
+
+    def dump(self, file_path, **info):
+        """
+        以 JSON Lines 格式把本次统计追加到 file_path
+        :param info: 一并记录的其它信息，如关键字与搜索路径
+        """
+        record = dict(info)
+        record.update(self.snapshot())
+        with open(file_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False))
+            f.write("\n")
+
+
+class Timer(object):
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stats.add_time(self.name, time.perf_counter() - self.start)
+
+
+class NullStats(object):
+    """
+    关闭统计时使用，所有方法什么都不做
+    """
+
+    enabled = False
+
+    def count(self, name, n=1):
+        pass
+
+    def maximum(self, name, value):
+        pass
+
+    def add_time(self, name, seconds):
+        pass
+
+    def timer(self, name):
+        return NULL_TIMER
+
+    def finish(self):
+        pass
+
+
+NULL_TIMER = nullcontext()
+NULL_STATS = NullStats()
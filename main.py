@@ -1,15 +1,27 @@
 import sys
 import os
 from PyQt5 import QtGui, QtWidgets, Qt, QtCore
-from PyQt5.QtWidgets import QTableWidget, QTableWidgetItem, QMessageBox, QComboBox, QSizePolicy, QSplitter, \
+from PyQt5.QtWidgets import QTableView, QMessageBox, QComboBox, QSizePolicy, QSplitter, \
     QAbstractItemView, QAction, QLineEdit
-import time
 import pickle
 import ctypes
 import resource
 import subprocess
 from functools import partial
 from preview_area import PreviewArea
+from result_model import ResultModel
+from result_batcher import ResultBatcher
+from exclusion import ExclusionRules
+from preview_cache import PreviewCacheSettings
+from preview_scheduler import PREFETCH_DELAY, PREFETCH_ROWS
+from file_index import FileIndex
+from instrumentation import SearchStats
+from index_watcher import IndexWatcher, is_supported as is_watch_supported
+from query import Query, QueryError
+from search_engine import SearchJob
+from time_format import STYLE_NAMES, FULL
+from traversal import CancellationToken, DEFAULT_WORKERS, unique_roots
+from app_data import get_app_dir_path
 
 
 class MainWindow(QtWidgets.QMainWindow):
@@ -25,7 +37,11 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.choose_search_dir_button = QtWidgets.QPushButton("选择路径")
         self.choose_search_dir_button.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Fixed)
-        self.choose_search_dir_button.clicked.connect(self.choose_search_dir)
+        # 可以只搜索一个路径，也可以添加多个路径一起搜索
+        choose_dir_menu = QtWidgets.QMenu(self)
+        choose_dir_menu.addAction("选择路径", self.choose_search_dir)
+        choose_dir_menu.addAction("添加路径", self.add_search_dir)
+        self.choose_search_dir_button.setMenu(choose_dir_menu)
 
         self.stop_button = QtWidgets.QPushButton("停止搜索")
         self.stop_button.clicked.connect(self.stop_search)
@@ -39,6 +55,13 @@ class MainWindow(QtWidgets.QMainWindow):
         self.combobox.setCompleter(None)
         self.combobox.activated.connect(self.choose_history)
 
+        # 边输入边搜索：停止输入一段时间后才开始搜索
+        self.live_search_timer = QtCore.QTimer()
+        self.live_search_timer.setSingleShot(True)
+        self.live_search_timer.setInterval(300)
+        self.live_search_timer.timeout.connect(partial(self.start_search, True))
+        self.search_frame.textChanged.connect(self.search_text_changed)
+
         view = QtWidgets.QListView(self.combobox)
         view.setMinimumHeight(420)
 
@@ -51,10 +74,14 @@ class MainWindow(QtWidgets.QMainWindow):
 
         # 初始化table_widget
         self.table_widget = ShowResultsTable(mainWindow=self)
-        self.table_widget.setColumnCount(4)
-        self.table_widget.setHorizontalHeaderLabels(["文件名", "路径", '创建时间', "修改时间"])
         self.table_widget.doubleClicked.connect(self.table_widget.open_click_file)
-        self.table_widget.cellClicked.connect(self.preview_table_cell)
+        self.table_widget.clicked.connect(self.preview_table_cell)
+        self.table_widget.selectionModel().currentRowChanged.connect(self.current_row_changed)
+        # 选中行停留一段时间后才在后台预先准备相邻行的预览，快速移动时不预取
+        self.prefetch_timer = QtCore.QTimer(self)
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.setInterval(PREFETCH_DELAY)
+        self.prefetch_timer.timeout.connect(self.prefetch_neighbours)
         # 右键菜单策略
         # self.table_widget.setContextMenuPolicy(QtCore.Qt.ContextMenuPolicy.DefaultContextMenu)
         # 下面的方法对于调整大小很重要
@@ -75,16 +102,36 @@ class MainWindow(QtWidgets.QMainWindow):
         vbox_layout.addWidget(self.splitter)
 
         self.history = History(self.combobox)
+        self.result_limit = ResultLimit()
+        self.preview_cache_settings = PreviewCacheSettings.load()
+        self.preview_cache_settings.apply(self.preview_area.cache)
+
+        self.exclusions = ExclusionRules.load()
+        self.file_index = FileIndex(exclusions=self.exclusions)
+        self.index_build_thread = None
+        self.index_watcher = IndexWatcher(self.file_index)
+
+        # update_statusbar 会读取搜索状态，须在第一次调用前设置
+        self.file_search_thread = None
+        # 所有搜索共用一个线程池；每次新建时旧线程池析构会在界面线程中等待旧搜索结束
+        self.threadpool = QtCore.QThreadPool(self)
+        # 上次搜索的关键字、路径以及是否完整结束，新关键字是其细化时直接筛选已有结果
+        self.last_query = None
+        self.last_search_paths = None
+        self.last_search_complete = False
 
         self.createMenu()
 
         self.statusLabel = QtWidgets.QLabel()
         self.statusBar().addPermanentWidget(self.statusLabel, stretch=1)
+        self.perf_label = QtWidgets.QLabel()
+        self.statusBar().addPermanentWidget(self.perf_label)
+        self.perf_label.hide()
 
         widget = QtWidgets.QWidget()
         widget.setLayout(vbox_layout)
 
-        self.search_path = "/"
+        self.search_paths = ["/"]
 
         self.update_statusbar()
 
@@ -92,12 +139,6 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.about_window = AboutWindow()
 
-        self.file_search_thread = None
-        self.is_reading_results = False
-        self.update_timer = Qt.QTimer()
-        self.update_timer.setInterval(1500)
-        self.update_timer.timeout.connect(self.update_table)
-
     def createMenu(self):
         menu = self.menuBar()
 
@@ -114,6 +155,66 @@ class MainWindow(QtWidgets.QMainWindow):
         history_limit = HistoryLimitAction(self)
         setting_menu = menu.addMenu("设置")
         setting_menu.addAction(history_limit)
+        setting_menu.addAction(ResultLimitAction(self))
+        setting_menu.addAction(PreviewCacheAction(self))
+
+        # 把解码后的图片保存在程序数据目录中，重新打开程序后预览同一文件也不必再解码
+        self.preview_disk_cache_action = QAction("预览磁盘缓存", self)
+        self.preview_disk_cache_action.setCheckable(True)
+        self.preview_disk_cache_action.setChecked(self.preview_cache_settings.disk_enabled)
+        self.preview_disk_cache_action.triggered.connect(self.switching_preview_disk_cache)
+        setting_menu.addAction(self.preview_disk_cache_action)
+
+        # 开启后不按找到的顺序显示，而是只显示相关度最高的若干条
+        self.ranked_action = QAction("按相关度显示前若干条结果", self)
+        self.ranked_action.setCheckable(True)
+        setting_menu.addAction(self.ranked_action)
+
+        self.live_search_action = QAction("边输入边搜索", self)
+        self.live_search_action.setCheckable(True)
+        setting_menu.addAction(self.live_search_action)
+
+        self.ignore_case_action = QAction("忽略大小写", self)
+        self.ignore_case_action.setCheckable(True)
+        setting_menu.addAction(self.ignore_case_action)
+
+        # 时间列的显示格式，保存在程序数据目录中
+        time_style = self.read_time_style()
+        self.table_widget.result_model.set_time_style(time_style)
+        time_format_menu = setting_menu.addMenu("时间格式")
+        time_format_group = QtWidgets.QActionGroup(self)
+        for style, style_name in STYLE_NAMES.items():
+            time_format_action = QAction(style_name, time_format_group)
+            time_format_action.setCheckable(True)
+            time_format_action.setChecked(style == time_style)
+            time_format_action.triggered.connect(partial(self.save_time_style, style))
+            time_format_menu.addAction(time_format_action)
+
+        # 在状态栏显示各阶段的速度，并把每次搜索的统计追加到程序数据目录中的 search_stats.jsonl
+        self.perf_stats_action = QAction("性能统计", self)
+        self.perf_stats_action.setCheckable(True)
+        setting_menu.addAction(self.perf_stats_action)
+
+        # 索引模式下直接查询磁盘索引，搜索路径未建立索引或关闭此项时退回遍历磁盘
+        self.use_index_action = QAction("使用索引搜索", self)
+        self.use_index_action.setCheckable(True)
+        self.use_index_action.setChecked(True)
+        build_index_action = QAction("为当前路径建立索引", self)
+        build_index_action.triggered.connect(self.build_index)
+        exclusion_action = QAction("排除规则...", self)
+        exclusion_action.triggered.connect(self.edit_exclusions)
+        setting_menu.addSeparator()
+        setting_menu.addAction(exclusion_action)
+        setting_menu.addAction(self.use_index_action)
+        setting_menu.addAction(build_index_action)
+
+        # 通过 inotify 实时更新索引，仅 Linux 可用
+        self.watch_index_action = QAction("实时更新索引", self)
+        self.watch_index_action.setCheckable(True)
+        self.watch_index_action.setEnabled(is_watch_supported())
+        self.watch_index_action.toggled.connect(self.switching_index_watcher)
+        setting_menu.addAction(self.watch_index_action)
+        self.watch_index_action.setChecked(is_watch_supported())
 
         about_action = QAction("关于", self)
         about_action.setIcon(self.style().standardIcon(Qt.QStyle.SP_MessageBoxInformation))
@@ -122,62 +223,160 @@ class MainWindow(QtWidgets.QMainWindow):
         about_menu = menu.addMenu('关于')
         about_menu.addAction(about_action)
 
-    def start_search(self):
-        file_name = self.search_frame.text()
-        if file_name == "":
-            self.update_timer.setInterval(5)          # 在搜索结果数量非常庞大时，应快速更新，否则界面十分卡顿
+    def search_text_changed(self, text):
+        if not self.live_search_action.isChecked():
+            return
+        # 关键字一变化就取消正在进行的搜索
+        if self.file_search_thread is not None:
+            self.file_search_thread.cancel()
+        # 清空关键字时不自动列出全部文件，需要时仍可按回车
+        if text == "":
+            self.live_search_timer.stop()
         else:
+            self.live_search_timer.start()
+
+    def start_search(self, live=False):
+        self.live_search_timer.stop()
+        file_name = self.search_frame.text()
+        if file_name != "" and not live:
             self.history.save_history(self.search_frame.text())
-        self.choose_search_dir_button.hide()
-        self.stop_button.show()
 
-        self.threadpool = QtCore.QThreadPool()
-        self.file_search_thread = FileSearchThread(file_name, self.search_path)
-        self.threadpool.start(self.file_search_thread)
-        self.file_search_thread.signals.finished.connect(self.stop_search)
+        if self.file_search_thread is not None:
+            self.file_search_thread.cancel()
 
-        self.table_widget.clearContents()
-        self.table_widget.setRowCount(0)
+        try:
+            query = Query(file_name, self.ignore_case_action.isChecked(), self.preview_area.support_formats)
+        except QueryError as e:
+            # 边输入边搜索时关键字常常尚未输完，不弹窗打扰
+            if live:
+                self.statusBar().showMessage(str(e), 3000)
+            else:
+                QMessageBox.warning(self, "搜索语法有误", str(e))
+            return
+        if (self.last_search_complete and self.last_search_paths == self.search_paths
+                and query.text != self.last_query.text):
+            refine_filter = query.refine_filter(self.last_query)
+            if refine_filter is not None:
+                self.table_widget.result_model.filter_rows(refine_filter)
+                self.last_query = query
+                self.update_statusbar()
+                return
+        self.last_query = query
+        self.last_search_paths = list(self.search_paths)
+        self.last_search_complete = False
 
-        self.update_timer.start()
+        self.choose_search_dir_button.hide()
+        self.stop_button.show()
+        self.table_widget.result_model.clear()
+
+        file_index = self.file_index if self.use_index_action.isChecked() else None
+        stats = SearchStats() if self.perf_stats_action.isChecked() else None
+        self.file_search_thread = FileSearchThread(query, self.search_paths, file_index,
+                                                   max_results=self.result_limit.limit,
+                                                   ranked=self.ranked_action.isChecked(), stats=stats,
+                                                   exclusions=self.exclusions)
+        self.table_widget.result_model.stats = self.file_search_thread.stats
+        # 旧搜索线程的信号可能在新搜索开始后才到达，槽函数据此区分
+        self.file_search_thread.signals.results.connect(partial(self.update_table, self.file_search_thread))
+        self.file_search_thread.signals.finished.connect(partial(self.search_finished, self.file_search_thread))
+        self.threadpool.start(self.file_search_thread)
 
     def stop_search(self):
-        self.update_timer.stop()
-        self.file_search_thread.is_running = False
-        self.update_table()
+        self.file_search_thread.cancel()
         self.stop_button.hide()
         self.choose_search_dir_button.show()
 
-    def update_table(self):
-        if self.is_reading_results:
-            return
-        else:
-            self.is_reading_results = True
-        current_resultCount = self.table_widget.rowCount()
-        self.table_widget.setRowCount(len(self.file_search_thread.result) + current_resultCount)
-        for info_list in self.file_search_thread.result:
-            for j, info in enumerate(info_list):
-                table_cell = QTableWidgetItem(info)
-                table_cell.setToolTip(info)
-                if j == 0:
-                    file_icon = QtWidgets.QFileIconProvider().icon(QtCore.QFileInfo(info_list[1]))
-                    table_cell.setIcon(file_icon)
-                self.table_widget.setItem(current_resultCount, j, table_cell)
-
-            current_resultCount = current_resultCount + 1
-
-        self.file_search_thread.result = []
-        self.is_reading_results = False
+    def search_finished(self, search_thread):
+        if search_thread.stats.enabled:
+            search_thread.stats.dump(os.path.join(get_app_dir_path(), "search_stats.jsonl"),
+                                     query=search_thread.job.query.text, paths=search_thread.job.paths,
+                                     completed=search_thread.completed)
+        if search_thread is self.file_search_thread:
+            self.last_search_complete = search_thread.completed
+            self.stop_button.hide()
+            self.choose_search_dir_button.show()
+            self.update_statusbar()
+            # 搜索进行中时不预取，结束后为当前行补上
+            self.prefetch_timer.start()
+
+    def update_table(self, search_thread, rows):
+        """
+        接收搜索线程交付的一批结果，已被新搜索取代的结果直接丢弃
+        """
+        if search_thread is self.file_search_thread:
+            stats = search_thread.stats
+            with stats.timer("ui_insert"):
+                self.table_widget.result_model.append_rows(rows)
+            stats.count("ui_batches")
+            stats.count("ui_rows", len(rows))
+        search_thread.batcher.batch_done()
 
         self.update_statusbar()
         self.table_widget.horizontalHeader().resizeSections(QtWidgets.QHeaderView.Stretch)
 
+    def build_index(self):
+        if self.index_build_thread is not None and self.index_build_thread.is_running:
+            return
+        self.index_build_thread = IndexBuildThread(self.file_index, unique_roots(self.search_paths))
+        self.index_build_thread.signals.finished.connect(self.index_build_finished)
+        QtCore.QThreadPool.globalInstance().start(self.index_build_thread)
+        self.update_statusbar()
+
+    def index_build_finished(self):
+        for root in self.index_build_thread.roots:
+            if self.index_watcher.is_running and self.file_index.covers(root):
+                self.index_watcher.watch_root(root)
+        self.update_statusbar()
+
+    def edit_exclusions(self):
+        dialog = ExclusionDialog(self.exclusions, self)
+        if dialog.exec_() == QtWidgets.QDialog.Accepted:
+            self.exclusions.update(dialog.rules())
+            self.exclusions.save()
+            if self.file_index.roots():
+                self.statusBar().showMessage("排除规则已保存，重新建立索引后对已索引的路径生效", 5000)
+
+    def read_time_style(self):
+        try:
+            with open(os.path.join(get_app_dir_path(), "time_format.ini"), "r") as f:
+                style = f.read().strip()
+        except OSError:
+            return FULL
+        return style if style in STYLE_NAMES else FULL
+
+    def save_time_style(self, style, checked=True):
+        with open(os.path.join(get_app_dir_path(), "time_format.ini"), "w") as f:
+            f.write(style)
+        self.table_widget.result_model.set_time_style(style)
+
+    def save_preview_cache_memory(self, memory_mb):
+        self.preview_cache_settings.memory_mb = memory_mb
+        self.preview_cache_settings.save()
+        self.preview_cache_settings.apply(self.preview_area.cache)
+
+    def switching_preview_disk_cache(self, checked):
+        self.preview_cache_settings.disk_enabled = checked
+        self.preview_cache_settings.save()
+        self.preview_cache_settings.apply(self.preview_area.cache)
+
+    def switching_index_watcher(self, checked):
+        if checked:
+            self.index_watcher.start(self.file_index.roots())
+        else:
+            self.index_watcher.stop()
+
     def choose_search_dir(self):
         dir_choose = QtWidgets.QFileDialog.getExistingDirectory(self, "选取搜索文件夹")
         if dir_choose != "":
-            self.search_path = dir_choose
+            self.search_paths = [dir_choose]
         else:
-            self.search_path = "/"
+            self.search_paths = ["/"]
+        self.update_statusbar()
+
+    def add_search_dir(self):
+        dir_choose = QtWidgets.QFileDialog.getExistingDirectory(self, "添加搜索文件夹")
+        if dir_choose != "" and dir_choose not in self.search_paths:
+            self.search_paths.append(dir_choose)
         self.update_statusbar()
 
     def choose_history(self, event):
@@ -186,13 +385,17 @@ class MainWindow(QtWidgets.QMainWindow):
 
     def closeEvent(self, event):
         event.accept()
+        self.preview_area.scheduler.cancel()
         if self.preview_area.video_player is not None:
             self.preview_area.video_player.close()
         if self.preview_area.audio_player is not None:
             self.preview_area.audio_player.close()
         if self.file_search_thread is not None:
-            if self.file_search_thread.is_running:
-                self.file_search_thread.is_running = False
+            self.file_search_thread.cancel()
+            self.file_search_thread.batcher.close()
+        if self.index_build_thread is not None:
+            self.index_build_thread.token.cancel()
+        self.index_watcher.stop()
         if self.about_window is not None:
             self.about_window.close()
 
@@ -200,10 +403,51 @@ class MainWindow(QtWidgets.QMainWindow):
         if event.key() == QtCore.Qt.Key_Return or event.key() == QtCore.Qt.Key_Enter:
             self.start_search()
 
-    def preview_table_cell(self, row, col):
+    def current_row_changed(self, current, previous):
+        """
+        用方向键移动时，预览区域已显示的情况下预览文本与图片，音频与视频仍需点击文件名
+        """
+        if not current.isValid():
+            return
+        if self.preview_visible():
+            kind = self.preview_area.preview_kind(self.table_widget.result_model.file_name(current.row()))
+            if kind == "text":
+                self.preview_area.show_text(self.table_widget.result_model.file_path(current.row()))
+            elif kind == "image":
+                self.preview_area.show_image(self.table_widget.result_model.file_path(current.row()))
+        self.prefetch_timer.start()
+
+    def preview_visible(self):
+        return not self.preview_area.isHidden() and self.splitter.sizes()[1] != 0
+
+    def prefetch_neighbours(self):
+        """
+        在后台依次准备当前行前后各 PREFETCH_ROWS 行的预览，近的先准备；搜索进行中时不预取，以免与搜索争抢磁盘
+        """
+        if not self.preview_visible():
+            return
+        if self.file_search_thread is not None and self.file_search_thread.is_running:
+            return
+        result_model = self.table_widget.result_model
+        row = self.table_widget.currentIndex().row()
+        if row < 0:
+            return
+        items = []
+        for distance in range(1, PREFETCH_ROWS + 1):
+            for neighbour in (row + distance, row - distance):
+                if 0 <= neighbour < result_model.rowCount():
+                    kind = self.preview_area.preview_kind(result_model.file_name(neighbour))
+                    if kind is not None:
+                        items.append((kind, result_model.file_path(neighbour)))
+        self.preview_area.scheduler.prefetch(items)
+
+    def preview_table_cell(self, index):
+        row = index.row()
+        col = index.column()
+        result_model = self.table_widget.result_model
         if col == 0:
             try:
-                file_name = self.table_widget.item(row, col).text()
+                file_name = result_model.file_name(row)
             except Exception:
                 pass
             else:
@@ -211,21 +455,39 @@ class MainWindow(QtWidgets.QMainWindow):
                 if file_name_extension in self.preview_area.support_formats["text"]:
                     if not self.preview_area.isHidden() and self.splitter.sizes()[1] == 0:
                         self.splitter.setSizes([1, 1])
-                    self.preview_area.show_text(self.table_widget.item(row, 1).text())
+                    self.preview_area.show_text(result_model.file_path(row))
                 elif file_name_extension in self.preview_area.support_formats["image"]:
                     if not self.preview_area.isHidden() and self.splitter.sizes()[1] == 0:
                         self.splitter.setSizes([1, 1])
-                    self.preview_area.show_image(self.table_widget.item(row, 1).text())
+                    self.preview_area.show_image(result_model.file_path(row))
                 elif file_name_extension in self.preview_area.support_formats["audio"]:
-                    self.preview_area.play_audio(self.table_widget.item(row, 1).text(), True)
+                    self.preview_area.play_audio(result_model.file_path(row), True)
                 elif file_name_extension in self.preview_area.support_formats["video"]:
-                    self.preview_area.open_video(self.table_widget.item(row, 1).text())
+                    self.preview_area.open_video(result_model.file_path(row))
 
     def update_statusbar(self):
         """
         更新状态栏以显示最新信息数量及搜索路径
         """
-        self.statusLabel.setText(f"{self.table_widget.rowCount()}个对象       {self.search_path}")
+        if self.index_build_thread is not None and self.index_build_thread.is_running:
+            index_state = "正在建立索引"
+        elif all(self.file_index.covers(path) for path in self.search_paths):
+            index_state = "已索引"
+        elif any(self.file_index.covers(path) for path in self.search_paths):
+            index_state = "部分已索引"
+        else:
+            index_state = "未索引"
+        if self.file_search_thread is not None and self.file_search_thread.limit_reached:
+            limit_state = f"（已达到{self.file_search_thread.max_results}个结果上限）"
+        else:
+            limit_state = ""
+        self.statusLabel.setText(f"{self.table_widget.result_model.rowCount()}个对象{limit_state}       "
+                                 f"{'；'.join(self.search_paths)}       {index_state}")
+        if self.file_search_thread is not None and self.file_search_thread.stats.enabled:
+            self.perf_label.setText(self.file_search_thread.stats.summary())
+            self.perf_label.show()
+        else:
+            self.perf_label.hide()
 
     def switching_display_state(self, event, widget):
         if widget is not None:
@@ -238,19 +500,25 @@ class MainWindow(QtWidgets.QMainWindow):
         self.about_window.show()
 
 
-class ShowResultsTable(QTableWidget):
+class ShowResultsTable(QTableView):
     def __init__(self, mainWindow):
         super(ShowResultsTable, self).__init__()
 
         self.mainWindow = mainWindow
+        self.result_model = ResultModel(self)
+        self.setModel(self.result_model)
         self.setShowGrid(False)
         self.verticalHeader().setVisible(False)
+        # 固定行高，行数很多时视图无需逐行计算高度
+        self.verticalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Fixed)
         self.horizontalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Interactive)
         self.horizontalHeader().setStretchLastSection(True)
         self.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
         self.setSelectionMode(QAbstractItemView.NoSelection)
         self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
 
+        # 点击表头前按结果到达的顺序显示
+        self.horizontalHeader().setSortIndicator(-1, QtCore.Qt.AscendingOrder)
         self.setSortingEnabled(True)
 
     def open_click_file(self, index):
@@ -258,7 +526,7 @@ class ShowResultsTable(QTableWidget):
         col = index.column()
         if col == 0:
             try:
-                file_path = self.item(row, 1).text()
+                file_path = self.result_model.file_path(row)
                 os.startfile(file_path)
             except Exception:
                 pass
@@ -266,7 +534,7 @@ class ShowResultsTable(QTableWidget):
     def open_folder(self, index):
         row = index.row()
         try:
-            file_path = self.item(row, 1).text()
+            file_path = self.result_model.file_path(row)
             cmd = 'explorer.exe /select, "{}", vbNormalFocus'.format(file_path)
             si = subprocess.STARTUPINFO()
             si.wShowWindow = subprocess.SW_HIDE
@@ -309,66 +577,87 @@ class ShowResultsTable(QTableWidget):
         row = index.row()
         if col == 0:
             try:
-                file_name = self.item(row, col).text()
+                file_name = self.result_model.file_name(row)
             except Exception:
                 pass
             else:
                 file_name_extension = file_name.split(".")[-1]
                 if file_name_extension in main_window.preview_area.support_formats["audio"]:
-                    main_window.preview_area.play_audio(self.item(row, 1).text(), is_play_now)
+                    main_window.preview_area.play_audio(self.result_model.file_path(row), is_play_now)
                 elif file_name_extension in main_window.preview_area.support_formats["video"]:
-                    main_window.preview_area.open_video(self.item(row, 1).text())
+                    main_window.preview_area.open_video(self.result_model.file_path(row))
 
 
 class FileSearchThread(QtCore.QRunnable):
-    def __init__(self, file_name, search_path):
+    """
+    在线程池中执行 SearchJob，结果经 ResultBatcher 攒批后交给界面
+    """
+
+    def __init__(self, query, search_paths, file_index=None, workers=DEFAULT_WORKERS, max_results=0, ranked=False,
+                 stats=None, exclusions=None):
         super(FileSearchThread, self).__init__()
-        self.file_name = file_name
-        self.search_path = search_path
-        self.result = None
-        self.is_running = True
+        self.job = SearchJob(query, search_paths, file_index, workers, max_results, ranked, stats=stats,
+                             exclusions=exclusions)
+        self.stats = self.job.stats
         self.signals = Signals()
+        self.batcher = ResultBatcher(self.signals.results.emit, stats=self.stats, token=self.job.token)
+        # run 返回前才置为 True，取消后线程仍可能在交付剩余结果
+        self.finished = False
+
+    @property
+    def is_running(self):
+        return not self.finished
+
+    @property
+    def completed(self):
+        return self.job.completed
+
+    @property
+    def limit_reached(self):
+        return self.job.limit_reached
+
+    @property
+    def max_results(self):
+        return self.job.max_results
+
+    def cancel(self):
+        self.job.cancel()
 
     @QtCore.pyqtSlot()
     def run(self):
-        self.result = []
-        self.search_file(self.file_name, self.search_path)
+        for rows in self.job.batches():
+            self.batcher.add(rows)
+        self.batcher.flush()
+        self.finished = True
         self.signals.finished.emit()
 
-    def search_file(self, name, path):
-        if path is None:
-            path = "/"
-        if len(name) > 1 and name[0] == ".":
-            format_search = True
-            name = name[1:]
-        else:
-            format_search = False
-        for root, folder, files in os.walk(path):
-            for file_name in files:
-                if not self.is_running:
-                    break
-                if not format_search and name not in file_name:
-                    continue
-                elif format_search and name != file_name.split(".")[-1]:
-                    continue
-                else:
-                    file_path = os.path.abspath(os.path.join(root, file_name))
-
-                    stat_info = os.stat(file_path)
 
-                    # 时间戳转换
-                    create_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(stat_info.st_ctime))
-                    modif_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(stat_info.st_mtime))
+class IndexBuildThread(QtCore.QRunnable):
+    def __init__(self, file_index, roots):
+        super(IndexBuildThread, self).__init__()
+        self.file_index = file_index
+        self.roots = roots
+        self.is_running = True
+        self.token = CancellationToken()
+        self.signals = Signals()
 
-                    self.result.append([file_name, file_path, create_time, modif_time])  # 保存路径与盘符
+    @QtCore.pyqtSlot()
+    def run(self):
+        try:
+            for root in self.roots:
+                if self.token.cancelled:
+                    break
+                self.file_index.build(root, self.token)
+        finally:
+            self.is_running = False
+            self.signals.finished.emit()
 
 
 class History(object):
     def __init__(self, combobox):
         self.history_number = None
 
-        appdata_path = os.getenv("APPDATA")
-        self.app_dir_path = os.path.join(appdata_path, "file_search")
+        self.app_dir_path = get_app_dir_path()
         self.history_file_path = os.path.join(self.app_dir_path, "history.pickle")
         self.limit_setting_path = os.path.join(self.app_dir_path, "history_limit.ini")
 
@@ -432,8 +721,35 @@ class History(object):
                 return 20
 
 
+class ResultLimit(object):
+    """
+    单次搜索最多显示的结果数，保存在程序数据目录中，0 表示不限制
+    """
+
+    default_limit = 100000
+
+    def __init__(self):
+        self.setting_path = os.path.join(get_app_dir_path(), "result_limit.ini")
+        self.limit = self.read_limit()
+
+    def save_limit(self, limit):
+        with open(self.setting_path, "w") as f:
+            f.write(str(limit))
+        self.limit = limit
+
+    def read_limit(self):
+        if os.path.isfile(self.setting_path):
+            with open(self.setting_path, "r") as f:
+                content = f.read().strip()
+            if content.isdigit():
+                return int(content)
+        self.save_limit(self.default_limit)
+        return self.default_limit
+
+
 class Signals(QtCore.QObject):
     finished = QtCore.pyqtSignal()
+    results = QtCore.pyqtSignal(list)
 
 
 class ViewAction(QAction):
@@ -487,9 +803,89 @@ class HistoryLimitAction(QtWidgets.QWidgetAction):
         self.setDefaultWidget(self.widget)
 
 
+class ExclusionDialog(QtWidgets.QDialog):
+    def __init__(self, exclusions, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("排除规则")
+        self.resize(480, 420)
+
+        self.dir_names_edit = QtWidgets.QPlainTextEdit("\n".join(exclusions.dir_names))
+        self.path_globs_edit = QtWidgets.QPlainTextEdit("\n".join(exclusions.path_globs))
+        self.path_globs_edit.setPlaceholderText("例如：/home/*/.cache\n*/build/*.o")
+        self.one_filesystem_box = QtWidgets.QCheckBox("只搜索搜索路径所在的文件系统")
+        self.one_filesystem_box.setChecked(exclusions.one_filesystem)
+        self.skip_pseudo_box = QtWidgets.QCheckBox("跳过 /proc、/sys 等虚拟文件系统")
+        self.skip_pseudo_box.setChecked(exclusions.skip_pseudo)
+        self.skip_network_box = QtWidgets.QCheckBox("跳过网络文件系统")
+        self.skip_network_box.setChecked(exclusions.skip_network)
+        buttons = QtWidgets.QDialogButtonBox(QtWidgets.QDialogButtonBox.Ok | QtWidgets.QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+
+        layout = QtWidgets.QVBoxLayout()
+        layout.addWidget(QtWidgets.QLabel("按名称排除的目录（每行一个）"))
+        layout.addWidget(self.dir_names_edit)
+        layout.addWidget(QtWidgets.QLabel("排除的路径通配符（与完整路径匹配，每行一个）"))
+        layout.addWidget(self.path_globs_edit)
+        layout.addWidget(self.one_filesystem_box)
+        layout.addWidget(self.skip_pseudo_box)
+        layout.addWidget(self.skip_network_box)
+        layout.addWidget(buttons)
+        self.setLayout(layout)
+
+    @staticmethod
+    def lines(edit):
+        return [line.strip() for line in edit.toPlainText().splitlines() if line.strip()]
+
+    def rules(self):
+        return ExclusionRules(self.lines(self.dir_names_edit), self.lines(self.path_globs_edit),
+                              self.one_filesystem_box.isChecked(), self.skip_pseudo_box.isChecked(),
+                              self.skip_network_box.isChecked())
+
+
+class ResultLimitAction(QtWidgets.QWidgetAction):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        self.widget = QtWidgets.QWidget()
+        self.hbox_layout = QtWidgets.QHBoxLayout()
+        self.label = QtWidgets.QLabel("最多显示结果数")
+        self.spinbox = QtWidgets.QSpinBox()
+        self.spinbox.setMaximum(10000000)
+        self.spinbox.setSingleStep(10000)
+        self.spinbox.setSpecialValueText("不限制")
+        self.spinbox.setValue(self.parent().result_limit.limit)
+        self.spinbox.valueChanged.connect(self.parent().result_limit.save_limit)
+
+        self.hbox_layout.addWidget(self.label)
+        self.hbox_layout.addWidget(self.spinbox)
+        self.widget.setLayout(self.hbox_layout)
+        self.setDefaultWidget(self.widget)
+
+
+class PreviewCacheAction(QtWidgets.QWidgetAction):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        self.widget = QtWidgets.QWidget()
+        self.hbox_layout = QtWidgets.QHBoxLayout()
+        self.label = QtWidgets.QLabel("预览缓存（MB）")
+        self.spinbox = QtWidgets.QSpinBox()
+        self.spinbox.setRange(8, 8192)
+        self.spinbox.setSingleStep(32)
+        self.spinbox.setValue(self.parent().preview_cache_settings.memory_mb)
+        self.spinbox.valueChanged.connect(self.parent().save_preview_cache_memory)
+
+        self.hbox_layout.addWidget(self.label)
+        self.hbox_layout.addWidget(self.spinbox)
+        self.widget.setLayout(self.hbox_layout)
+        self.setDefaultWidget(self.widget)
+
+
 if __name__ == "__main__":
     app = QtWidgets.QApplication(sys.argv)
-    ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID("alairack")
+    if sys.platform == "win32":
+        ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID("alairack")
     app.setWindowIcon(QtGui.QIcon(":/icons/logo.ico"))
     main_window = MainWindow(None)
 
@@ -0,0 +1,215 @@
+import codecs
+import mmap
+import os
+
+# 依次尝试的编码，与以往整文件尝试的顺序相同
+CANDIDATE_ENCODINGS = ["UTF-8", "GB18030", "BIG5", "gbk", "UTF-16"]
+SAMPLE_SIZE = 64 * 1024
+PAGE_SIZE = 128 * 1024
+# 后台统计行数时每隔这么多行记录一次行首位置，跳转到指定行时从最近的记录处向后查找
+LINE_INDEX_STEP = 1000
+COUNT_CHUNK_SIZE = 4 * 1024 * 1024
+# 超过这个长度仍没有换行时直接在此处分页，避免为一整行极长的文本解码整个文件
+LONG_LINE_SIZE = PAGE_SIZE * 8
+
+
+def sample_file(data):
+    """
+    :param data: 文件内容（bytes 或 mmap）
+    :return: 文件开头、中间与结尾各 SAMPLE_SIZE 字节，中间与结尾的样本从换行之后开始，避免截断多字节字符；
+             样本中没有换行时跳过开头的 UTF-8 后续字节（0x80-0xBF）
+    """
+    size = len(data)
+    if size <= SAMPLE_SIZE * 3:
+        return [bytes(data[:size])]
+    samples = [bytes(data[:SAMPLE_SIZE])]
+    for start in (size // 2, size - SAMPLE_SIZE):
+        sample = bytes(data[start:start + SAMPLE_SIZE])
+        newline = sample.find(b"\n")
+        if newline != -1:
+            samples.append(sample[newline + 1:])
+        else:
+            skip = 0
+            while skip < 3 and skip < len(sample) and 0x80 <= sample[skip] <= 0xBF:
+                skip += 1
+            samples.append(sample[skip:])
+    return samples
+
+
+def decodes(samples, encoding):
+    for sample in samples:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            # final=False：样本末尾被截断的多字节字符不算错误
+            decoder.decode(sample, final=False)
+        except UnicodeError:
+            return False
+    return True
+
+
+def detect_encoding(data):
+    """
+    只根据开头、中间与结尾的样本判断编码，不读取整个文件
+    :param data: 文件内容（bytes 或 mmap）
+    :return: 编码名称，均无法解码时返回 "unknown"
+    """
+    head = bytes(data[:4])
+    if head.startswith(codecs.BOM_UTF8):
+        return "UTF-8-SIG"
+    if head.startswith(codecs.BOM_UTF16_LE) or head.startswith(codecs.BOM_UTF16_BE):
+        return "UTF-16"
+    samples = sample_file(data)
+    for encoding in CANDIDATE_ENCODINGS:
+        if encoding == "UTF-16":
+            # 此处已没有 BOM，utf-16 解码器遇到不以 BOM 开头的数据会报错，按 utf-16-le 尝试，
+            # 与 PagedTextFile 解码时的字节序相同；样本需要从偶数位置开始
+            if decodes([bytes(data[:SAMPLE_SIZE])], "utf-16-le"):
+                return encoding
+        elif decodes(samples, encoding):
+            return encoding
+    return "unknown"
+
+
+def detect_file_encoding(file_path):
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return detect_encoding(b"")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return detect_encoding(data)
+
+
+class PagedTextFile(object):
+    """
+    以 mmap 打开文本文件，只解码请求的一段，页的边界总在行首
+    UTF-16 文件换成不带 BOM 的 utf-16-le/be 解码，并保证偏移量落在偶数位置
+    """
+
+    def __init__(self, file_path, encoding=None):
+        self.file_path = file_path
+        self.file = open(file_path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        # 空文件不能 mmap
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.size = size
+        self.encoding = encoding or detect_encoding(self.data)
+        self.codec, self.data_start, self.unit = self.codec_layout(self.encoding, bytes(self.data[:3]))
+        self.newline = "\n".encode(self.codec)
+
+    @staticmethod
+    def codec_layout(encoding, head):
+        """
+        :return: (实际用于解码的编码, 正文开始的偏移量, 字符的最小字节数)
+        """
+        if encoding.upper().replace("_", "-") == "UTF-16":
+            if head.startswith(codecs.BOM_UTF16_BE):
+                return "utf-16-be", 2, 2
+            return "utf-16-le", 2 if head.startswith(codecs.BOM_UTF16_LE) else 0, 2
+        if encoding.upper() == "UTF-8-SIG":
+            return "utf-8", 3 if head.startswith(codecs.BOM_UTF8) else 0, 1
+        return encoding, 0, 1
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    def find_newline(self, start, end=None):
+        """
+        :return: start 之后第一个换行符的偏移量，UTF-16 中只认偶数位置上的换行符，没有时返回 -1
+        """
+        end = self.size if end is None else min(end, self.size)
+        index = self.data.find(self.newline, start, end)
+        while index != -1 and (index - self.data_start) % self.unit:
+            index = self.data.find(self.newline, index + 1, end)
+        return index
+
+    def line_start(self, offset):
+        """
+        :return: offset 所在行之后第一行的行首偏移量，offset 已是行首时原样返回；
+                 LONG_LINE_SIZE 之内没有换行时返回 offset 本身（按字符的最小字节数对齐）
+        """
+        if offset <= self.data_start:
+            return self.data_start
+        if offset >= self.size:
+            return self.size
+        index = self.find_newline(offset - len(self.newline), offset + LONG_LINE_SIZE)
+        if index == -1:
+            if offset + LONG_LINE_SIZE < self.size:
+                return offset - (offset - self.data_start) % self.unit
+            return self.size
+        return index + len(self.newline)
+
+    def page(self, offset, size=PAGE_SIZE):
+        """
+        解码从 offset 所在行起约 size 字节的内容，结尾截到最后一个完整行，最后一页除外
+        :return: (文本, 开始偏移量, 结束偏移量)
+        """
+        start = self.line_start(offset)
+        end = min(self.size, start + size)
+        if end < self.size:
+            end = max(self.line_start(end), start)
+        text = bytes(self.data[start:end]).decode(self.codec, errors="replace")
+        return text, start, end
+
+    def previous_page(self, end, size=PAGE_SIZE):
+        """
+        解码 end 之前约 size 字节、以行首开始的内容
+        :return: (文本, 开始偏移量, 结束偏移量)
+        """
+        start = self.line_start(max(self.data_start, end - size))
+        if start >= end:
+            start = self.data_start
+        return bytes(self.data[start:end]).decode(self.codec, errors="replace"), start, end
+
+
+def count_lines(file_path, encoding, token=None, progress=None):
+    """
+    统计行数并每隔 LINE_INDEX_STEP 行记录行首偏移量，在后台线程中调用
+    :param token: 可选的 CancellationToken
+    :param progress: 可选的回调，参数为 (已统计的行数, 已读取的字节数)，每读取一块调用一次
+    :return: (行数, 行首偏移量列表)，第 i 项为第 i * LINE_INDEX_STEP + 1 行的行首；取消时返回 None
+    """
+    text_file = PagedTextFile(file_path, encoding)
+    try:
+        data, newline, unit = text_file.data, text_file.newline, text_file.unit
+        checkpoints = [text_file.data_start]
+        lines = 0
+        position = text_file.data_start
+        while position < text_file.size:
+            if token is not None and token.cancelled:
+                return None
+            chunk_end = min(text_file.size, position + COUNT_CHUNK_SIZE)
+            index = data.find(newline, position, chunk_end + len(newline) - 1)
+            while index != -1:
+                if (index - text_file.data_start) % unit == 0:
+                    lines += 1
+                    if lines % LINE_INDEX_STEP == 0:
+                        checkpoints.append(index + len(newline))
+                index = data.find(newline, index + unit, chunk_end + len(newline) - 1)
+            position = chunk_end
+            if progress is not None:
+                progress(lines, position)
+        # 最后一行没有换行符时也算一行
+        if text_file.size > text_file.data_start and not bytes(
+                data[text_file.size - len(newline):text_file.size]) == newline:
+            lines += 1
+        return lines, checkpoints
+    finally:
+        text_file.close()
+
+
+def line_offset(text_file, checkpoints, line):
+    """
+    :param line: 从 1 开始的行号
+    :return: 该行行首的偏移量，超出已统计的范围时返回 None
+    """
+    checkpoint = (line - 1) // LINE_INDEX_STEP
+    if checkpoint >= len(checkpoints):
+        return None
+    offset = checkpoints[checkpoint]
+    for i in range(checkpoint * LINE_INDEX_STEP + 1, line):
+        index = text_file.find_newline(offset)
+        if index == -1:
+            return text_file.size
+        offset = index + len(text_file.newline)
+    return offset
@@ -1,11 +1,20 @@
-from PyQt5.QtGui import QPixmap, QPainter, QImage, QPalette, QImageReader
-from PyQt5.QtCore import Qt, QUrl
+from collections import OrderedDict
+
+from PyQt5.QtGui import QPainter, QPalette, QImageReader
+from PyQt5.QtCore import (Qt, QUrl, QObject, QPoint, QRect, QRectF, QRunnable, QSize, QThreadPool, QTimer,
+                          pyqtSignal, pyqtSlot)
 from PyQt5.QtPrintSupport import QPrintDialog, QPrinter
-from PyQt5.QtWidgets import (QHBoxLayout, QWidget, QLabel, QMainWindow, QAction, QMenu,
-                             QScrollArea, QSizePolicy, QTextEdit)
+from PyQt5.QtWidgets import QHBoxLayout, QWidget, QMainWindow, QAction, QMenu, QScrollArea
 from PyQt5.QtMultimedia import QMediaContent
 from videoplayer import VideoPlayer
 from audio_player import AudioPlayer
+from preview_scheduler import PreviewScheduler
+from text_viewer import PagedTextViewer
+from traversal import CancellationToken
+
+# 放大后从原图解码的图块大小（控件中的像素）与最多保留的图块数
+TILE_SIZE = 512
+MAX_TILES = 64
 
 
 class PreviewArea(QWidget):
@@ -20,35 +29,80 @@ class PreviewArea(QWidget):
 
         self.image_viewer = ImageViewer()
         self.image_viewer.hide()
-        self.text_viewer = QTextEdit()
-        self.text_viewer.setReadOnly(True)
+        self.text_viewer = PagedTextViewer()
         self.text_viewer.hide()
 
         self.audio_player = AudioPlayer()
 
+        # 文本与图片在后台准备，界面线程只在 preview_ready 中换上结果
+        self.scheduler = PreviewScheduler(self)
+        self.cache = self.scheduler.cache
+        self.scheduler.ready.connect(self.preview_ready)
+        self.scheduler.failed.connect(self.preview_failed)
+
         self.hboxLayout = QHBoxLayout()
 
         self.hboxLayout.addWidget(self.image_viewer)
         self.hboxLayout.addWidget(self.text_viewer)
         self.setLayout(self.hboxLayout)
 
+    def resizeEvent(self, event):
+        ratio = self.devicePixelRatioF()
+        self.scheduler.set_view_size(int(self.width() * ratio), int(self.height() * ratio))
+        super(PreviewArea, self).resizeEvent(event)
+
     def show_image(self, image_path):
-        self.image_viewer.open(image_path)
-        self.text_viewer.hide()
-        self.image_viewer.show()
+        self.scheduler.request("image", image_path)
 
     def open_video(self, video_path):
+        """
+        立即打开播放窗口，封面与时长在后台读取（或取自缓存），按下播放后才开始解码
+        """
         self.video_player = VideoPlayer(video_path)
         self.video_player.show()
+        self.scheduler.request("video", video_path)
 
     def show_text(self, text_file_path):
-        file_coding = self.get_file_encoding(text_file_path)
-        if file_coding == "unknown":
-            return "unknown code"
-        with open(text_file_path, "r", encoding=file_coding) as f:
-            content = f.read()
+        """
+        判断编码与解码第一页在后台进行，无法判断编码的文件不显示
+        """
+        self.scheduler.request("text", text_file_path)
 
-        self.text_viewer.setText(content)
+    def preview_kind(self, file_name):
+        """
+        :return: 可以在后台准备预览的类型 "text" 或 "image"，其它文件返回 None
+        """
+        file_name_extension = file_name.split(".")[-1]
+        if file_name_extension in self.support_formats["text"]:
+            return "text"
+        if file_name_extension in self.support_formats["image"]:
+            return "image"
+        return None
+
+    def preview_ready(self, kind, path, data):
+        if kind == "text":
+            encoding, first_page = data
+            # 只解码可见位置附近的内容，大文件不再整个读入
+            self.text_viewer.open(path, encoding, first_page)
+            self.image_viewer.hide()
+            self.text_viewer.show()
+        elif kind == "image":
+            self.image_viewer.set_preview(data, path)
+            self.text_viewer.hide()
+            self.image_viewer.show()
+        elif kind == "video":
+            if self.video_player is not None and self.video_player.video_path == path:
+                self.video_player.set_poster(data)
+
+    def preview_failed(self, kind, path, message):
+        """
+        读取失败时清空上一个文件的预览，在文本预览的状态栏中显示错误信息
+        视频播放窗口已经打开，读不到封面时仍可播放，不做处理
+        """
+        if kind == "video":
+            return
+        self.text_viewer.close_file()
+        self.text_viewer.status_label.setText(f"无法预览 {path}：{message}")
         self.image_viewer.hide()
         self.text_viewer.show()
 
@@ -57,6 +111,7 @@ class PreviewArea(QWidget):
         self.audio_player.player.setPlaylist(self.audio_player.currentPlaylist)
         self.audio_player.currentPlaylist.setCurrentIndex(self.audio_player.currentPlaylist.mediaCount() - 1)
         if play_immediately:
+            self.scheduler.cancel()
             self.audio_player.player.play()
 
     def get_support_formats(self):
@@ -78,46 +133,21 @@ class PreviewArea(QWidget):
         self.support_formats["text"] = ["txt", "ini", "doc", "docx"]
         self.support_formats["audio"] = ["wav", "mp3"]
 
-    def get_file_encoding(self, file_path):
-        """
-        获取字符编码类型
-        参考: https://blog.csdn.net/u013314786/article/details/77931548
-        :param file_path: 要辨别的文件路径
-        """
-
-        codes = ['UTF-8', 'GB18030', 'BIG5', "gbk", "UTF-16"]
-        # UTF-8 BOM前缀字节
-        utf8_bom = b'\xef\xbb\xbf'
-        # 遍历编码类型
-
-        with open(file_path, 'rb') as f:
-            data = f.read()
-        for code in codes:
-            try:
-                data.decode(encoding=code)
-                if 'UTF-8' == code and data.startswith(utf8_bom):
-                    return 'UTF-8-SIG'
-                return code
-            except UnicodeDecodeError:
-                continue
-        return 'unknown'
-
 
 class ImageViewer(QMainWindow):
     def __init__(self):
         super(ImageViewer, self).__init__()
 
         self.printer = QPrinter()
+        # 相对原图的缩放比例
         self.scaleFactor = 0.0
 
-        self.imageLabel = QLabel()
-        self.imageLabel.setBackgroundRole(QPalette.Base)
-        self.imageLabel.setSizePolicy(QSizePolicy.Minimum, QSizePolicy.Minimum)
-        self.imageLabel.setScaledContents(True)
+        self.canvas = ImageCanvas()
+        self.canvas.setBackgroundRole(QPalette.Base)
 
         self.scrollArea = QScrollArea()
         self.scrollArea.setBackgroundRole(QPalette.Dark)
-        self.scrollArea.setWidget(self.imageLabel)
+        self.scrollArea.setWidget(self.canvas)
         self.setCentralWidget(self.scrollArea)
 
         self.createActions()
@@ -125,28 +155,34 @@ class ImageViewer(QMainWindow):
 
         self.setWindowTitle("Image Viewer")
 
-    def open(self, image_path):
-        if image_path:
-            image = QImage(image_path)
-            self.imageLabel.setPixmap(QPixmap.fromImage(image))
-            self.scaleFactor = 1.0
-
-            self.fitToWindowAct.setEnabled(True)
-            self.updateActions()
+    def set_preview(self, preview, image_path=None):
+        """
+        :param preview: 后台缩小解码的 ImagePreview，放大时再从 image_path 解码清晰的部分
+        """
+        if preview is None:
+            return
+        if self.canvas.set_preview(preview, image_path):
+            # 同一张图片由 EXIF 缩略图换成缩小解码的图片，保持当前缩放
+            return
+        self.scaleFactor = preview.display_size.width() / max(1, preview.source_size.width())
+
+        self.fitToWindowAct.setEnabled(True)
+        self.updateActions()
 
-            if not self.fitToWindowAct.isChecked():
-                self.imageLabel.adjustSize()
+        if not self.fitToWindowAct.isChecked():
+            self.canvas.resize(preview.display_size)
 
     def print_(self):
         dialog = QPrintDialog(self.printer, self)
         if dialog.exec_():
             painter = QPainter(self.printer)
             rect = painter.viewport()
-            size = self.imageLabel.pixmap().size()
+            image = self.canvas.current_image()
+            size = image.size()
             size.scale(rect.size(), Qt.KeepAspectRatio)
             painter.setViewport(rect.x(), rect.y(), size.width(), size.height())
-            painter.setWindow(self.imageLabel.pixmap().rect())
-            painter.drawPixmap(0, 0, self.imageLabel.pixmap())
+            painter.setWindow(image.rect())
+            painter.drawImage(0, 0, image)
 
     def zoomIn(self):
         self.scaleImage(1.25)
@@ -155,7 +191,8 @@ class ImageViewer(QMainWindow):
         self.scaleImage(0.8)
 
     def normalSize(self):
-        self.imageLabel.adjustSize()
+        # 原图大小，超过预览图分辨率的部分由 ImageCanvas 从原图解码
+        self.canvas.resize(self.canvas.source_size())
         self.scaleFactor = 1.0
 
     def fitToWindow(self):
@@ -197,7 +234,7 @@ class ImageViewer(QMainWindow):
 
     def scaleImage(self, factor):
         self.scaleFactor *= factor
-        self.imageLabel.resize(self.scaleFactor * self.imageLabel.pixmap().size())
+        self.canvas.resize(self.scaleFactor * self.canvas.source_size())
 
         self.adjustScrollBar(self.scrollArea.horizontalScrollBar(), factor)
         self.adjustScrollBar(self.scrollArea.verticalScrollBar(), factor)
@@ -210,3 +247,168 @@ class ImageViewer(QMainWindow):
                                 + ((factor - 1) * scrollBar.pageStep()/2)))
 
 
+class ImageCanvas(QWidget):
+    """
+    把缩小解码的预览图拉伸到控件大小显示，控件放大到超过预览图的分辨率后，
+    在后台按可见区域从原图解码 TILE_SIZE 大小的清晰图块叠加显示，只解码看得到的部分；
+    格式不支持按区域解码（或图片需要按 EXIF 旋转）时改为在后台解码一次整张原图
+    """
+
+    def __init__(self):
+        super(ImageCanvas, self).__init__()
+        self.preview = None
+        self.image_path = None
+        self.full_image = None
+        self.tiles = OrderedDict()          # (控件宽, 控件高, 列, 行) -> 图块，最近使用的在末尾
+        self.pending = set()
+        # 换图片或控件大小改变后递增，此前开始的解码结果作废
+        self.generation = 0
+        self.token = CancellationToken()
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        # 缩放或滚动停下来后才解码图块
+        self.detail_timer = QTimer(self)
+        self.detail_timer.setSingleShot(True)
+        self.detail_timer.setInterval(100)
+        self.detail_timer.timeout.connect(self.load_detail)
+
+    def set_preview(self, preview, image_path):
+        """
+        :return: 是否只是替换同一张图片的预览图
+        """
+        same_image = (image_path is not None and image_path == self.image_path and self.preview is not None
+                      and self.preview.source_size == preview.source_size)
+        self.preview = preview
+        self.image_path = image_path
+        if not same_image:
+            self.full_image = None
+            self.reset_detail()
+        self.update()
+        return same_image
+
+    def reset_detail(self):
+        self.token.cancel()
+        self.token = CancellationToken()
+        self.generation += 1
+        self.tiles.clear()
+        self.pending.clear()
+
+    def source_size(self):
+        return self.preview.source_size if self.preview is not None else QSize()
+
+    def current_image(self):
+        return self.full_image if self.full_image is not None else self.preview.image
+
+    def sizeHint(self):
+        return self.preview.display_size if self.preview is not None else QSize()
+
+    def needs_detail(self):
+        if self.preview is None or self.image_path is None or self.full_image is not None:
+            return False
+        image = self.preview.image
+        return self.width() > image.width() * 1.05 or self.height() > image.height() * 1.05
+
+    def resizeEvent(self, event):
+        self.reset_detail()
+        super(ImageCanvas, self).resizeEvent(event)
+
+    def paintEvent(self, event):
+        if self.preview is None:
+            return
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        rect = event.rect()
+        image = self.current_image()
+        x_ratio = image.width() / max(1, self.width())
+        y_ratio = image.height() / max(1, self.height())
+        # 只缩放需要重绘的区域
+        painter.drawImage(QRectF(rect), image, QRectF(rect.x() * x_ratio, rect.y() * y_ratio,
+                                                      rect.width() * x_ratio, rect.height() * y_ratio))
+        for (width, height, column, row), tile in self.tiles.items():
+            tile_rect = QRect(column * TILE_SIZE, row * TILE_SIZE, tile.width(), tile.height())
+            if tile_rect.intersects(rect):
+                painter.drawImage(tile_rect.topLeft(), tile)
+        painter.end()
+        if self.needs_detail():
+            self.detail_timer.start()
+
+    def load_detail(self):
+        if not self.needs_detail():
+            return
+        if not self.preview.tileable:
+            if "full" not in self.pending:
+                self.start_detail("full", None, None)
+            return
+        source = self.preview.source_size
+        visible = self.visibleRegion().boundingRect()
+        for row in range(visible.top() // TILE_SIZE, visible.bottom() // TILE_SIZE + 1):
+            for column in range(visible.left() // TILE_SIZE, visible.right() // TILE_SIZE + 1):
+                key = (self.width(), self.height(), column, row)
+                if key in self.tiles:
+                    self.tiles.move_to_end(key)
+                    continue
+                if key in self.pending:
+                    continue
+                tile_rect = QRect(column * TILE_SIZE, row * TILE_SIZE, TILE_SIZE, TILE_SIZE).intersected(self.rect())
+                if tile_rect.isEmpty():
+                    continue
+                # 图块在原图中的区域，取整后与控件中的位置最多相差一个像素
+                x_ratio = source.width() / self.width()
+                y_ratio = source.height() / self.height()
+                clip = QRect(int(tile_rect.x() * x_ratio), int(tile_rect.y() * y_ratio),
+                             max(1, round(tile_rect.width() * x_ratio)), max(1, round(tile_rect.height() * y_ratio)))
+                self.start_detail(key, clip.intersected(QRect(QPoint(0, 0), source)), tile_rect.size())
+
+    def start_detail(self, key, clip, scaled_size):
+        self.pending.add(key)
+        task = DetailTask(self.generation, key, self.image_path, clip, scaled_size, self.token)
+        task.signals.finished.connect(self.detail_finished)
+        self.pool.start(task)
+
+    def detail_finished(self, generation, key, image):
+        if generation != self.generation:
+            return
+        self.pending.discard(key)
+        if image is None:
+            return
+        if key == "full":
+            self.full_image = image
+        else:
+            self.tiles[key] = image
+            while len(self.tiles) > MAX_TILES:
+                self.tiles.popitem(last=False)
+        self.update()
+
+
+class DetailTask(QRunnable):
+    """
+    在后台线程中从原图解码整张图片或一个区域
+    """
+
+    def __init__(self, generation, key, image_path, clip, scaled_size, token):
+        super(DetailTask, self).__init__()
+        self.generation = generation
+        self.key = key
+        self.image_path = image_path
+        self.clip = clip
+        self.scaled_size = scaled_size
+        self.token = token
+        self.signals = DetailSignals()
+
+    @pyqtSlot()
+    def run(self):
+        # 排队期间图片已更换或已缩放到其它大小
+        if self.token.cancelled:
+            return
+        reader = QImageReader(self.image_path)
+        if self.clip is None:
+            reader.setAutoTransform(True)
+        else:
+            reader.setClipRect(self.clip)
+            reader.setScaledSize(self.scaled_size)
+        image = reader.read()
+        self.signals.finished.emit(self.generation, self.key, None if image.isNull() else image)
+
+
+class DetailSignals(QObject):
+    finished = pyqtSignal(int, object, object)
@@ -0,0 +1,210 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from app_data import get_app_dir_path
+
+DEFAULT_MEMORY_MB = 128
+DEFAULT_DISK_MB = 512
+# 未启用磁盘缓存时仍写入磁盘的类型：视频封面需要打开视频并等待解码，重新打开程序后也应立即显示
+ALWAYS_ON_DISK = {"video"}
+
+
+def cache_key(file_path):
+    """
+    :return: (路径, 修改时间（纳秒）, 大小)，文件被修改后键随之改变，旧的缓存不再命中；无法读取时返回 None
+    """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return file_path, stat.st_mtime_ns, stat.st_size
+
+
+class PreviewCache(object):
+    """
+    已准备好的预览（解码后的文本页、图片、视频封面等），按 (类型, cache_key) 存放
+    内存中按最近使用顺序淘汰，总大小不超过 max_bytes；可选的磁盘缓存存放调用者序列化后的字节，
+    位于程序数据目录下，同样按最近使用（文件修改时间）淘汰
+    预览线程与界面线程共用，所有操作都在锁内进行
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MEMORY_MB * 1024 * 1024, disk_dir=None,
+                 disk_max_bytes=DEFAULT_DISK_MB * 1024 * 1024, disk_kinds=None):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()        # (类型, 键) -> (预览, 字节数)，最近使用的在末尾
+        self.nbytes = 0
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_kinds = disk_kinds        # 写入磁盘缓存的类型，None 表示全部
+        self.disk_nbytes = None             # 第一次写入磁盘缓存时才统计
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, max_bytes, disk_dir, disk_max_bytes, disk_kinds=None):
+        with self.lock:
+            self.max_bytes = max_bytes
+            self.disk_dir = disk_dir
+            self.disk_max_bytes = disk_max_bytes
+            self.disk_kinds = disk_kinds
+            self.disk_nbytes = None
+            self.evict()
+
+    def get(self, kind, key):
+        with self.lock:
+            entry = self.entries.get((kind, key))
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end((kind, key))
+            self.hits += 1
+            return entry[0]
+
+    def contains(self, kind, key):
+        """
+        只判断是否已缓存，不改变淘汰顺序，也不计入命中次数
+        """
+        with self.lock:
+            return (kind, key) in self.entries
+
+    def put(self, kind, key, value, nbytes):
+        """
+        :param nbytes: 预览占用内存的估计值，超过总预算一半的预览不缓存
+        """
+        if nbytes > self.max_bytes // 2:
+            return
+        with self.lock:
+            old = self.entries.pop((kind, key), None)
+            if old is not None:
+                self.nbytes -= old[1]
+            self.entries[(kind, key)] = (value, nbytes)
+            self.nbytes += nbytes
+            self.evict()
+
+    def evict(self):
+        while self.nbytes > self.max_bytes and self.entries:
+            value, nbytes = self.entries.popitem(last=False)[1]
+            self.nbytes -= nbytes
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def disk_path(self, kind, key):
+        digest = hashlib.sha1(repr((kind, key)).encode("utf-8", "surrogateescape")).hexdigest()
+        return os.path.join(self.disk_dir, f"{digest}.{kind}")
+
+    def uses_disk(self, kind):
+        return self.disk_dir is not None and (self.disk_kinds is None or kind in self.disk_kinds)
+
+    def get_blob(self, kind, key):
+        """
+        :return: 磁盘缓存中的字节，该类型未启用磁盘缓存或没有命中时返回 None
+        """
+        if not self.uses_disk(kind):
+            return None
+        file_path = self.disk_path(kind, key)
+        try:
+            with open(file_path, "rb") as f:
+                data = f.read()
+            # 修改时间作为最近使用时间，淘汰时先删最久未用的
+            os.utime(file_path)
+        except OSError:
+            return None
+        return data
+
+    def put_blob(self, kind, key, data):
+        if not self.uses_disk(kind):
+            return
+        file_path = self.disk_path(kind, key)
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            # 先写入临时文件再改名，其它线程不会读到写了一半的文件
+            temp_path = f"{file_path}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, file_path)
+        except OSError:
+            return
+        with self.lock:
+            if self.disk_nbytes is None:
+                self.disk_nbytes = sum(size for path, size, mtime in self.disk_files())
+            else:
+                self.disk_nbytes += len(data)
+            if self.disk_nbytes > self.disk_max_bytes:
+                self.evict_disk()
+
+    def disk_files(self):
+        files = []
+        try:
+            entries = list(os.scandir(self.disk_dir))
+        except OSError:
+            return files
+        for entry in entries:
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            files.append((entry.path, stat.st_size, stat.st_mtime))
+        return files
+
+    def evict_disk(self):
+        """
+        删除最久未用的文件，直到磁盘缓存降到预算的四分之三，避免每次写入都要淘汰
+        """
+        files = sorted(self.disk_files(), key=lambda file: file[2])
+        total = sum(size for path, size, mtime in files)
+        for path, size, mtime in files:
+            if total <= self.disk_max_bytes * 3 // 4:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self.disk_nbytes = total
+
+
+class PreviewCacheSettings(object):
+    """
+    预览缓存的设置，保存在程序数据目录中的 preview_cache.json
+    :param memory_mb: 内存缓存的预算
+    :param disk_enabled: 是否启用磁盘缓存，磁盘缓存位于程序数据目录下的 preview_cache 文件夹；
+                         未启用时只有 ALWAYS_ON_DISK 中的类型写入磁盘
+    :param disk_mb: 磁盘缓存的预算
+    """
+
+    def __init__(self, memory_mb=DEFAULT_MEMORY_MB, disk_enabled=False, disk_mb=DEFAULT_DISK_MB):
+        self.memory_mb = memory_mb
+        self.disk_enabled = disk_enabled
+        self.disk_mb = disk_mb
+
+    def apply(self, cache):
+        cache.configure(self.memory_mb * 1024 * 1024, os.path.join(get_app_dir_path(), "preview_cache"),
+                        self.disk_mb * 1024 * 1024, None if self.disk_enabled else ALWAYS_ON_DISK)
+
+    def to_dict(self):
+        return {"memory_mb": self.memory_mb, "disk_enabled": self.disk_enabled, "disk_mb": self.disk_mb}
+
+    @classmethod
+    def load(cls, file_path=None):
+        """
+        文件不存在或已损坏时使用默认设置
+        """
+        if file_path is None:
+            file_path = os.path.join(get_app_dir_path(), "preview_cache.json")
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                return cls(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return cls()
+
+    def save(self, file_path=None):
+        if file_path is None:
+            file_path = os.path.join(get_app_dir_path(), "preview_cache.json")
+        with open(file_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
@@ -0,0 +1,376 @@
+import sys
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QImage, QImageIOHandler, QImageReader, QTransform
+
+from exif_thumbnail import read_exif_thumbnail
+from paged_text import PagedTextFile, detect_file_encoding
+from preview_cache import PreviewCache, cache_key
+from traversal import CancellationToken
+from videoplayer import VideoPoster, probe_video
+
+PREVIEW_WORKERS = 2
+# 预取相邻行的预览只用一个线程，不与当前预览和搜索争抢磁盘
+PREFETCH_WORKERS = 1
+PREFETCH_ROWS = 3
+PREFETCH_DELAY = 200        # 毫秒，选中行停留这么久后才开始预取
+# 一轮预取最多占用缓存预算的这一比例，避免把最近看过的预览挤出缓存
+PREFETCH_BUDGET_RATIO = 0.25
+# 图片按预览区域的大小缩小解码，长边取 IMAGE_EDGE_STEP 的整数倍，预览区域大小略有变化时仍能命中缓存
+DEFAULT_IMAGE_EDGE = 1024
+IMAGE_EDGE_STEP = 512
+# 超过这么多像素的 JPEG 先显示内嵌的 EXIF 缩略图，再换成缩小解码的图片
+LARGE_IMAGE_PIXELS = 16 * 1000 * 1000
+# EXIF 方向标签值 -> (水平翻转后顺时针旋转的角度, 是否先水平翻转)
+ORIENTATIONS = {2: (0, True), 3: (180, False), 4: (180, True), 5: (270, True), 6: (90, False), 7: (90, True),
+                8: (270, False)}
+
+
+class ImagePreview(object):
+    """
+    缩小解码的图片
+    :param image: 解码得到的 QImage
+    :param source_size: 原图按 EXIF 方向旋转后的大小
+    :param display_size: 预览时显示的大小，先显示的 EXIF 缩略图按最终图片的大小放大显示
+    :param tileable: 放大时能否按区域从原图解码，否则需要解码整张原图
+    """
+
+    def __init__(self, image, source_size, display_size, tileable):
+        self.image = image
+        self.source_size = source_size
+        self.display_size = display_size
+        self.tileable = tileable
+
+
+def load_text(file_path, token, edge=None, partial=None):
+    """
+    在后台线程中判断编码并解码第一页
+    :return: (编码, (文本, 开始偏移量, 结束偏移量))，已取消时返回 None
+    :raise ValueError: 无法判断编码
+    """
+    encoding = detect_file_encoding(file_path)
+    if encoding == "unknown":
+        raise ValueError("无法判断文件编码")
+    if token.cancelled:
+        return None
+    text_file = PagedTextFile(file_path, encoding)
+    try:
+        return encoding, text_file.page(0)
+    finally:
+        text_file.close()
+
+
+def load_image(file_path, token, edge=DEFAULT_IMAGE_EDGE, partial=None):
+    """
+    在后台线程中把图片直接解码为长边不超过 edge 的大小，不先解码整张原图再缩小
+    QImage 可以在非界面线程中使用，转换为 QPixmap 留给界面线程
+    :param partial: 可选的回调，大图解码前先以 EXIF 缩略图调用一次
+    :return: ImagePreview，无法读取时返回 None
+    """
+    reader = QImageReader(file_path)
+    reader.setAutoTransform(True)
+    size = reader.size()
+    if not size.isValid():
+        image = reader.read()
+        if image.isNull():
+            return None
+        return ImagePreview(image, image.size(), image.size(), False)
+    transformation = reader.transformation()
+    source_size = size.transposed() if transformation & QImageIOHandler.TransformationRotate90 else size
+    display_size = source_size.scaled(edge, edge, Qt.KeepAspectRatio) if max(
+        size.width(), size.height()) > edge else source_size
+    # 按区域解码只在格式支持、且不需要旋转时使用，旋转后的区域与文件中的区域不一致
+    tileable = (transformation == QImageIOHandler.TransformationNone and
+                reader.supportsOption(QImageIOHandler.ClipRect))
+    if (partial is not None and size.width() * size.height() > LARGE_IMAGE_PIXELS and
+            bytes(reader.format()) in (b"jpeg", b"jpg")):
+        thumbnail = exif_thumbnail_image(file_path)
+        if thumbnail is not None and not token.cancelled:
+            partial(ImagePreview(thumbnail, source_size, display_size, tileable))
+    if display_size != source_size:
+        # 缩放大小按文件中的方向给出，旋转在缩放之后进行
+        reader.setScaledSize(size.scaled(edge, edge, Qt.KeepAspectRatio))
+    image = reader.read()
+    if image.isNull() or token.cancelled:
+        return None
+    return ImagePreview(image, source_size, display_size, tileable)
+
+
+def exif_thumbnail_image(file_path):
+    """
+    :return: 按 EXIF 方向旋转后的内嵌缩略图，没有时返回 None
+    """
+    try:
+        thumbnail, orientation = read_exif_thumbnail(file_path)
+    except OSError:
+        return None
+    if thumbnail is None:
+        return None
+    image = QImage.fromData(thumbnail, "JPG")
+    if image.isNull():
+        return None
+    rotation, mirror = ORIENTATIONS.get(orientation, (0, False))
+    if mirror:
+        image = image.mirrored(True, False)
+    if rotation:
+        image = image.transformed(QTransform().rotate(rotation))
+    return image
+
+
+def load_video(file_path, token, edge=DEFAULT_IMAGE_EDGE, partial=None):
+    """
+    :return: VideoPoster，封面按预览区域大小缩小
+    """
+    return probe_video(file_path, token, edge)
+
+
+def image_edge(width, height):
+    """
+    :return: 预览区域的长边向上取到 IMAGE_EDGE_STEP 的整数倍
+    """
+    edge = max(width, height, 1)
+    return (edge + IMAGE_EDGE_STEP - 1) // IMAGE_EDGE_STEP * IMAGE_EDGE_STEP
+
+
+def image_to_bytes(preview):
+    # 原图信息写入 PNG 的文本块
+    image = QImage(preview.image)
+    image.setText("source_size", f"{preview.source_size.width()}x{preview.source_size.height()}")
+    image.setText("display_size", f"{preview.display_size.width()}x{preview.display_size.height()}")
+    image.setText("tileable", "1" if preview.tileable else "0")
+    buffer = QtCore.QBuffer()
+    buffer.open(QtCore.QIODevice.WriteOnly)
+    image.save(buffer, "PNG")
+    return bytes(buffer.data())
+
+
+def image_from_bytes(data):
+    image = QImage.fromData(data, "PNG")
+    if image.isNull():
+        return None
+    try:
+        source_size, display_size = (QtCore.QSize(*map(int, image.text(key).split("x")))
+                                     for key in ("source_size", "display_size"))
+    except (TypeError, ValueError):
+        return None
+    return ImagePreview(image, source_size, display_size, image.text("tileable") == "1")
+
+
+def poster_to_bytes(poster):
+    image = QImage(poster.image)
+    image.setText("duration", "" if poster.duration is None else repr(poster.duration))
+    buffer = QtCore.QBuffer()
+    buffer.open(QtCore.QIODevice.WriteOnly)
+    image.save(buffer, "PNG")
+    return bytes(buffer.data())
+
+
+def poster_from_bytes(data):
+    image = QImage.fromData(data, "PNG")
+    if image.isNull():
+        return None
+    try:
+        duration = float(image.text("duration")) if image.text("duration") else None
+    except ValueError:
+        return None
+    return VideoPoster(image, duration)
+
+
+LOADERS = {"text": load_text, "image": load_image, "video": load_video}
+# 各类预览在内存缓存中占用的字节数
+PREVIEW_SIZES = {
+    "text": lambda data: sys.getsizeof(data[1][0]),
+    "image": lambda preview: preview.image.bytesPerLine() * preview.image.height(),
+    "video": lambda poster: poster.image.bytesPerLine() * poster.image.height(),
+}
+# 按预览区域大小解码的类型，缓存键中包含解码时的长边
+SCALED_KINDS = {"image", "video"}
+# 可以存入磁盘缓存的预览的 (序列化, 反序列化) 函数，文本解码很快，不值得写入磁盘
+DISK_FORMATS = {"image": (image_to_bytes, image_from_bytes), "video": (poster_to_bytes, poster_from_bytes)}
+
+
+def prepare(kind, file_path, token, cache, edge=DEFAULT_IMAGE_EDGE, partial=None):
+    """
+    依次查找内存缓存、磁盘缓存，都没有时调用 LOADERS 中的函数，并把结果存入缓存
+    :param edge: 图片解码后的最大长边
+    :param partial: 可选的回调，缓存未命中时可能先以粗略的预览调用
+    :return: 预览数据，无法预览时返回 None
+    """
+    key = cache_key(file_path)
+    if key is None:
+        return LOADERS[kind](file_path, token, edge, partial)
+    if kind in SCALED_KINDS:
+        key += (edge,)
+    data = cache.get(kind, key)
+    if data is not None:
+        return data
+    # 该类型未启用磁盘缓存时不序列化，避免每次未命中都白白编码一次
+    disk_format = DISK_FORMATS.get(kind) if cache.uses_disk(kind) else None
+    if disk_format is not None:
+        blob = cache.get_blob(kind, key)
+        if blob is not None:
+            data = disk_format[1](blob)
+    if data is None:
+        data = LOADERS[kind](file_path, token, edge, partial)
+        if data is None:
+            return None
+        if disk_format is not None:
+            cache.put_blob(kind, key, disk_format[0](data))
+    cache.put(kind, key, data, PREVIEW_SIZES[kind](data))
+    return data
+
+
+class PreviewScheduler(QtCore.QObject):
+    """
+    在线程池中准备预览，界面线程只负责把准备好的数据换上去
+    每次请求都会取消此前的请求：尚未开始的任务直接跳过，已在运行的任务的结果被丢弃，
+    因此快速切换选中项时只有最后一个文件的预览会显示
+    准备好的预览存入 PreviewCache，在几个文件之间来回切换时不再重复读取与解码
+    prefetch 在单独的低优先级线程池中预先准备相邻文件的预览，只放入缓存，不显示
+    """
+
+    ready = QtCore.pyqtSignal(str, str, object)       # 类型, 路径, 预览数据
+    failed = QtCore.pyqtSignal(str, str, str)         # 类型, 路径, 错误信息
+
+    def __init__(self, parent=None, workers=PREVIEW_WORKERS, cache=None, prefetch_workers=PREFETCH_WORKERS):
+        super(PreviewScheduler, self).__init__(parent)
+        self.cache = PreviewCache() if cache is None else cache
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(workers)
+        self.generation = 0
+        self.token = CancellationToken()
+        # 正在准备的 (类型, 路径)，同一文件的重复请求（如按下鼠标改变当前行后又触发点击）不再重新开始
+        self.pending = None
+        self.prefetch_pool = QtCore.QThreadPool(self)
+        self.prefetch_pool.setMaxThreadCount(prefetch_workers)
+        self.prefetch_token = CancellationToken()
+        self.image_edge = DEFAULT_IMAGE_EDGE
+
+    def set_view_size(self, width, height):
+        """
+        预览区域大小改变后调用，之后的图片按新的大小解码
+        """
+        self.image_edge = image_edge(width, height)
+
+    def request(self, kind, file_path):
+        """
+        :param kind: LOADERS 中的类型
+        """
+        if self.pending == (kind, file_path):
+            return
+        self.cancel()
+        # 当前预览优先，上一轮预取让出磁盘，选中行停留后再开始新一轮
+        self.cancel_prefetch()
+        self.pending = (kind, file_path)
+        task = PreviewTask(self.generation, kind, file_path, self.cache, self.token, self.image_edge)
+        task.signals.partial.connect(self.task_partial)
+        task.signals.finished.connect(self.task_finished)
+        task.signals.failed.connect(self.task_failed)
+        self.pool.start(task)
+
+    def cancel(self):
+        self.token.cancel()
+        self.token = CancellationToken()
+        self.generation += 1
+        self.pending = None
+
+    def prefetch(self, items):
+        """
+        取消上一轮预取，按顺序在后台准备 items 中的预览
+        :param items: [(类型, 路径), ...]，越靠前越先准备
+        """
+        self.cancel_prefetch()
+        if items:
+            budget = int(self.cache.max_bytes * PREFETCH_BUDGET_RATIO)
+            self.prefetch_pool.start(PrefetchTask(items, self.cache, self.prefetch_token, budget, self.image_edge))
+
+    def cancel_prefetch(self):
+        self.prefetch_token.cancel()
+        self.prefetch_token = CancellationToken()
+
+    def task_partial(self, generation, kind, file_path, data):
+        if generation == self.generation:
+            self.ready.emit(kind, file_path, data)
+
+    def task_finished(self, generation, kind, file_path, data):
+        if generation == self.generation:
+            self.pending = None
+            self.ready.emit(kind, file_path, data)
+
+    def task_failed(self, generation, kind, file_path, message):
+        if generation == self.generation:
+            self.pending = None
+            self.failed.emit(kind, file_path, message)
+
+
+class PreviewTask(QtCore.QRunnable):
+    def __init__(self, generation, kind, file_path, cache, token, edge):
+        super(PreviewTask, self).__init__()
+        self.generation = generation
+        self.kind = kind
+        self.file_path = file_path
+        self.cache = cache
+        self.token = token
+        self.edge = edge
+        self.signals = PreviewSignals()
+
+    def partial(self, data):
+        self.signals.partial.emit(self.generation, self.kind, self.file_path, data)
+
+    @QtCore.pyqtSlot()
+    def run(self):
+        # 排队期间已被新的请求取代
+        if self.token.cancelled:
+            return
+        try:
+            data = prepare(self.kind, self.file_path, self.token, self.cache, self.edge, self.partial)
+        except (OSError, ValueError) as e:
+            self.signals.failed.emit(self.generation, self.kind, self.file_path, str(e))
+            return
+        if self.token.cancelled:
+            return
+        if data is None:
+            # 无法读取的图片等，同样清掉上一个文件的预览
+            self.signals.failed.emit(self.generation, self.kind, self.file_path, "无法读取文件")
+        else:
+            self.signals.finished.emit(self.generation, self.kind, self.file_path, data)
+
+
+class PrefetchTask(QtCore.QRunnable):
+    """
+    依次准备一组预览并放入缓存，被取消或本轮准备的预览超过 budget 字节时停止
+    """
+
+    def __init__(self, items, cache, token, budget, edge):
+        super(PrefetchTask, self).__init__()
+        self.items = items
+        self.cache = cache
+        self.token = token
+        self.budget = budget
+        self.edge = edge
+
+    @QtCore.pyqtSlot()
+    def run(self):
+        QtCore.QThread.currentThread().setPriority(QtCore.QThread.LowestPriority)
+        used = 0
+        for kind, file_path in self.items:
+            if self.token.cancelled or used > self.budget:
+                break
+            key = cache_key(file_path)
+            if key is None or self.cache.contains(kind, key + (self.edge,) if kind in SCALED_KINDS else key):
+                continue
+            try:
+                data = prepare(kind, file_path, self.token, self.cache, self.edge)
+            except (OSError, ValueError):
+                continue
+            if data is not None:
+                used += PREVIEW_SIZES[kind](data)
+        # 线程池中的线程会被复用，恢复默认优先级
+        QtCore.QThread.currentThread().setPriority(QtCore.QThread.NormalPriority)
+
+
+class PreviewSignals(QtCore.QObject):
+    partial = QtCore.pyqtSignal(int, str, str, object)
+    finished = QtCore.pyqtSignal(int, str, str, object)
+    failed = QtCore.pyqtSignal(int, str, str, str)
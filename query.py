@@ -0,0 +1,503 @@
+import fnmatch
+import re
+import time
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:         # Python 3.10 及更早
+    import sre_constants
+    import sre_parse
+
+from trigram import normalize
+
+SIZE_UNITS = {"": 1, "b": 1, "k": 1 << 10, "kb": 1 << 10, "m": 1 << 20, "mb": 1 << 20,
+              "g": 1 << 30, "gb": 1 << 30, "t": 1 << 40, "tb": 1 << 40}
+
+# 记录各字段的位置：(文件名, 所在目录, 大小, 创建时间, 修改时间)
+NAME, DIR, SIZE, CTIME, MTIME = range(5)
+RANGE_FIELDS = {"size": SIZE, "created": CTIME, "modified": MTIME}
+FIELD_COLUMNS = {SIZE: "size", CTIME: "ctime", MTIME: "mtime"}
+
+TOKEN_RE = re.compile(r'[-!]?\w+:"[^"]*"'                   # path:"Program Files"
+                      r'|[-!]?"[^"]*"'                      # "带空格的关键字"
+                      r'|[-!]?/(?:\\.|[^/\\])+/i?(?=\s|$)'   # /正则表达式/ 或 /正则表达式/i
+                      r'|\S+')
+RANGE_RE = re.compile(r"^(>=|<=|>|<|=)?(.+)$")
+SIZE_RE = re.compile(r"^(\d+(?:\.\d+)?)\s*([a-z]*)$", re.IGNORECASE)
+RELATIVE_TIME_RE = re.compile(r"^(\d+)([hdw])$")
+
+
+class QueryError(ValueError):
+    pass
+
+
+def file_extension(file_name):
+    """
+    :return: 小写的扩展名，没有扩展名时返回空字符串
+    """
+    dot = file_name.rfind(".")
+    if dot == -1:
+        return ""
+    return file_name[dot + 1:].lower()
+
+
+def glob_literal(pattern):
+    """
+    :return: 通配符模式中必然出现在文件名里的最长一段字面文本，[...] 字符类中的字符不算
+    """
+    runs = [""]
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        i += 1
+        if char in "*?":
+            runs.append("")
+        elif char == "[":
+            # 与 fnmatch.translate 相同：开头的 ! 与 ] 属于字符类，没有闭合的 [ 是普通字符
+            end = i
+            if end < len(pattern) and pattern[end] == "!":
+                end += 1
+            if end < len(pattern) and pattern[end] == "]":
+                end += 1
+            end = pattern.find("]", end)
+            if end == -1:
+                runs[-1] += char
+            else:
+                i = end + 1
+                runs.append("")
+        else:
+            runs[-1] += char
+    return max(runs, key=len)
+
+
+def regex_literal(pattern):
+    """
+    提取正则表达式中必然出现的最长一段字面文本，无法确定时返回空字符串
+    只取最外层依次出现的普通字符，分组、重复、字符类、分支等一律视为断开
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except re.error:
+        return ""
+    # (?i) 等内联标志改变了匹配方式，字面文本不再可靠
+    if parsed.state.flags & (re.IGNORECASE | re.VERBOSE):
+        return ""
+    runs = [""]
+    for op, value in parsed:
+        if op is sre_constants.LITERAL:
+            runs[-1] += chr(value)
+        else:
+            runs.append("")
+    return max(runs, key=len)
+
+
+class Term(object):
+    """
+    查询表达式节点的基类
+    match 判断完整记录，match_name 只根据文件名判断，无法仅凭文件名判断时返回 True，
+    遍历磁盘时先用 match_name 过滤，只对可能匹配的文件调用 stat
+    """
+
+    cost = 0
+    needs_stat = False          # 是否需要大小、时间等 stat 信息
+    name_only = True            # 是否只依赖文件名
+    literal = None              # (文件名中必然出现的文本, 是否忽略大小写)
+    key = None
+
+    def match(self, record):
+        return self.match_name(record[NAME])
+
+    def match_name(self, file_name):
+        return True
+
+
+class NameTerm(Term):
+    cost = 2
+
+    def __init__(self, text, ignore_case):
+        self.ignore_case = ignore_case
+        self.text = normalize(text) if ignore_case else text
+        self.literal = (self.text, ignore_case)
+        self.key = ("name", self.text, ignore_case)
+
+    def match_name(self, file_name):
+        if self.ignore_case:
+            file_name = normalize(file_name)
+        return self.text in file_name
+
+
+class GlobTerm(Term):
+    cost = 4
+
+    def __init__(self, pattern, ignore_case):
+        self.regex = re.compile(fnmatch.translate(pattern), re.IGNORECASE if ignore_case else 0)
+        self.literal = (glob_literal(pattern), ignore_case)
+        self.key = ("glob", pattern, ignore_case)
+
+    def match_name(self, file_name):
+        return self.regex.match(file_name) is not None
+
+
+class RegexTerm(Term):
+    cost = 5
+
+    def __init__(self, pattern, ignore_case):
+        try:
+            self.regex = re.compile(pattern, re.IGNORECASE if ignore_case else 0)
+        except re.error as e:
+            raise QueryError(f"正则表达式有误：{pattern}（{e}）")
+        self.literal = (regex_literal(pattern), ignore_case)
+        self.key = ("regex", pattern, ignore_case)
+
+    def match_name(self, file_name):
+        return self.regex.search(file_name) is not None
+
+
+class ExtTerm(Term):
+    cost = 0
+
+    def __init__(self, extensions):
+        self.extensions = frozenset(extension.lower() for extension in extensions)
+        self.key = ("ext", self.extensions)
+
+    def match_name(self, file_name):
+        return file_extension(file_name) in self.extensions
+
+
+class PathTerm(Term):
+    """
+    限定所在目录，含通配符时与完整目录路径匹配，否则为目录路径子串
+    """
+
+    cost = 3
+    name_only = False
+
+    def __init__(self, text, ignore_case):
+        self.ignore_case = ignore_case
+        if "*" in text or "?" in text:
+            self.regex = re.compile(fnmatch.translate(text), re.IGNORECASE if ignore_case else 0)
+            self.text = None
+        else:
+            self.regex = None
+            self.text = normalize(text) if ignore_case else text
+        self.key = ("path", text, ignore_case)
+
+    def match(self, record):
+        dir_path = record[DIR]
+        if self.regex is not None:
+            return self.regex.match(dir_path) is not None
+        if self.ignore_case:
+            dir_path = normalize(dir_path)
+        return self.text in dir_path
+
+
+class RangeTerm(Term):
+    """
+    大小或时间范围，low 包含，high 不包含，None 表示不限
+    """
+
+    cost = 1
+    needs_stat = True
+    name_only = False
+
+    def __init__(self, field, low, high):
+        self.field = field
+        self.low = low
+        self.high = high
+        self.key = ("range", field, low, high)
+
+    def match(self, record):
+        value = record[self.field]
+        return (self.low is None or value >= self.low) and (self.high is None or value < self.high)
+
+
+class Not(Term):
+    def __init__(self, child):
+        self.child = child
+        self.cost = child.cost
+        self.needs_stat = child.needs_stat
+        self.name_only = child.name_only
+        self.key = ("not", child.key)
+
+    def match(self, record):
+        return not self.child.match(record)
+
+    def match_name(self, file_name):
+        if not self.child.name_only:
+            return True
+        return not self.child.match_name(file_name)
+
+
+class And(Term):
+    def __init__(self, children):
+        # 代价低的条件排在前面，尽早排除不匹配的记录
+        self.children = sorted(children, key=lambda child: child.cost)
+        self.cost = sum(child.cost for child in children)
+        self.needs_stat = any(child.needs_stat for child in children)
+        self.name_only = all(child.name_only for child in children)
+        self.key = ("and", tuple(child.key for child in self.children))
+
+    def match(self, record):
+        for child in self.children:
+            if not child.match(record):
+                return False
+        return True
+
+    def match_name(self, file_name):
+        for child in self.children:
+            if not child.match_name(file_name):
+                return False
+        return True
+
+
+class Or(Term):
+    def __init__(self, children):
+        self.children = sorted(children, key=lambda child: child.cost)
+        self.cost = max(child.cost for child in children) + 1
+        self.needs_stat = any(child.needs_stat for child in children)
+        self.name_only = all(child.name_only for child in children)
+        self.key = ("or", tuple(child.key for child in self.children))
+
+    def match(self, record):
+        for child in self.children:
+            if child.match(record):
+                return True
+        return False
+
+    def match_name(self, file_name):
+        for child in self.children:
+            if child.match_name(file_name):
+                return True
+        return False
+
+
+def any_of(terms):
+    """
+    合并多个并列条件，全部为扩展名条件时合并为一个扩展名集合
+    """
+    if len(terms) == 1:
+        return terms[0]
+    if all(isinstance(term, ExtTerm) for term in terms):
+        return ExtTerm(set().union(*(term.extensions for term in terms)))
+    return Or(terms)
+
+
+def implies(term, other):
+    """
+    判断满足 term 的记录是否必然满足 other
+    """
+    if term.key == other.key:
+        return True
+    if isinstance(term, NameTerm) and isinstance(other, NameTerm):
+        return term.ignore_case == other.ignore_case and other.text in term.text
+    if isinstance(term, ExtTerm) and isinstance(other, ExtTerm):
+        return term.extensions <= other.extensions
+    return False
+
+
+class Query(object):
+    """
+    搜索关键字解析并编译后的查询
+    语法：
+        空格分隔的条件须同时满足，"OR" 或单独的 "|" 分隔的条件组满足其一，"NOT"、"-"、"!" 前缀表示排除
+        abc             文件名包含 abc
+        "a b"           文件名包含 a b，引号内不解析语法
+        *.txt  a?c      通配符，与完整文件名匹配
+        /正则/ /正则/i   正则表达式，后缀 i 表示忽略大小写
+        .jpg|.png       扩展名为其一（不区分大小写），与 ext:jpg,png 相同
+        type:image      PreviewArea.support_formats 中某一类别的全部扩展名
+        path:src        所在目录包含 src，含通配符时与完整目录路径匹配
+        size:>10M  size:1k..2m  size:0
+        modified:2022-03-08  modified:>=2022-01  modified:2022-01-01..2022-03-01
+        modified:today  modified:yesterday  modified:7d（最近 7 天，另有 h 小时、w 周），created: 同理
+                        7d 与日期一样表示一段时间（7 天前至今），modified:<7d 为 7 天之前，modified:30d..7d 为 30 天内
+    每个查询只解析一次，正则预先编译，并列条件按代价从低到高排列，
+    另外提取出必然出现的字面文本、扩展名与范围条件，供索引直接缩小候选范围
+    """
+
+    def __init__(self, text, ignore_case=False, categories=None):
+        self.text = text
+        self.ignore_case = ignore_case
+        self.categories = categories or {}
+        self.groups = self.parse(text)
+        if len(self.groups) == 1:
+            self.root = And(self.groups[0])
+        elif all(len(group) == 1 and isinstance(group[0], ExtTerm) for group in self.groups):
+            self.root = any_of([group[0] for group in self.groups])
+            self.groups = [[self.root]]
+        else:
+            self.root = Or([And(group) for group in self.groups])
+        self.needs_stat = self.root.needs_stat
+
+        required = self.groups[0] if len(self.groups) == 1 else []
+        extension_sets = [term.extensions for term in required if isinstance(term, ExtTerm)]
+        self.extensions = frozenset.intersection(*extension_sets) if extension_sets else None
+        self.literals = [term.literal for term in required if term.literal is not None and term.literal[0]]
+        self.rank_text = normalize(max((text for text, ignore_case in self.literals), key=len, default=""))
+        # 各条件组中必然出现的文本，条件组之间为"或"的关系
+        self.literal_groups = [[term.literal for term in group if term.literal is not None and term.literal[0]]
+                               for group in self.groups]
+        self.bounds = [(FIELD_COLUMNS[term.field], term.low, term.high)
+                       for term in required if isinstance(term, RangeTerm)]
+
+    def match(self, record):
+        """
+        :param record: (文件名, 所在目录, 大小, 创建时间, 修改时间)
+        """
+        return self.root.match(record)
+
+    def match_name(self, file_name):
+        """
+        只根据文件名做必要条件判断，返回 False 的文件必然不匹配
+        """
+        return self.root.match_name(file_name)
+
+    def rank(self, record):
+        """
+        相关度排序键，越小越靠前：文件名与关键字完全相同、以关键字开头、关键字位于词首、其它，同类中文件名短的在前
+        """
+        file_name = record[NAME]
+        kind = 3
+        if self.rank_text:
+            folded = normalize(file_name)
+            position = folded.find(self.rank_text)
+            if folded == self.rank_text:
+                kind = 0
+            elif position == 0:
+                kind = 1
+            elif position > 0 and not folded[position - 1].isalnum():
+                kind = 2
+        return kind, len(file_name), file_name
+
+    def refine_filter(self, previous):
+        """
+        本次搜索结果必然是 previous 搜索结果的子集时，返回在上次结果中筛选所用的判断函数，否则返回 None
+        判断函数只检查新增的条件，新增条件不能依赖 stat 信息
+        """
+        if len(self.groups) != 1 or len(previous.groups) != 1:
+            return None
+        terms, previous_terms = self.groups[0], previous.groups[0]
+        for previous_term in previous_terms:
+            if not any(implies(term, previous_term) for term in terms):
+                return None
+        previous_keys = {term.key for term in previous_terms}
+        extra = [term for term in terms if term.key not in previous_keys]
+        if any(term.needs_stat for term in extra):
+            return None
+        return And(extra).match
+
+    def parse(self, text):
+        """
+        :return: 条件组列表，组内条件须同时满足，各组满足其一
+        """
+        groups = [[]]
+        negate = False
+        for token in TOKEN_RE.findall(text):
+            if token in ("|", "OR"):
+                if groups[-1]:
+                    groups.append([])
+                continue
+            if token == "AND":
+                continue
+            if token == "NOT":
+                negate = not negate
+                continue
+            if len(token) > 1 and token[0] in "-!":
+                negate = not negate
+                token = token[1:]
+            term = self.parse_factor(token)
+            groups[-1].append(Not(term) if negate else term)
+            negate = False
+        if not groups[-1] and len(groups) > 1:
+            groups.pop()
+        return groups
+
+    def parse_factor(self, token):
+        """
+        不含引号与正则的词中，"|" 分隔的各部分满足其一，如 .jpg|.png
+        """
+        if token[0] in '"/' or ':"' in token:
+            return self.parse_atom(token)
+        parts = [part for part in token.split("|") if part]
+        if not parts:
+            return NameTerm(token, self.ignore_case)
+        return any_of([self.parse_atom(part) for part in parts])
+
+    def parse_atom(self, atom):
+        if len(atom) > 1 and atom[0] == '"' and atom[-1] == '"':
+            return NameTerm(atom[1:-1], self.ignore_case)
+        if len(atom) > 2 and atom[0] == "/" and (atom.endswith("/") or atom.endswith("/i")):
+            return RegexTerm(atom[1:atom.rindex("/")], self.ignore_case or atom.endswith("/i"))
+        key, colon, value = atom.partition(":")
+        if colon and value:
+            if len(value) > 1 and value[0] == '"' and value[-1] == '"':
+                value = value[1:-1]
+            if key == "path":
+                return PathTerm(value, self.ignore_case)
+            if key == "ext":
+                return ExtTerm(extension.lstrip(".") for extension in value.split(","))
+            if key == "type":
+                if value not in self.categories:
+                    raise QueryError(f"未知的文件类别：{value}，可用类别：{'、'.join(self.categories)}")
+                return ExtTerm(self.categories[value])
+            if key == "size":
+                return self.parse_range(SIZE, value, parse_size)
+            if key in RANGE_FIELDS:
+                return self.parse_range(RANGE_FIELDS[key], value, parse_time)
+        if len(atom) > 1 and atom[0] == "." and "*" not in atom and "?" not in atom:
+            return ExtTerm([atom[1:]])
+        if "*" in atom or "?" in atom:
+            return GlobTerm(atom, self.ignore_case)
+        return NameTerm(atom, self.ignore_case)
+
+    @staticmethod
+    def parse_range(field, value, parse_value):
+        """
+        parse_value 返回取值所覆盖的区间 [start, end)，如某一天的起止时间，大小则为 [n, n + 1)
+        """
+        if ".." in value:
+            low, high = value.split("..", 1)
+            return RangeTerm(field, parse_value(low)[0] if low else None, parse_value(high)[1] if high else None)
+        operator, value = RANGE_RE.match(value).groups()
+        start, end = parse_value(value)
+        if operator == ">":
+            return RangeTerm(field, end, None)
+        if operator == ">=":
+            return RangeTerm(field, start, None)
+        if operator == "<":
+            return RangeTerm(field, None, start)
+        if operator == "<=":
+            return RangeTerm(field, None, end)
+        return RangeTerm(field, start, end)
+
+
+def parse_size(value):
+    match = SIZE_RE.match(value)
+    if match is None or match.group(2).lower() not in SIZE_UNITS:
+        raise QueryError(f"无法识别的大小：{value}，示例：size:>10M")
+    size = int(float(match.group(1)) * SIZE_UNITS[match.group(2).lower()])
+    return size, size + 1
+
+
+def parse_time(value):
+    today = time.mktime(time.strptime(time.strftime("%Y-%m-%d"), "%Y-%m-%d"))
+    if value == "today":
+        return int(today), int(today) + 86400
+    if value == "yesterday":
+        return int(today) - 86400, int(today)
+    match = RELATIVE_TIME_RE.match(value)
+    if match is not None:
+        seconds = int(match.group(1)) * {"h": 3600, "d": 86400, "w": 7 * 86400}[match.group(2)]
+        # 以当前时刻为上限，各比较符都有可用的边界
+        now = int(time.time()) + 1
+        return now - seconds, now
+    for time_format, field in (("%Y-%m-%d", 2), ("%Y-%m", 1), ("%Y", 0)):
+        try:
+            start = time.strptime(value, time_format)
+        except ValueError:
+            continue
+        # 结束于下一天、下一月或下一年的开始，mktime 会自动进位
+        end = list(start)
+        end[field] += 1
+        return int(time.mktime(start)), int(time.mktime(tuple(end)))
+    raise QueryError(f"无法识别的时间：{value}，示例：modified:2022-03-08、modified:>=2022-01、modified:7d")
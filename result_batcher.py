@@ -0,0 +1,113 @@
+import heapq
+import threading
+import time
+from operator import itemgetter
+
+from instrumentation import NULL_STATS
+
+
+class ResultBatcher(object):
+    """
+    把搜索线程找到的结果攒成批次交给界面
+    攒满 batch_size 行或距上次交付超过 interval 秒时交付一批，批次一经交付即归界面所有，
+    搜索线程不再持有或清空它，因此每条结果恰好到达界面一次
+    已交付但界面尚未处理的批次最多 max_pending 个，超过时搜索线程等待，界面跟不上时自然减速
+    :param stats: 可选的 SearchStats，记录交付批次数与等待界面处理的最大批次数
+    :param token: 可选的 CancellationToken，搜索取消后不再等待界面，放弃尚未交付的结果
+    """
+
+    def __init__(self, emit, batch_size=2000, interval=0.1, max_pending=8, stats=None, token=None):
+        self.emit = emit
+        self.batch_size = batch_size
+        self.interval = interval
+        self.batch = []
+        self.last_emit_time = time.monotonic()
+        self.slots = threading.Semaphore(max_pending)
+        self.closed = False
+        # 分别只由搜索线程与界面线程递增，二者之差为等待界面处理的批次数
+        self.emitted = 0
+        self.done = 0
+        self.stats = stats if stats is not None else NULL_STATS
+        self.token = token
+
+    def add(self, rows):
+        """
+        加入若干行，满足条件时交付，rows 为空时也会检查是否到了交付时间
+        """
+        self.batch.extend(rows)
+        if len(self.batch) >= self.batch_size or time.monotonic() - self.last_emit_time >= self.interval:
+            self.flush()
+
+    def flush(self):
+        if not self.batch:
+            return
+        while not self.slots.acquire(timeout=0.1):
+            if self.abandoned():
+                return
+        if self.closed:
+            return
+        batch, self.batch = self.batch, []
+        self.emitted += 1
+        self.stats.maximum("queue_depth", self.emitted - self.done)
+        self.emit(batch)
+        self.last_emit_time = time.monotonic()
+
+    def abandoned(self):
+        """
+        界面已关闭或搜索已取消时，等待交付名额的搜索线程直接返回
+        """
+        return self.closed or (self.token is not None and self.token.cancelled)
+
+    def batch_done(self):
+        """
+        界面处理完一批后调用，归还一个交付名额
+        """
+        self.done += 1
+        self.slots.release()
+
+    def close(self):
+        """
+        界面不再接收结果（如窗口关闭）时调用，正在等待的搜索线程会放弃剩余结果
+        """
+        self.closed = True
+
+
+class TopResults(object):
+    """
+    只保留按 rank 排序最靠前的 k 条结果
+    结果先攒在列表中，超过 2k 条时用 heapq.nsmallest 裁剪回 k 条，总耗时约为 O(n log k)
+    """
+
+    def __init__(self, k, rank):
+        self.k = k
+        self.rank = rank
+        self.items = []
+        self.total = 0
+        # 上次裁剪后保留的 k 条是否全是最高类别
+        self.exact_full = False
+
+    def add(self, rows):
+        self.items.extend((self.rank(row), row) for row in rows)
+        self.total += len(rows)
+        if len(self.items) > 2 * self.k:
+            self.prune()
+
+    def prune(self):
+        self.items = heapq.nsmallest(self.k, self.items, key=itemgetter(0))
+        self.exact_full = len(self.items) >= self.k and self.items[-1][0][0] == 0
+
+    def saturated(self):
+        """
+        已有 k 条最高类别（rank 首项为 0）的结果时，后续结果不可能排到前面，可以提前结束搜索
+        只使用 add 中裁剪时的判断，不额外排序，因此最多多收集 k 条结果才会发现
+        只有 k 较小时才可能凑满 k 条完全匹配的文件名，默认的上限很大，实际总会搜索完所有路径
+        """
+        return self.exact_full
+
+    def rows(self):
+        self.prune()
+        return [row for key, row in self.items]
+
+    @property
+    def truncated(self):
+        return self.total > self.k
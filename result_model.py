@@ -0,0 +1,290 @@
+import heapq
+from array import array
+from itertools import compress, count
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import Qt, QModelIndex
+
+from icon_cache import IconCache
+from instrumentation import NULL_STATS
+from result_store import ResultStore
+from time_format import TimeFormatter, FULL
+
+NAME, PATH, CTIME, MTIME, SIZE = range(5)
+TIME_COLUMNS = (CTIME, MTIME)
+
+
+class ResultModel(QtCore.QAbstractTableModel):
+    """
+    搜索结果模型，结果紧凑地存放在 ResultStore 中，不为每个单元格创建 QTableWidgetItem
+    显示文本、提示与图标只在视图请求可见行时由 data() 生成，图标经 IconCache 按扩展名共用
+    结果按到达顺序存放，排序只计算行号排列：排列在后台线程中按列的原始值（时间与大小为整数）计算，
+    按 (列, 方向) 缓存，新结果到达后并入已有排列而不是重新排序，算好后才替换视图中的顺序，
+    尚未并入排列的新结果暂时显示在末尾
+    """
+
+    headers = ["文件名", "路径", "创建时间", "修改时间", "大小"]
+
+    def __init__(self, parent=None, icon_cache_size=512, time_style=FULL):
+        super(ResultModel, self).__init__(parent)
+        self.store = ResultStore()
+        self.icon_cache = IconCache(icon_cache_size)
+        self.time_formatter = TimeFormatter(time_style)
+        # 当前搜索的 SearchStats，记录图标查找耗时
+        self.stats = NULL_STATS
+        self.sort_spec = None           # 当前排序的 (列, 方向)，None 表示按到达顺序
+        self.order = None               # 视图行号到存放行号的排列，只覆盖前 len(order) 行
+        self.permutations = {}          # (列, 方向) -> 已算好的排列
+        self.inverses = {}              # (列, 方向) -> 排列的逆排列（存放行号到视图行号），由排序任务一并算好
+        # 结果被清空或筛选后递增，此前开始的排序任务的结果作废
+        self.generation = 0
+        self.sort_running = False
+        self.sort_task = None
+        self.sort_pool = QtCore.QThreadPool(self)
+        self.sort_pool.setMaxThreadCount(1)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.store)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.headers[section]
+        return None
+
+    def storage_row(self, row):
+        """
+        视图中的行号转换为存放的行号
+        """
+        order = self.order
+        if order is not None and row < len(order):
+            return order[row]
+        return row
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        column = index.column()
+        if role == Qt.DisplayRole or role == Qt.ToolTipRole:
+            value = self.column_value(column, self.storage_row(index.row()))
+            if column in TIME_COLUMNS:
+                # 提示中总是显示完整时间
+                return self.time_formatter.format(value, FULL if role == Qt.ToolTipRole else None)
+            if column == SIZE:
+                return format_size(value)
+            return value
+        if role == Qt.DecorationRole and column == NAME:
+            with self.stats.timer("icon"):
+                return self.icon_cache.icon(self.file_path(index.row()))
+        if role == Qt.TextAlignmentRole and column == SIZE:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        return None
+
+    def column_value(self, column, row):
+        """
+        :param row: 存放的行号
+        :return: 该列的原始值，时间与大小为整数
+        """
+        return self.sort_key(column)(row)
+
+    def sort_key(self, column):
+        """
+        :return: 以存放的行号为参数、返回该列原始值的函数
+        """
+        store = self.store
+        return (store.name, store.path, store.ctimes.__getitem__, store.mtimes.__getitem__,
+                store.sizes.__getitem__)[column]
+
+    def append_rows(self, rows):
+        """
+        以一次 beginInsertRows 批量追加多行，正在排序时在后台把新行并入排列
+        :param rows: (文件名, 所在目录, 大小, 创建时间, 修改时间) 列表
+        """
+        if not rows:
+            return
+        first = self.rowCount()
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        self.store.append(rows)
+        self.endInsertRows()
+        self.schedule_sort()
+
+    def clear(self):
+        self.beginResetModel()
+        self.store = ResultStore()
+        self.order = None
+        self.permutations = {}
+        self.inverses = {}
+        self.generation += 1
+        self.endResetModel()
+
+    def filter_rows(self, match):
+        """
+        只保留符合 match 的行，用于在上次结果中筛选，传给 match 的记录只有文件名与所在目录
+        已算好的排列同样只保留这些行，筛选后无需重新排序
+        """
+        self.beginResetModel()
+        store = self.store
+        keep = [row for row in range(len(store)) if match((store.name(row), store.dir_path(row), None, None, None))]
+        new_rows = {old_row: new_row for new_row, old_row in enumerate(keep)}
+        self.store = store.subset(keep)
+        self.permutations = {spec: [new_rows[row] for row in permutation if row in new_rows]
+                             for spec, permutation in self.permutations.items()}
+        # 筛选后的逆排列要到下次排序任务才重新计算，此前由 set_order 在排列中查找
+        self.inverses = {}
+        if self.order is not None:
+            self.order = self.permutations.get(self.sort_spec)
+        self.generation += 1
+        self.endResetModel()
+        self.schedule_sort()
+
+    def set_time_style(self, style):
+        self.time_formatter.set_style(style)
+        if self.rowCount():
+            for column in TIME_COLUMNS:
+                self.dataChanged.emit(self.index(0, column), self.index(self.rowCount() - 1, column))
+
+    def file_name(self, row):
+        return self.store.name(self.storage_row(row))
+
+    def file_path(self, row):
+        return self.store.path(self.storage_row(row))
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        """
+        由视图在点击表头时调用，已缓存的排列立即生效，否则保持当前顺序直到后台算好
+        """
+        if column < 0:
+            self.sort_spec = None
+            self.set_order(None)
+            return
+        self.sort_spec = (column, order)
+        permutation = self.permutations.get(self.sort_spec)
+        if permutation is not None:
+            self.set_order(permutation, self.inverses.get(self.sort_spec))
+        self.schedule_sort()
+
+    def schedule_sort(self):
+        """
+        当前排序的排列尚未覆盖全部行时在后台计算，同一时间只有一个排序任务
+        """
+        if self.sort_spec is None or self.sort_running:
+            return
+        base = self.permutations.get(self.sort_spec, [])
+        if len(base) == self.rowCount():
+            return
+        column, order = self.sort_spec
+        task = SortTask(self.generation, self.sort_spec, self.sort_key(column), base, len(base), self.rowCount(),
+                        order == Qt.DescendingOrder)
+        task.signals.finished.connect(self.sort_finished)
+        self.sort_running = True
+        self.sort_task = task
+        self.sort_pool.start(task)
+
+    def sort_finished(self, generation, spec, permutation, inverse):
+        self.sort_running = False
+        self.sort_task = None
+        if generation == self.generation:
+            self.permutations[spec] = permutation
+            self.inverses[spec] = inverse
+            if spec == self.sort_spec:
+                self.set_order(permutation, inverse)
+        # 计算期间可能又到达了新结果或换了排序列
+        self.schedule_sort()
+
+    def set_order(self, order, inverse=None):
+        """
+        替换视图中的顺序，并让选中项等持久索引继续指向原来的结果
+        :param inverse: order 的逆排列，排序任务已在后台算好；为 None 时只在 order 中查找持久索引所在的行
+        """
+        if order is self.order:
+            return
+        self.layoutAboutToBeChanged.emit()
+        old_indexes = self.persistentIndexList()
+        storage_rows = [self.storage_row(index.row()) for index in old_indexes]
+        self.order = order
+        if old_indexes:
+            if inverse is not None:
+                view_rows = {storage_row: inverse[storage_row] if storage_row < len(inverse) else storage_row
+                             for storage_row in storage_rows}
+            else:
+                view_rows = find_view_rows(order, set(storage_rows))
+            self.changePersistentIndexList(old_indexes, [self.index(view_rows[storage_row], index.column())
+                                                         for storage_row, index in zip(storage_rows, old_indexes)])
+        self.layoutChanged.emit()
+
+
+class SortTask(QtCore.QRunnable):
+    """
+    在后台线程中计算排列
+    key 读取结果模型中的一列，ResultStore 只会在末尾追加（清空与筛选时换成新的），因此可以安全读取前 end 行
+    """
+
+    def __init__(self, generation, spec, key, base, start, end, descending):
+        super(SortTask, self).__init__()
+        self.generation = generation
+        self.spec = spec
+        self.key = key
+        self.base = base
+        self.start = start
+        self.end = end
+        self.descending = descending
+        self.signals = SortSignals()
+
+    @QtCore.pyqtSlot()
+    def run(self):
+        permutation = merge_permutation(self.key, self.base, self.start, self.end, self.descending)
+        # 逆排列也在这里计算，界面线程换上新排列时只需查表
+        self.signals.finished.emit(self.generation, self.spec, permutation, inverse_permutation(permutation))
+
+
+class SortSignals(QtCore.QObject):
+    finished = QtCore.pyqtSignal(int, object, object, object)
+
+
+def format_size(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def inverse_permutation(permutation):
+    """
+    :return: 存放行号到视图行号的 array，在排序任务的后台线程中计算
+    """
+    inverse = array("q", bytes(8 * len(permutation)))
+    for view_row, storage_row in enumerate(permutation):
+        inverse[storage_row] = view_row
+    return inverse
+
+
+def find_view_rows(order, storage_rows):
+    """
+    在排列中查找给定的存放行号，不为全部行建立逆排列，只在没有现成的逆排列时使用（如刚筛选过结果）
+    由 map 与 compress 在 C 中扫描一遍排列，持久索引很多时也只扫描一遍
+    :param order: 视图行号到存放行号的排列，只覆盖前 len(order) 行，None 表示按到达顺序
+    :return: {存放的行号: 视图中的行号}
+    """
+    view_rows = {storage_row: storage_row for storage_row in storage_rows}
+    if order is not None:
+        for view_row in compress(count(), map(storage_rows.__contains__, order)):
+            view_rows[order[view_row]] = view_row
+    return view_rows
+
+
+def merge_permutation(key, base, start, end, descending):
+    """
+    把第 start 至 end - 1 行排序后并入已排好的 base，得到前 end 行的排列
+    base 是前 start 行按同一 key、同一方向排好的排列，值相同的行保持到达的先后顺序
+    """
+    new_rows = sorted(range(start, end), key=key, reverse=descending)
+    if not base:
+        return new_rows
+    return list(heapq.merge(base, new_rows, key=key, reverse=descending))
@@ -0,0 +1,94 @@
+import os
+from array import array
+
+
+class ResultStore(object):
+    """
+    紧凑存放搜索结果，每条结果不再是一组 Python 字符串与整数对象：
+    所在目录只保存一次，结果中记录目录编号；文件名以 UTF-8 依次存入同一个 bytearray，按偏移量取出；
+    目录编号、时间与大小存放在 array 中。完整路径在需要时才拼接
+    只在末尾追加，其它线程可以安全读取已有的行
+    """
+
+    def __init__(self):
+        self.dir_ids = {}
+        self.dirs = []
+        self.dir_column = array("I")
+        self.name_pool = bytearray()
+        self.name_offsets = array("Q", [0])     # 第 i 个文件名位于 name_offsets[i] 与 name_offsets[i + 1] 之间
+        self.sizes = array("q")
+        self.ctimes = array("q")
+        self.mtimes = array("q")
+
+    def __len__(self):
+        return len(self.dir_column)
+
+    def append(self, records):
+        """
+        :param records: (文件名, 所在目录, 大小, 创建时间, 修改时间) 列表
+        """
+        dir_ids = self.dir_ids
+        dirs = self.dirs
+        dir_column = []
+        names = []
+        offsets = []
+        offset = self.name_offsets[-1]
+        for file_name, dir_path, size, ctime, mtime in records:
+            dir_id = dir_ids.get(dir_path)
+            if dir_id is None:
+                dir_id = dir_ids[dir_path] = len(dirs)
+                dirs.append(dir_path)
+            dir_column.append(dir_id)
+            # 无法按 UTF-8 解码的文件名以 surrogateescape 原样保存其字节
+            name = file_name.encode("utf-8", "surrogateescape")
+            names.append(name)
+            offset += len(name)
+            offsets.append(offset)
+        self.name_pool += b"".join(names)
+        self.sizes.extend(record[2] for record in records)
+        self.ctimes.extend(record[3] for record in records)
+        self.mtimes.extend(record[4] for record in records)
+        self.name_offsets.extend(offsets)
+        # 行数以 dir_column 为准，最后追加，其它线程读到的行总是完整的
+        self.dir_column.extend(dir_column)
+
+    def name(self, row):
+        return self.name_pool[self.name_offsets[row]:self.name_offsets[row + 1]].decode("utf-8", "surrogateescape")
+
+    def dir_path(self, row):
+        return self.dirs[self.dir_column[row]]
+
+    def path(self, row):
+        return os.path.join(self.dirs[self.dir_column[row]], self.name(row))
+
+    def record(self, row):
+        """
+        :return: (文件名, 所在目录, 大小, 创建时间, 修改时间)
+        """
+        return self.name(row), self.dir_path(row), self.sizes[row], self.ctimes[row], self.mtimes[row]
+
+    def subset(self, rows):
+        """
+        :return: 只含 rows 中各行的新 ResultStore，目录表原样共用
+        """
+        store = ResultStore()
+        store.dir_ids = self.dir_ids
+        store.dirs = self.dirs
+        names = [self.name_pool[self.name_offsets[row]:self.name_offsets[row + 1]] for row in rows]
+        offset = 0
+        for name in names:
+            offset += len(name)
+            store.name_offsets.append(offset)
+        store.name_pool = bytearray(b"".join(names))
+        store.sizes = array("q", (self.sizes[row] for row in rows))
+        store.ctimes = array("q", (self.ctimes[row] for row in rows))
+        store.mtimes = array("q", (self.mtimes[row] for row in rows))
+        store.dir_column = array("I", (self.dir_column[row] for row in rows))
+        return store
+
+    def nbytes(self):
+        """
+        行数据占用的字节数，不含目录表
+        """
+        return (len(self.name_pool) + sum(column.itemsize * len(column) for column in
+                (self.dir_column, self.name_offsets, self.sizes, self.ctimes, self.mtimes)))
@@ -0,0 +1,207 @@
+import argparse
+import json
+import os
+import sys
+from contextlib import closing
+
+from exclusion import ExclusionRules
+from file_index import FileIndex
+from instrumentation import NULL_STATS
+from query import Query, QueryError
+from result_batcher import TopResults
+from traversal import ParallelWalker, CancellationToken, DEFAULT_WORKERS, unique_roots
+
+
+class SearchJob(object):
+    """
+    一次搜索，不依赖 Qt，图形界面的搜索线程与命令行共用
+    可同时搜索多个路径，重叠的路径只搜索一次，已建立索引的路径查询索引，其余路径一起遍历磁盘，
+    结果合并为 (文件名, 所在目录, 大小, 创建时间, 修改时间) 的流
+    :param paths: 搜索路径或搜索路径列表
+    :param max_results: 最多产出的结果数，达到后立即停止搜索，0 表示不限制
+    :param ranked: 为 True 时不按找到的顺序产出，而是搜索结束后一次产出按 Query.rank 排序的前 max_results 条
+    :param stats: 可选的 SearchStats，记录各阶段的计数与耗时
+    :param exclusions: 可选的 ExclusionRules，遍历磁盘时跳过被排除的目录
+    """
+
+    def __init__(self, query, paths, file_index=None, workers=DEFAULT_WORKERS, max_results=0, ranked=False,
+                 token=None, stats=None, exclusions=None):
+        self.query = query
+        if paths is None:
+            paths = ["/"]
+        elif isinstance(paths, str):
+            paths = [paths]
+        self.paths = unique_roots(paths)
+        self.file_index = file_index
+        self.workers = workers
+        self.max_results = max_results
+        self.ranked = ranked and max_results > 0
+        self.token = token if token is not None else CancellationToken()
+        self.stats = stats if stats is not None else NULL_STATS
+        self.exclusions = exclusions
+        self.completed = False
+        self.limit_reached = False
+
+    @property
+    def cancelled(self):
+        return self.token.cancelled
+
+    def cancel(self):
+        self.token.cancel()
+
+    def batches(self):
+        """
+        :return: 生成器，每次产出一批结果，可能为空列表（遍历磁盘时用于让调用方及时处理已攒下的结果）
+        """
+        source = self.search_all()
+        with closing(source):
+            if self.ranked:
+                yield from self.collect_top(source)
+            else:
+                yield from self.collect(source)
+        # 被截断的结果不能作为下次细化搜索的基础
+        self.completed = not self.cancelled and not self.limit_reached
+        self.stats.finish()
+
+    def records(self):
+        """
+        :return: 生成器，逐条产出结果
+        """
+        for rows in self.batches():
+            yield from rows
+
+    def collect(self, source):
+        count = 0
+        for rows in source:
+            if self.cancelled:
+                return
+            if self.max_results and count + len(rows) > self.max_results:
+                rows = rows[:self.max_results - count]
+                self.limit_reached = True
+            count += len(rows)
+            self.stats.count("matches", len(rows))
+            yield rows
+            if self.limit_reached:
+                return
+
+    def collect_top(self, source):
+        top = TopResults(self.max_results, self.query.rank)
+        for rows in source:
+            if self.cancelled:
+                return
+            top.add(rows)
+            self.stats.count("matches", len(rows))
+            if top.saturated():
+                break
+        self.limit_reached = top.truncated
+        yield top.rows()
+
+    def search_all(self):
+        # 先查询索引，结果很快出现，再遍历未建立索引的路径
+        walk_paths = []
+        for path in self.paths:
+            if self.file_index is not None and self.file_index.covers(path):
+                yield from self.search_index(path)
+            else:
+                walk_paths.append(path)
+        if walk_paths:
+            yield from self.search_file(walk_paths)
+
+    def search_index(self, path):
+        with closing(self.file_index.search(self.query, path, stats=self.stats, token=self.token)) as batches:
+            yield from batches
+
+    def search_file(self, paths):
+        walker = ParallelWalker(workers=self.workers, stats=self.stats, exclusions=self.exclusions)
+        # 先只凭文件名排除，再对 stat 后的完整记录做精确判断
+        with closing(walker.walk(paths, self.query.match_name, self.token)) as batches:
+            for rows in batches:
+                yield [row for row in rows if self.query.match(row)]
+
+
+def write_jsonl(stream, rows):
+    for file_name, dir_path, size, ctime, mtime in rows:
+        stream.write(json.dumps({"name": file_name, "path": os.path.join(dir_path, file_name), "size": size,
+                                 "ctime": ctime, "mtime": mtime}, ensure_ascii=False))
+        stream.write("\n")
+
+
+def write_paths(separator):
+    def write(stream, rows):
+        for file_name, dir_path, size, ctime, mtime in rows:
+            stream.write(os.path.join(dir_path, file_name))
+            stream.write(separator)
+    return write
+
+
+OUTPUT_FORMATS = {
+    "jsonl": write_jsonl,
+    "null": write_paths("\0"),
+    "lines": write_paths("\n"),
+}
+
+
+def main(argv=None):
+    """
+    命令行入口，结果按批写到标准输出，每批写完立即 flush，便于管道下游边搜边处理
+    """
+    parser = argparse.ArgumentParser(description="不启动图形界面，按与 File Search 相同的语法搜索文件")
+    parser.add_argument("query", help="搜索关键字，语法与图形界面相同")
+    parser.add_argument("-p", "--path", action="append", help="搜索路径，可多次指定，默认为 /")
+    parser.add_argument("-i", "--ignore-case", action="store_true", help="忽略大小写")
+    parser.add_argument("-f", "--format", choices=sorted(OUTPUT_FORMATS), default="lines",
+                        help="输出格式：每行一个路径（lines）、以 NUL 分隔的路径（null）或 JSON Lines（jsonl）")
+    parser.add_argument("-n", "--max-results", type=int, default=0, help="最多输出的结果数，0 表示不限制")
+    parser.add_argument("--ranked", action="store_true", help="按相关度输出前 --max-results 条结果")
+    parser.add_argument("--no-index", action="store_true", help="不使用索引，直接遍历磁盘")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="遍历磁盘的线程数")
+    parser.add_argument("--exclude", action="append", default=[], metavar="GLOB",
+                        help="排除与完整路径匹配的目录与文件，可多次指定")
+    parser.add_argument("--exclude-dir", action="append", default=[], metavar="NAME", help="按名称排除目录，可多次指定")
+    parser.add_argument("-x", "--one-file-system", action="store_true", help="不进入其它文件系统")
+    parser.add_argument("--no-default-excludes", action="store_true",
+                        help="不使用已保存的排除规则，也不跳过虚拟与网络文件系统")
+    args = parser.parse_args(argv)
+
+    try:
+        query = Query(args.query, args.ignore_case)
+    except QueryError as e:
+        print(f"搜索语法有误：{e}", file=sys.stderr)
+        return 2
+    if args.no_default_excludes:
+        exclusions = ExclusionRules([], [], skip_pseudo=False, skip_network=False)
+    else:
+        exclusions = ExclusionRules.load()
+    exclusions.dir_names.extend(args.exclude_dir)
+    exclusions.path_globs.extend(args.exclude)
+    exclusions.one_filesystem = exclusions.one_filesystem or args.one_file_system
+    file_index = None
+    if not args.no_index:
+        file_index = FileIndex()
+
+    job = SearchJob(query, args.path or ["/"], file_index, args.workers, args.max_results, args.ranked,
+                    exclusions=exclusions)
+    write = OUTPUT_FORMATS[args.format]
+    stdout = sys.stdout
+    # 无法按 UTF-8 解码的文件名原样输出其字节
+    stdout.reconfigure(errors="surrogateescape")
+    try:
+        for rows in job.batches():
+            if rows:
+                write(stdout, rows)
+                stdout.flush()
+    except BrokenPipeError:
+        # 下游（如 head）提前退出时安静结束
+        job.cancel()
+        os.dup2(os.open(os.devnull, os.O_WRONLY), stdout.fileno())
+        return 0
+    except KeyboardInterrupt:
+        job.cancel()
+        return 130
+    if job.limit_reached:
+        print(f"已达到{args.max_results}个结果上限", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+import os
+
+import pytest
+
+import exclusion
+from exclusion import ExclusionRules, PathFilter, read_mounts
+
+MOUNTINFO = r"""22 1 8:1 / / rw,relatime shared:1 - ext4 /dev/sda1 rw
+23 22 0:21 / /proc rw,nosuid,nodev,noexec,relatime shared:5 - proc proc rw
+24 22 0:22 / /sys rw,nosuid,nodev,noexec,relatime shared:6 - sysfs sysfs rw
+25 22 0:5 / /dev rw,nosuid shared:2 - devtmpfs udev rw,size=8000000k
+40 22 0:45 / /mnt/my\040share rw,relatime shared:30 - cifs //server/share rw,vers=3.0
+41 22 0:46 / /mnt/nfs rw,relatime - nfs4 server:/export rw
+42 22 8:2 / /home/user/\344\270\255\346\226\207 rw,relatime shared:31 - ext4 /dev/sda2 rw
+43 22 0:47 / /run/user/1000/gvfs rw,nosuid,nodev,relatime shared:32 - fuse.gvfsd-fuse gvfsd-fuse rw
+44 22 0:48 / /mnt/odd rw,relatime shared:33 master:1 propagate_from:1 - tmpfs tmpfs rw
+broken line without separator
+"""
+
+
+@pytest.fixture
+def mountinfo(tmp_path):
+    file_path = tmp_path / "mountinfo"
+    file_path.write_text(MOUNTINFO, encoding="utf-8")
+    return str(file_path)
+
+
+def test_read_mounts_parses_types_and_optional_fields(mountinfo):
+    mounts = dict(read_mounts(mountinfo))
+    assert mounts["/"] == "ext4"
+    assert mounts["/proc"] == "proc"
+    assert mounts["/sys"] == "sysfs"
+    assert mounts["/run/user/1000/gvfs"] == "fuse.gvfsd-fuse"
+    # 可选字段有多个时仍按 "-" 找到类型
+    assert mounts["/mnt/odd"] == "tmpfs"
+    assert len(mounts) == 9
+
+
+def test_read_mounts_unescapes_octal(mountinfo):
+    mount_points = [mount_point for mount_point, fs_type in read_mounts(mountinfo)]
+    assert "/mnt/my share" in mount_points
+    # 非 ASCII 字节被转义后仍应还原为原来的文件名
+    assert "/home/user/中文" in mount_points
+
+
+def test_read_mounts_undecodable_bytes(tmp_path):
+    file_path = tmp_path / "mountinfo"
+    file_path.write_bytes(b"50 22 8:3 / /mnt/caf\\351 rw - ext4 /dev/sda3 rw\n")
+    assert read_mounts(str(file_path)) == [(os.fsdecode(b"/mnt/caf\xe9"), "ext4")]
+
+
+def test_read_mounts_missing_file(tmp_path):
+    assert read_mounts(str(tmp_path / "missing")) == []
+
+
+@pytest.fixture
+def sample_mounts(mountinfo, monkeypatch):
+    mounts = read_mounts(mountinfo)
+    monkeypatch.setattr(exclusion, "read_mounts", lambda: mounts)
+
+
+def test_compile_skips_pseudo_and_network_mounts(sample_mounts):
+    path_filter = ExclusionRules([], []).compile(["/"])
+    assert path_filter.excluded_mounts == {"/proc", "/sys", "/dev", "/mnt/my share", "/mnt/nfs",
+                                           "/run/user/1000/gvfs"}
+    assert not path_filter.allow_dir("/proc")
+    assert not path_filter.allow_dir("/mnt/my share")
+    assert path_filter.allow_dir("/mnt/odd")
+    assert path_filter.allow_dir("/home")
+
+
+def test_compile_can_keep_network_mounts(sample_mounts):
+    path_filter = ExclusionRules([], [], skip_network=False).compile(["/"])
+    assert path_filter.allow_dir("/mnt/nfs")
+    assert not path_filter.allow_dir("/proc")
+    assert ExclusionRules([], [], skip_pseudo=False, skip_network=False).compile(["/"]).excluded_mounts == set()
+
+
+def test_default_dir_names():
+    path_filter = PathFilter(set(exclusion.DEFAULT_DIR_NAMES), None, set(), None)
+    assert not path_filter.allow_dir("/src/project/.git")
+    assert not path_filter.allow_dir("/src/project/node_modules")
+    assert path_filter.allow_dir("/src/project/git")
+    assert path_filter.allow_dir("/src/.git-tools")
+
+
+def test_path_globs_match_directories_and_files(sample_mounts):
+    path_filter = ExclusionRules([], ["*.tmp", "/data/cache*", "*/build/*"]).compile(["/"])
+    assert not path_filter.allow_file("/home/a.tmp")
+    assert path_filter.allow_file("/home/a.tmp.txt")
+    assert not path_filter.allow_dir("/data/cache")
+    assert not path_filter.allow_dir("/data/cache2")
+    assert path_filter.allow_dir("/data/other")
+    # * 可跨越目录分隔符
+    assert not path_filter.allow_file("/src/x/build/y/z.o")
+    assert path_filter.allow_file("/src/x/builder/z.o")
+
+
+def test_without_globs_all_files_allowed(sample_mounts):
+    path_filter = ExclusionRules().compile(["/"])
+    assert path_filter.glob is None
+    assert path_filter.allow_file("/anything")
+
+
+def test_one_filesystem(tmp_path):
+    if not os.path.isdir("/dev/shm") or os.stat("/dev/shm").st_dev == os.stat(tmp_path).st_dev:
+        pytest.skip("需要位于另一设备上的目录")
+    (tmp_path / "sub").mkdir()
+    path_filter = ExclusionRules([], [], one_filesystem=True, skip_pseudo=False, skip_network=False).compile(
+        [str(tmp_path)])
+    assert path_filter.devices == {os.stat(tmp_path).st_dev}
+    assert path_filter.allow_dir(str(tmp_path / "sub"))
+    assert not path_filter.allow_dir("/dev/shm")
+    assert not path_filter.allow_dir(str(tmp_path / "missing"))
+    # 不限制文件系统时其它设备上的目录照常进入
+    assert ExclusionRules([], [], skip_pseudo=False, skip_network=False).compile(
+        [str(tmp_path)]).allow_dir("/dev/shm")
+
+
+def test_rules_round_trip(tmp_path):
+    rules = ExclusionRules(["build"], ["*.o"], one_filesystem=True, skip_pseudo=False)
+    file_path = str(tmp_path / "exclusions.json")
+    rules.save(file_path)
+    assert ExclusionRules.load(file_path).to_dict() == rules.to_dict()
+
+
+def test_load_corrupt_file_uses_defaults(tmp_path):
+    file_path = tmp_path / "exclusions.json"
+    file_path.write_text("{not json", encoding="utf-8")
+    assert ExclusionRules.load(str(file_path)).to_dict() == ExclusionRules().to_dict()
@@ -0,0 +1,80 @@
+import os
+import random
+
+import pytest
+
+from file_index import FileIndex
+from query import Query
+from search_engine import SearchJob
+from traversal import CancellationToken, ParallelWalker
+
+NAMES = ["setup.py", "xabcy.txt", "xy.log", "ABC.md", "abc.py", "Readme.TXT", "a_b.c", "zz.py", "acb.tmp",
+         "XYZ.py", "Makefile", "data[1].csv", "ab.py", "aBc.py"]
+
+
+@pytest.fixture(scope="module")
+def tree(tmp_path_factory):
+    root = tmp_path_factory.mktemp("tree")
+    rng = random.Random(7)
+    for i in range(40):
+        directory = root.joinpath(*(f"d{rng.randint(0, 4)}" for depth in range(rng.randint(0, 3))))
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in rng.sample(NAMES, 4):
+            directory.joinpath(f"{rng.choice(['', 'q', 'Zx'])}{name}").write_bytes(b"x" * rng.randint(0, 3000))
+    file_index = FileIndex(os.path.join(str(tmp_path_factory.mktemp("db")), "index.db"))
+    assert file_index.build(str(root))
+    return str(root), file_index
+
+
+def result_set(job):
+    return {os.path.join(dir_path, name) for name, dir_path, size, ctime, mtime in job.records()}
+
+
+@pytest.mark.parametrize("text, ignore_case", [
+    ("abc", False),
+    ("abc", True),
+    ("*[xyz]*.py", False),
+    ("a[bc]*", False),
+    ("a[bc]*", True),
+    ("/x(abc)?y/", False),
+    ("/[A-Z]{3}/", False),
+    ("/ab+c/i", False),
+    (".py|.txt", False),
+    ("py -setup", False),
+    ("abc OR xy", True),
+    ("size:>1k .py", False),
+    ("data[1]", False),
+])
+def test_index_matches_walk(tree, text, ignore_case):
+    root, file_index = tree
+    query = Query(text, ignore_case)
+    indexed = result_set(SearchJob(query, root, file_index))
+    walked = result_set(SearchJob(query, root))
+    assert indexed == walked
+
+
+def test_cancelled_search_stops(tree):
+    root, file_index = tree
+    token = CancellationToken()
+    batches = file_index.search(Query("py"), root, batch_size=1, token=token)
+    assert next(batches)
+    token.cancel()
+    assert list(batches) == []
+    # 取消前已开始的查询也会被 sqlite 中断
+    assert list(file_index.search(Query(""), root, token=token)) == []
+    # 搜索结束后不再影响同一连接上的其它查询
+    assert list(file_index.search(Query("py"), root))
+
+
+def test_search_job_passes_token_to_index(tree):
+    root, file_index = tree
+    job = SearchJob(Query("py"), root, file_index)
+    job.cancel()
+    assert list(job.batches()) == []
+
+
+def test_single_threaded_scan_matches_walker(tree):
+    root, file_index = tree
+    walked = {(dir_path, tuple(sorted(files)))
+              for dir_results in ParallelWalker().scan([root]) for dir_path, files in dir_results}
+    assert set((dir_path, tuple(sorted(files))) for dir_path, files in file_index.scan_tree(root)) == walked
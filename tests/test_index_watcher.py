@@ -0,0 +1,68 @@
+import os
+import shutil
+import time
+
+import pytest
+
+from file_index import FileIndex
+from index_watcher import IndexWatcher, is_supported
+from query import Query
+
+pytestmark = pytest.mark.skipif(not is_supported(), reason="需要 inotify")
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
+
+
+def indexed_names(file_index, root):
+    return sorted(row[0] for rows in file_index.search(Query(""), root) for row in rows)
+
+
+@pytest.fixture
+def watched(tmp_path):
+    root = tmp_path / "root"
+    root.mkdir()
+    (root / "old.txt").write_bytes(b"")
+    file_index = FileIndex(str(tmp_path / "index.db"))
+    assert file_index.build(str(root))
+    watcher = IndexWatcher(file_index)
+    assert watcher.start([str(root)])
+    assert wait_for(lambda: watcher.watch_count == 1)
+    yield root, file_index, watcher
+    watcher.stop()
+
+
+def test_new_tree_is_indexed_and_watched(watched):
+    root, file_index, watcher = watched
+    nested = root / "a" / "b"
+    nested.mkdir(parents=True)
+    (nested / "x.txt").write_bytes(b"")
+    assert wait_for(lambda: "x.txt" in indexed_names(file_index, str(root)))
+    assert wait_for(lambda: watcher.watch_count == 3)
+    # 新目录已被监视，其中再新建的文件同样写入索引
+    (nested / "y.txt").write_bytes(b"")
+    assert wait_for(lambda: "y.txt" in indexed_names(file_index, str(root)))
+
+
+def test_removed_tree_drops_records_and_watches(watched):
+    root, file_index, watcher = watched
+    (root / "a" / "b").mkdir(parents=True)
+    (root / "a" / "b" / "x.txt").write_bytes(b"")
+    assert wait_for(lambda: watcher.watch_count == 3)
+    shutil.rmtree(root / "a")
+    assert wait_for(lambda: indexed_names(file_index, str(root)) == ["old.txt"])
+    assert wait_for(lambda: watcher.watch_count == 1 and len(watcher.dir_watches) == 1)
+
+
+def test_moved_out_tree_removes_watches(watched, tmp_path):
+    root, file_index, watcher = watched
+    (root / "a" / "b").mkdir(parents=True)
+    assert wait_for(lambda: watcher.watch_count == 3)
+    os.rename(root / "a", tmp_path / "outside")
+    assert wait_for(lambda: watcher.watch_count == 1 and len(watcher.dir_watches) == 1)
@@ -0,0 +1,126 @@
+import codecs
+
+import pytest
+
+import paged_text
+from paged_text import PagedTextFile, count_lines, detect_encoding, detect_file_encoding, line_offset
+
+LINES = [f"第 {i} 行 line {i} 文本" for i in range(5000)]
+TEXT = "\n".join(LINES) + "\n"
+
+
+@pytest.mark.parametrize("data, encoding", [
+    (b"", "UTF-8"),
+    (TEXT.encode("utf-8"), "UTF-8"),
+    (codecs.BOM_UTF8 + TEXT.encode("utf-8"), "UTF-8-SIG"),
+    (TEXT.encode("gb18030"), "GB18030"),
+    (codecs.BOM_UTF16_LE + TEXT.encode("utf-16-le"), "UTF-16"),
+    (codecs.BOM_UTF16_BE + TEXT.encode("utf-16-be"), "UTF-16"),
+    # 没有 BOM 且其它编码都无法解码的 UTF-16
+    ("ÿþ文本\n".encode("utf-16-le") * 100, "UTF-16"),
+    (b"\xff\xdc" * 100, "unknown"),
+], ids=["empty", "utf-8", "utf-8-sig", "gb18030", "utf-16-le-bom", "utf-16-be-bom", "utf-16-nobom", "undecodable"])
+def test_detect_encoding(data, encoding):
+    assert detect_encoding(data) == encoding
+
+
+def test_detect_encoding_samples_middle_and_end():
+    data = b"a" * paged_text.SAMPLE_SIZE * 4 + "\n中文".encode("gb18030")
+    assert detect_encoding(data) == "GB18030"
+
+
+@pytest.fixture(params=["utf-8", "utf-8-sig", "gb18030", "utf-16", "utf-16-le-nobom", "utf-16-be"])
+def text_path(request, tmp_path):
+    if request.param == "utf-16-le-nobom":
+        data = TEXT.encode("utf-16-le")
+        encoding = "UTF-16"
+    elif request.param == "utf-16-be":
+        data = codecs.BOM_UTF16_BE + TEXT.encode("utf-16-be")
+        encoding = None
+    else:
+        data = TEXT.encode(request.param)
+        encoding = None
+    file_path = tmp_path / "text.txt"
+    file_path.write_bytes(data)
+    return str(file_path), encoding
+
+
+def read_forward(text_file, size):
+    parts = []
+    offset = text_file.data_start
+    while offset < text_file.size:
+        text, start, end = text_file.page(offset, size)
+        assert start == offset
+        assert end > start
+        parts.append(text)
+        offset = end
+    return "".join(parts)
+
+
+def read_backward(text_file, size):
+    parts = []
+    end = text_file.size
+    while end > text_file.data_start:
+        text, start, page_end = text_file.previous_page(end, size)
+        assert page_end == end
+        assert start < end
+        parts.insert(0, text)
+        end = start
+    return "".join(parts)
+
+
+@pytest.mark.parametrize("size", [64, 1000, paged_text.PAGE_SIZE])
+def test_pages_cover_file_on_line_boundaries(text_path, size):
+    file_path, encoding = text_path
+    text_file = PagedTextFile(file_path, encoding)
+    try:
+        assert read_forward(text_file, size) == TEXT
+        assert read_backward(text_file, size) == TEXT
+        # 从行中间开始的一页从下一行开始
+        text, start, end = text_file.page(text_file.data_start + 7 * text_file.unit, size)
+        assert text.startswith(LINES[1])
+    finally:
+        text_file.close()
+
+
+def test_count_lines_and_line_offset(text_path):
+    file_path, encoding = text_path
+    lines, checkpoints = count_lines(file_path, encoding or detect_file_encoding(file_path))
+    assert lines == len(LINES)
+    text_file = PagedTextFile(file_path, encoding)
+    try:
+        for line in (1, 2, 1000, 1001, 4999, 5000):
+            text = text_file.page(line_offset(text_file, checkpoints, line), 64)[0]
+            assert text.startswith(LINES[line - 1] + "\n")
+    finally:
+        text_file.close()
+
+
+def test_long_line_is_split(tmp_path):
+    file_path = tmp_path / "long.txt"
+    file_path.write_bytes(b"x" * (paged_text.LONG_LINE_SIZE * 3) + b"\nend\n")
+    text_file = PagedTextFile(str(file_path))
+    try:
+        text, start, end = text_file.page(0)
+        assert end - start <= paged_text.LONG_LINE_SIZE + paged_text.PAGE_SIZE
+        assert read_forward(text_file, paged_text.PAGE_SIZE) == "x" * (paged_text.LONG_LINE_SIZE * 3) + "\nend\n"
+    finally:
+        text_file.close()
+
+
+def test_empty_file(tmp_path):
+    file_path = tmp_path / "empty.txt"
+    file_path.write_bytes(b"")
+    assert count_lines(str(file_path), "UTF-8") == (0, [0])
+    text_file = PagedTextFile(str(file_path))
+    try:
+        assert text_file.page(0) == ("", 0, 0)
+    finally:
+        text_file.close()
+
+
+@pytest.mark.parametrize("prefix", ["", "a", "ab"])
+def test_single_line_utf8_samples_skip_continuation_bytes(prefix):
+    # 没有换行时中间与结尾的样本可能从多字节字符中间开始
+    data = (prefix + "中文字符" * 100000).encode("utf-8")
+    assert detect_encoding(data) == "UTF-8"
@@ -0,0 +1,113 @@
+import random
+import time
+
+import pytest
+
+from query import Query, QueryError, glob_literal, regex_literal
+
+
+@pytest.mark.parametrize("pattern, literal", [
+    ("*.py", ".py"),
+    ("*[xyz]*.py", ".py"),
+    ("a[bc]*", "a"),
+    ("[]x]yz*", "yz"),
+    ("*[!a]foo*", "foo"),
+    ("ab[cd", "ab[cd"),         # 没有闭合的 [ 是普通字符
+])
+def test_glob_literal(pattern, literal):
+    assert glob_literal(pattern) == literal
+
+
+@pytest.mark.parametrize("pattern, literal", [
+    (r"^setup\.py$", "setup.py"),
+    ("x(abc)?y", "x"),
+    ("[A-Z]{3}", ""),
+    ("abc{2}def", "def"),
+    ("ab*cd", "cd"),
+    (r"a\d+bc", "bc"),
+    ("foo|bar", ""),
+    ("(?i)hello", ""),
+    ("(", ""),
+])
+def test_regex_literal(pattern, literal):
+    assert regex_literal(pattern) == literal
+
+
+def random_names(count, seed=1):
+    rng = random.Random(seed)
+    alphabet = "abcxyzABCXYZ._-0"
+    return ["".join(rng.choice(alphabet) for i in range(rng.randint(1, 10))) for i in range(count)]
+
+
+@pytest.mark.parametrize("text, ignore_case", [
+    ("*[xyz]*.py", False),
+    ("a[bc]*", False),
+    ("a[bc]*", True),
+    ("/x(abc)?y/", False),
+    ("/[A-Z]{3}/", False),
+    ("/ab+c/i", False),
+    ("*a?c*", False),
+])
+def test_literals_appear_in_every_match(text, ignore_case):
+    query = Query(text, ignore_case)
+    for name in random_names(20000):
+        if query.match_name(name):
+            for literal, literal_ignore_case in query.literals:
+                if literal_ignore_case:
+                    assert literal.lower() in name.lower()
+                else:
+                    assert literal in name
+
+
+def test_parse_groups_and_negation():
+    query = Query("abc -.tmp OR *.py")
+    assert len(query.groups) == 2
+    assert query.match(("xabc.txt", "/", 0, 0, 0))
+    assert not query.match(("xabc.tmp", "/", 0, 0, 0))
+    assert query.match(("setup.py", "/", 0, 0, 0))
+
+
+def test_extension_alternatives_merge():
+    query = Query(".jpg|.png")
+    assert query.extensions == {"jpg", "png"}
+    assert query.match(("a.PNG", "/", 0, 0, 0))
+
+
+def test_size_range():
+    query = Query("size:>1k")
+    assert query.needs_stat
+    assert query.match(("a", "/", 2048, 0, 0))
+    assert not query.match(("a", "/", 10, 0, 0))
+
+
+def test_invalid_regex_raises_query_error():
+    with pytest.raises(QueryError):
+        Query("/a(/")
+
+
+DAY = 86400
+
+
+def time_record(age):
+    now = time.time()
+    return ("a", "/", 0, now - age, now - age)
+
+
+@pytest.mark.parametrize("text, matching_ages, other_ages", [
+    ("modified:7d", [0, 3 * DAY], [8 * DAY]),
+    ("modified:>=7d", [0, 3 * DAY], [8 * DAY]),
+    ("modified:<7d", [8 * DAY, 30 * DAY], [0, 3 * DAY]),
+    ("modified:<=7d", [0, 3 * DAY, 30 * DAY], [-DAY]),
+    ("modified:..7d", [0, 30 * DAY], [-DAY]),
+    ("modified:>7d", [-DAY], [0, 3 * DAY, 30 * DAY]),
+    ("modified:30d..7d", [0, 20 * DAY], [40 * DAY]),
+    ("created:12h", [3600], [DAY]),
+])
+def test_relative_time_ranges(text, matching_ages, other_ages):
+    query = Query(text)
+    # 每种写法都应得到可交给索引的边界，而不是匹配所有文件
+    assert query.bounds and any(bound is not None for column, low, high in query.bounds for bound in (low, high))
+    for age in matching_ages:
+        assert query.match(time_record(age)), age
+    for age in other_ages:
+        assert not query.match(time_record(age)), age
@@ -0,0 +1,55 @@
+from query import Query
+from result_batcher import ResultBatcher, TopResults
+from traversal import CancellationToken
+
+
+def records(names):
+    return [(name, "/", 0, 0, 0) for name in names]
+
+
+def test_top_results_keeps_best_ranked():
+    query = Query("abc")
+    top = TopResults(3, query.rank)
+    top.add(records(["xabc", "abc.txt", "abc", "x_abc", "zzabc"]))
+    top.add(records(["abcd"]))
+    assert [row[0] for row in top.rows()] == ["abc", "abcd", "abc.txt"]
+    assert top.truncated
+
+
+def test_saturated_after_k_exact_matches():
+    query = Query("abc")
+    top = TopResults(2, query.rank)
+    top.add(records(["abc", "xabc"]))
+    assert not top.saturated()
+    top.add(records(["abc", "abc", "abcd"]))
+    assert top.saturated()
+
+
+def test_not_saturated_without_enough_exact_matches():
+    query = Query("abc")
+    top = TopResults(2, query.rank)
+    for i in range(10):
+        top.add(records(["abcd", "xabc"]))
+    assert not top.saturated()
+
+
+def test_batcher_limits_pending_batches():
+    batches = []
+    batcher = ResultBatcher(batches.append, batch_size=1, max_pending=2)
+    batcher.add([1])
+    batcher.add([2])
+    batcher.batch_done()
+    batcher.add([3])
+    assert batches == [[1], [2], [3]]
+
+
+def test_cancelled_batcher_does_not_wait_for_ui():
+    batches = []
+    token = CancellationToken()
+    batcher = ResultBatcher(batches.append, batch_size=1, max_pending=1, token=token)
+    batcher.add([1])
+    token.cancel()
+    # 界面不再处理批次，取消后 flush 不能一直等待
+    batcher.add([2])
+    batcher.flush()
+    assert batches == [[1]]
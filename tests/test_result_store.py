@@ -0,0 +1,76 @@
+import os
+
+from result_store import ResultStore
+
+RECORDS = [
+    ("a.txt", "/home/user", 10, 100, 200),
+    ("中文.md", "/home/user/文档", 20, 101, 201),
+    ("b.txt", "/home/user", 30, 102, 202),
+    ("", "/", 0, 0, 0),
+]
+
+
+def make_store():
+    store = ResultStore()
+    store.append(RECORDS[:2])
+    store.append(RECORDS[2:])
+    return store
+
+
+def test_append_and_row_access():
+    store = make_store()
+    assert len(store) == 4
+    assert [store.record(row) for row in range(len(store))] == RECORDS
+    assert store.name(1) == "中文.md"
+    assert store.dir_path(1) == "/home/user/文档"
+    assert store.path(2) == os.path.join("/home/user", "b.txt")
+    assert (store.sizes[2], store.ctimes[2], store.mtimes[2]) == (30, 102, 202)
+    # 相同目录只保存一次
+    assert store.dirs == ["/home/user", "/home/user/文档", "/"]
+    assert list(store.dir_column) == [0, 1, 0, 2]
+
+
+def test_append_empty():
+    store = ResultStore()
+    store.append([])
+    assert len(store) == 0
+    store.append(RECORDS[:1])
+    assert store.record(0) == RECORDS[0]
+
+
+def test_surrogateescape_round_trip():
+    # 无法按 UTF-8 解码的文件名，如 Latin-1 编码的 café
+    name = os.fsdecode(b"caf\xe9.txt")
+    dir_path = os.fsdecode(b"/data/\xff\xfe")
+    store = ResultStore()
+    store.append([(name, dir_path, 1, 2, 3), ("next.txt", dir_path, 4, 5, 6)])
+    assert store.name(0) == name
+    assert os.fsencode(store.path(0)) == b"/data/\xff\xfe/caf\xe9.txt"
+    # 后一行的偏移不受前一行的转义影响
+    assert store.name(1) == "next.txt"
+    assert store.subset([0]).name(0) == name
+
+
+def test_subset():
+    store = make_store()
+    subset = store.subset([3, 0, 1])
+    assert len(subset) == 3
+    assert [subset.record(row) for row in range(len(subset))] == [RECORDS[3], RECORDS[0], RECORDS[1]]
+    assert subset.dirs is store.dirs
+    # 原结果不受影响
+    assert [store.record(row) for row in range(len(store))] == RECORDS
+    assert len(store.subset([])) == 0
+
+
+def test_subset_can_be_appended():
+    subset = make_store().subset([1])
+    subset.append([("c.txt", "/tmp", 5, 6, 7), ("d.txt", "/home/user/文档", 8, 9, 10)])
+    assert [subset.name(row) for row in range(len(subset))] == ["中文.md", "c.txt", "d.txt"]
+    assert subset.dir_path(1) == "/tmp"
+    assert subset.dir_path(2) == "/home/user/文档"
+
+
+def test_nbytes():
+    store = make_store()
+    name_bytes = sum(len(record[0].encode("utf-8")) for record in RECORDS)
+    assert store.nbytes() == name_bytes + 4 * 4 + 8 * 5 + 8 * 4 * 3
@@ -0,0 +1,159 @@
+import os
+import shutil
+import tempfile
+import threading
+
+import pytest
+
+from traversal import CancellationToken, ParallelWalker, group_by_device, is_sub_path, unique_roots
+
+
+@pytest.fixture(scope="module")
+def tree(tmp_path_factory):
+    root = tmp_path_factory.mktemp("walk")
+    # 一条很深的链与若干很宽的目录，工作线程需要互相窃取才能分摊
+    deep = root / "deep"
+    for depth in range(30):
+        deep = deep / f"level{depth}"
+    deep.mkdir(parents=True)
+    (deep / "bottom.txt").write_bytes(b"x")
+    for i in range(20):
+        wide = root / "wide" / f"d{i}"
+        wide.mkdir(parents=True)
+        for j in range(15):
+            (wide / f"f{j}.{'py' if j % 3 == 0 else 'txt'}").write_bytes(b"x" * j)
+    (root / "empty").mkdir()
+    (root / "top.py").write_bytes(b"")
+    os.symlink(root / "wide", root / "link_to_wide")
+    return str(root)
+
+
+def expected_files(root, suffix=""):
+    return {os.path.join(dir_path, name)
+            for dir_path, dir_names, file_names in os.walk(root)
+            for name in file_names if name.endswith(suffix)}
+
+
+def walked_files(batches):
+    return [os.path.join(dir_path, name) for rows in batches for name, dir_path, size, ctime, mtime in rows]
+
+
+def run_with_timeout(function, timeout=20):
+    """
+    在另一线程中执行，遍历没有结束时测试失败而不是一直挂起
+    """
+    result = []
+    thread = threading.Thread(target=lambda: result.append(function()), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "遍历没有结束"
+    return result[0]
+
+
+@pytest.mark.parametrize("workers", [1, 2, 8, 32])
+def test_walk_finds_exact_file_set(tree, workers):
+    files = run_with_timeout(lambda: walked_files(ParallelWalker(workers=workers, batch_size=7).walk([tree])))
+    # 每个文件恰好出现一次，指向目录的符号链接不进入
+    assert len(files) == len(set(files))
+    assert set(files) == expected_files(tree)
+
+
+def test_scan_yields_every_directory_once(tree):
+    dirs = [dir_path for dir_results in ParallelWalker(workers=4).scan([tree]) for dir_path, files in dir_results]
+    assert len(dirs) == len(set(dirs))
+    assert set(dirs) == {dir_path for dir_path, dir_names, file_names in os.walk(tree)}
+
+
+def test_match_filters_files(tree):
+    files = walked_files(ParallelWalker(workers=4).walk([tree], match=lambda name: name.endswith(".py")))
+    assert set(files) == expected_files(tree, ".py")
+
+
+def test_idle_workers_terminate_on_tiny_tree(tmp_path):
+    assert run_with_timeout(lambda: walked_files(ParallelWalker(workers=32).walk([str(tmp_path)]))) == []
+
+
+def test_overlapping_roots_walked_once(tree):
+    roots = [tree, os.path.join(tree, "wide"), os.path.join(tree, "wide", "d3"), tree + os.sep]
+    files = walked_files(ParallelWalker(workers=4).walk(roots))
+    assert len(files) == len(set(files))
+    assert set(files) == expected_files(tree)
+
+
+def test_missing_root_is_skipped(tree, tmp_path):
+    roots = [str(tmp_path / "missing"), os.path.join(tree, "wide")]
+    assert set(walked_files(ParallelWalker(workers=2).walk(roots))) == expected_files(os.path.join(tree, "wide"))
+
+
+def test_cancel_mid_walk(tree):
+    token = CancellationToken()
+
+    def walk():
+        seen = 0
+        for rows in ParallelWalker(workers=4, batch_size=1).walk([tree], token=token):
+            seen += len(rows)
+            token.cancel()
+        return seen
+
+    assert run_with_timeout(walk) < len(expected_files(tree))
+
+
+def test_closing_generator_stops_workers(tree):
+    def walk():
+        batches = ParallelWalker(workers=4, batch_size=1).walk([tree])
+        next(batches)
+        batches.close()
+        return True
+
+    before = threading.active_count()
+    assert run_with_timeout(walk)
+    # 工作线程都已退出，只剩执行 walk 的线程可能尚未回收
+    assert threading.active_count() <= before + 1
+
+
+def test_unique_roots():
+    roots = ["/a/b", "/a", "/c", "/a/b/c", "/ab", "/c/", "/a"]
+    assert unique_roots(roots) == ["/a", "/c", "/ab"]
+
+
+def test_unique_roots_keeps_siblings_with_common_prefix():
+    assert unique_roots(["/data/x", "/data/xy"]) == ["/data/x", "/data/xy"]
+
+
+def test_is_sub_path():
+    assert is_sub_path("/a/b", "/a")
+    assert is_sub_path("/a", "/a")
+    assert is_sub_path("/a/b", "/a/")
+    assert not is_sub_path("/ab", "/a")
+
+
+def test_group_by_device(tree, tmp_path):
+    missing = str(tmp_path / "missing")
+    groups = group_by_device([tree, os.path.join(tree, "wide"), missing])
+    assert groups[os.stat(tree).st_dev] == [tree, os.path.join(tree, "wide")]
+    assert groups[None] == [missing]
+
+
+@pytest.fixture
+def other_device_dir(tmp_path):
+    """
+    与 tmp_path 位于不同设备上的临时目录（通常是 /dev/shm 的 tmpfs），没有时跳过
+    """
+    if not os.path.isdir("/dev/shm") or not os.access("/dev/shm", os.W_OK):
+        pytest.skip("没有可写的 /dev/shm")
+    if os.stat("/dev/shm").st_dev == os.stat(tmp_path).st_dev:
+        pytest.skip("/dev/shm 与临时目录位于同一设备")
+    path = tempfile.mkdtemp(dir="/dev/shm")
+    yield path
+    shutil.rmtree(path)
+
+
+def test_roots_on_several_devices(tree, other_device_dir):
+    for i in range(3):
+        sub_dir = os.path.join(other_device_dir, f"s{i}")
+        os.mkdir(sub_dir)
+        open(os.path.join(sub_dir, "shm.txt"), "w").close()
+    assert len(group_by_device([tree, other_device_dir])) == 2
+    files = run_with_timeout(lambda: walked_files(ParallelWalker(workers=4).walk([tree, other_device_dir])))
+    assert len(files) == len(set(files))
+    assert set(files) == expected_files(tree) | expected_files(other_device_dir)
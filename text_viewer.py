@@ -0,0 +1,253 @@
+import os
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QIntValidator, QTextCursor
+from PyQt5.QtWidgets import QHBoxLayout, QLabel, QLineEdit, QPlainTextEdit, QScrollBar, QVBoxLayout, QWidget
+
+from paged_text import PagedTextFile, count_lines, line_offset
+from traversal import CancellationToken
+
+# 同时留在文档中的页数，超过后丢弃离可见位置最远的一页
+MAX_PAGES = 8
+# 位置滚动条的刻度数，按字节偏移量比例换算
+POSITION_STEPS = 10000
+
+
+class PagedTextViewer(QWidget):
+    """
+    分页显示文本文件：文件以 mmap 打开，只解码可见位置附近的几页，
+    滚动到文档顶部或底部时再读入上一页或下一页，离开较远的页随之丢弃
+    右侧的滚动条按字节偏移量定位整个文件，行数与跳转用的行首位置在后台统计
+    """
+
+    def __init__(self, parent=None):
+        super(PagedTextViewer, self).__init__(parent)
+        self.text_file = None
+        self.pages = []             # 文档中各页的 (开始偏移量, 结束偏移量, 行数)，按偏移量排列
+        self.line_count = None
+        self.checkpoints = None
+        self.count_token = CancellationToken()
+        # 每打开一个文件递增，此前开始的统计任务的结果作废
+        self.generation = 0
+        self.count_pool = QtCore.QThreadPool(self)
+        self.count_pool.setMaxThreadCount(1)
+
+        self.editor = QPlainTextEdit()
+        self.editor.setReadOnly(True)
+        self.editor.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.editor.verticalScrollBar().valueChanged.connect(self.editor_scrolled)
+
+        self.position_bar = QScrollBar(Qt.Vertical)
+        self.position_bar.setRange(0, POSITION_STEPS)
+        self.position_bar.setPageStep(POSITION_STEPS // 100)
+        self.position_bar.sliderReleased.connect(self.position_changed)
+        self.position_bar.actionTriggered.connect(self.position_action)
+
+        self.status_label = QLabel()
+        self.line_edit = QLineEdit()
+        self.line_edit.setPlaceholderText("跳转到行")
+        self.line_edit.setValidator(QIntValidator(1, 2 ** 31 - 1, self))
+        self.line_edit.setMaximumWidth(120)
+        self.line_edit.returnPressed.connect(self.go_to_line)
+
+        top_layout = QHBoxLayout()
+        top_layout.addWidget(self.status_label, 1)
+        top_layout.addWidget(self.line_edit)
+        text_layout = QHBoxLayout()
+        text_layout.addWidget(self.editor)
+        text_layout.addWidget(self.position_bar)
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addLayout(top_layout)
+        layout.addLayout(text_layout)
+        self.setLayout(layout)
+
+    def open(self, file_path, encoding=None, first_page=None):
+        """
+        :param encoding: 已判断出的编码，为 None 时根据文件样本判断
+        :param first_page: 已在后台解码的第一页 (文本, 开始偏移量, 结束偏移量)
+        """
+        self.close_file()
+        self.text_file = PagedTextFile(file_path, encoding)
+        self.line_count = None
+        self.checkpoints = None
+        self.generation += 1
+        self.count_token = CancellationToken()
+        task = LineCountTask(self.generation, file_path, self.text_file.encoding, self.count_token)
+        task.signals.progress.connect(self.count_progress)
+        task.signals.finished.connect(self.count_finished)
+        self.count_pool.start(task)
+        self.show_at(0, first_page)
+
+    def close_file(self):
+        self.count_token.cancel()
+        if self.text_file is not None:
+            self.text_file.close()
+            self.text_file = None
+        self.pages = []
+        self.editor.clear()
+
+    def show_at(self, offset, page=None):
+        """
+        清空文档，从 offset 所在行开始显示，offset 位于文件末尾时显示最后一页
+        :param page: 已解码的这一页，为 None 时在此解码
+        """
+        text, start, end = page or self.text_file.page(offset)
+        if not text and start > self.text_file.data_start:
+            text, start, end = self.text_file.previous_page(self.text_file.size)
+        self.pages = [(start, end, text.count("\n"))]
+        self.editor.setPlainText(text)
+        self.editor.verticalScrollBar().setValue(0)
+        # 一页不足以填满可见区域时不会出现滚动，直接多读几页
+        while (self.editor.verticalScrollBar().maximum() == 0 and self.pages[-1][1] < self.text_file.size
+               and len(self.pages) < MAX_PAGES):
+            self.load_next_page()
+        self.update_status()
+
+    def editor_scrolled(self, value):
+        if self.text_file is None or not self.pages:
+            return
+        scroll_bar = self.editor.verticalScrollBar()
+        if value >= scroll_bar.maximum() and self.pages[-1][1] < self.text_file.size:
+            self.load_next_page()
+        elif value <= scroll_bar.minimum() and self.pages[0][0] > self.text_file.data_start:
+            self.load_previous_page()
+        self.update_status()
+
+    def load_next_page(self):
+        scroll_bar = self.editor.verticalScrollBar()
+        value = scroll_bar.value()
+        text, start, end = self.text_file.page(self.pages[-1][1])
+        cursor = QTextCursor(self.editor.document())
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(text)
+        self.pages.append((start, end, text.count("\n")))
+        if len(self.pages) > MAX_PAGES:
+            value -= self.remove_first_page()
+        scroll_bar.blockSignals(True)
+        scroll_bar.setValue(value)
+        scroll_bar.blockSignals(False)
+
+    def load_previous_page(self):
+        scroll_bar = self.editor.verticalScrollBar()
+        value = scroll_bar.value()
+        text, start, end = self.text_file.previous_page(self.pages[0][0])
+        cursor = QTextCursor(self.editor.document())
+        cursor.insertText(text)
+        lines = text.count("\n")
+        self.pages.insert(0, (start, end, lines))
+        if len(self.pages) > MAX_PAGES:
+            self.remove_last_page()
+        scroll_bar.blockSignals(True)
+        scroll_bar.setValue(value + lines)
+        scroll_bar.blockSignals(False)
+
+    def remove_first_page(self):
+        """
+        :return: 删除的行数
+        """
+        start, end, lines = self.pages.pop(0)
+        cursor = QTextCursor(self.editor.document())
+        cursor.setPosition(self.editor.document().findBlockByNumber(lines).position(), QTextCursor.KeepAnchor)
+        cursor.removeSelectedText()
+        return lines
+
+    def remove_last_page(self):
+        start, end, lines = self.pages.pop()
+        document = self.editor.document()
+        cursor = QTextCursor(document)
+        cursor.setPosition(document.findBlockByNumber(document.blockCount() - 1 - lines).position())
+        cursor.movePosition(QTextCursor.End, QTextCursor.KeepAnchor)
+        cursor.removeSelectedText()
+
+    def current_offset(self):
+        """
+        :return: 可见区域第一行所在页的开始偏移量
+        """
+        line = self.editor.verticalScrollBar().value()
+        for start, end, lines in self.pages:
+            if line < lines:
+                return start
+            line -= lines
+        return self.pages[-1][0] if self.pages else 0
+
+    def position_changed(self):
+        if self.text_file is not None and self.text_file.size:
+            self.show_at(self.text_file.size * self.position_bar.value() // POSITION_STEPS)
+
+    def position_action(self, action):
+        # 拖动中不读文件，松开后 sliderReleased 再定位
+        if action != QScrollBar.SliderMove:
+            QtCore.QTimer.singleShot(0, self.position_changed)
+
+    def go_to_line(self):
+        if self.text_file is None or not self.line_edit.text():
+            return
+        if self.checkpoints is None:
+            self.status_label.setText(self.status_text() + "  行数统计完成后才能跳转")
+            return
+        offset = line_offset(self.text_file, self.checkpoints, int(self.line_edit.text()))
+        if offset is None:
+            offset = self.text_file.size
+        self.show_at(offset)
+
+    def count_progress(self, generation, lines, percent):
+        if generation == self.generation:
+            self.update_status(f"统计中… {lines} 行 {percent}%")
+
+    def count_finished(self, generation, result):
+        if generation != self.generation or result is None:
+            return
+        self.line_count, self.checkpoints = result
+        self.update_status()
+
+    def status_text(self, lines_text=None):
+        if self.text_file is None:
+            return ""
+        if lines_text is None:
+            lines_text = "统计中…" if self.line_count is None else f"共 {self.line_count} 行"
+        percent = 100 * self.current_offset() // self.text_file.size if self.text_file.size else 100
+        return f"{self.text_file.encoding}  {lines_text}  位置 {percent}%"
+
+    def update_status(self, lines_text=None):
+        if self.text_file is None:
+            return
+        self.status_label.setText(self.status_text(lines_text))
+        if not self.position_bar.isSliderDown() and self.text_file.size:
+            self.position_bar.blockSignals(True)
+            self.position_bar.setValue(self.current_offset() * POSITION_STEPS // self.text_file.size)
+            self.position_bar.blockSignals(False)
+
+
+class LineCountTask(QtCore.QRunnable):
+    """
+    在后台线程中统计行数并记录行首位置，打开其它文件时经 token 取消
+    """
+
+    def __init__(self, generation, file_path, encoding, token):
+        super(LineCountTask, self).__init__()
+        self.generation = generation
+        self.file_path = file_path
+        self.encoding = encoding
+        self.token = token
+        self.size = 0
+        self.signals = LineCountSignals()
+
+    def progress(self, lines, position):
+        if not self.token.cancelled:
+            self.signals.progress.emit(self.generation, lines, 100 * position // max(1, self.size))
+
+    @QtCore.pyqtSlot()
+    def run(self):
+        try:
+            self.size = os.path.getsize(self.file_path)
+            result = count_lines(self.file_path, self.encoding, self.token, self.progress)
+        except OSError:
+            result = None
+        self.signals.finished.emit(self.generation, result)
+
+
+class LineCountSignals(QtCore.QObject):
+    progress = QtCore.pyqtSignal(int, int, int)
+    finished = QtCore.pyqtSignal(int, object)
@@ -0,0 +1,56 @@
+import time
+
+FULL = "full"
+ISO = "iso"
+RELATIVE = "relative"
+STYLE_NAMES = {FULL: "年-月-日 时:分:秒", ISO: "ISO 8601", RELATIVE: "相对时间"}
+
+
+class TimeFormatter(object):
+    """
+    把整数时间戳格式化为显示文本，只在视图显示某一行时调用
+    同一分钟内的时间戳共用缓存的"日期 时:分"部分，只需拼接秒数；时区偏移都是整分钟，按 UTC 分钟分桶即可
+    相对时间超过一周后只显示日期，日期取自同一缓存
+    """
+
+    def __init__(self, style=FULL, max_size=8192):
+        self.style = style
+        self.max_size = max_size
+        self.minutes = {}
+
+    def set_style(self, style):
+        self.style = style
+        self.minutes.clear()
+
+    def format(self, timestamp, style=None):
+        style = style or self.style
+        if style == RELATIVE:
+            return self.relative(timestamp)
+        minute, second = divmod(timestamp, 60)
+        key = (style, minute)
+        parts = self.minutes.get(key)
+        if parts is None:
+            local_time = time.localtime(minute * 60)
+            if style == ISO:
+                offset = time.strftime("%z", local_time)
+                parts = (time.strftime("%Y-%m-%dT%H:%M:", local_time), f"{offset[:3]}:{offset[3:]}")
+            else:
+                parts = (time.strftime("%Y-%m-%d %H:%M:", local_time), "")
+            if len(self.minutes) >= self.max_size:
+                self.minutes.clear()
+            self.minutes[key] = parts
+        return f"{parts[0]}{second:02d}{parts[1]}"
+
+    def relative(self, timestamp):
+        seconds = time.time() - timestamp
+        if seconds < 0:
+            return self.format(timestamp, FULL)
+        if seconds < 60:
+            return "刚刚"
+        if seconds < 3600:
+            return f"{int(seconds // 60)}分钟前"
+        if seconds < 86400:
+            return f"{int(seconds // 3600)}小时前"
+        if seconds < 7 * 86400:
+            return f"{int(seconds // 86400)}天前"
+        return self.format(timestamp, FULL)[:10]
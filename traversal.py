@@ -0,0 +1,281 @@
+import os
+import queue
+import random
+import threading
+from collections import deque
+from functools import lru_cache
+
+from instrumentation import NULL_STATS
+
+# 遍历以等待磁盘 I/O 为主，scandir 与 stat 会释放 GIL，线程数可多于 CPU 核数
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# 机械硬盘上多个线程同时读取会使磁头来回寻道，每个机械硬盘只用这么多线程
+ROTATIONAL_WORKERS = 2
+
+# 单个目录中的条目很多时，每读取这么多条检查一次是否已取消
+CANCEL_CHECK_ENTRIES = 1024
+
+
+class CancellationToken(object):
+    """
+    可在任意线程取消的标志，遍历在进入每个目录前（大目录中每隔一段条目）检查，取消后很快停止
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+
+    def cancel(self):
+        self.event.set()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+
+def is_sub_path(path, root):
+    """
+    判断 path 是否为 root 本身或位于 root 之下
+    """
+    if path == root:
+        return True
+    if not root.endswith(os.sep):
+        root = root + os.sep
+    return path.startswith(root)
+
+
+def unique_roots(roots):
+    """
+    去掉重复的路径以及位于其它路径之下的路径，其余保持原有顺序
+    """
+    roots = list(dict.fromkeys(os.path.abspath(root) for root in roots))
+    return [root for root in roots if not any(other != root and is_sub_path(root, other) for other in roots)]
+
+
+def group_by_device(roots):
+    """
+    :return: {st_dev: [位于该设备上的路径, ...]}，无法 stat 的路径归入 None
+    """
+    groups = {}
+    for root in roots:
+        try:
+            device = os.stat(root).st_dev
+        except OSError:
+            device = None
+        groups.setdefault(device, []).append(root)
+    return groups
+
+
+@lru_cache(maxsize=None)
+def is_rotational(device):
+    """
+    通过 /sys/dev/block/主:次/queue/rotational 判断设备是否为机械硬盘，分区读取其所属磁盘的信息，
+    非 Linux 系统或不对应块设备（如 tmpfs、网络文件系统）时返回 False
+    """
+    if device is None:
+        return False
+    block_path = os.path.realpath(f"/sys/dev/block/{os.major(device)}:{os.minor(device)}")
+    for path in (block_path, os.path.dirname(block_path)):
+        try:
+            with open(os.path.join(path, "queue", "rotational"), "r") as f:
+                return f.read().strip() == "1"
+        except OSError:
+            continue
+    return False
+
+
+class ParallelWalker(object):
+    """
+    多线程目录遍历器
+    每个工作线程从自己的双端队列尾部取目录（深度优先，局部性好），自己的队列为空时从其它线程队列头部窃取，
+    直接使用 os.scandir 返回的 DirEntry 判断类型，只对匹配的文件调用 stat，结果按批流式产出
+    多个起点按所在设备分组，每个设备由各自的一组线程遍历，机械硬盘只用 ROTATIONAL_WORKERS 个线程，
+    各组结果合并为一个流
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, batch_size=1000, stats=None, exclusions=None):
+        """
+        :param stats: 可选的 SearchStats，记录遍历的目录数、条目数与 stat 次数
+        :param exclusions: 可选的 ExclusionRules，被排除的目录不会进入
+        """
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.stats = stats if stats is not None else NULL_STATS
+        self.exclusions = exclusions
+
+    def scan(self, roots, match=None, token=None):
+        """
+        遍历 roots 下所有目录
+        :param match: 可选的回调，参数为文件名，返回 False 的文件不产出也不调用 stat
+        :param token: 可选的 CancellationToken，取消后停止遍历
+        :return: 生成器，每次产出一批 (目录路径, [(文件名, 大小, 创建时间, 修改时间), ...])，
+                 每个遍历到的目录恰好出现一次（重叠的起点只遍历一次），没有匹配文件时列表为空
+        """
+        groups = group_by_device(unique_roots(roots))
+        output = queue.Queue(maxsize=self.workers * 4)
+        states = [WalkState(self, group, match, token, self.device_workers(device), output)
+                  for device, group in groups.items()]
+        return self.run(states, output)
+
+    def device_workers(self, device):
+        if is_rotational(device):
+            return min(self.workers, ROTATIONAL_WORKERS)
+        return self.workers
+
+    @staticmethod
+    def run(states, output):
+        threads = [threading.Thread(target=state.work, args=(i,), daemon=True)
+                   for state in states for i in range(len(state.queues))]
+        for thread in threads:
+            thread.start()
+        finished_workers = 0
+        try:
+            while finished_workers < len(threads):
+                dir_results = output.get()
+                if dir_results is None:
+                    finished_workers += 1
+                else:
+                    yield dir_results
+        finally:
+            # 调用方提前结束迭代时同样通知工作线程退出
+            for state in states:
+                state.stop()
+            while finished_workers < len(threads):
+                if output.get() is None:
+                    finished_workers += 1
+
+    def walk(self, roots, match=None, token=None):
+        """
+        :return: 生成器，每次产出一批 (文件名, 所在目录, 大小, 创建时间, 修改时间)
+        """
+        for dir_results in self.scan(roots, match, token):
+            yield [(file_name, dir_path, size, ctime, mtime)
+                   for dir_path, files in dir_results
+                   for file_name, size, ctime, mtime in files]
+
+
+class WalkState(object):
+    """
+    一个设备上的遍历状态，由 ParallelWalker.scan 创建，同一次遍历的各设备共用 output 队列
+    """
+
+    def __init__(self, walker, roots, match, token, workers, output):
+        self.walker = walker
+        self.match = match
+        self.token = token if token is not None else CancellationToken()
+        self.stats = walker.stats
+        path_filter = walker.exclusions.compile(roots) if walker.exclusions is not None else None
+        self.allow_dir = path_filter.allow_dir if path_filter is not None else None
+        self.allow_file = path_filter.allow_file if path_filter is not None and path_filter.glob is not None else None
+        self.queues = [deque() for i in range(workers)]
+        self.pending = 0                # 已入队但尚未处理完的目录数，为 0 时遍历结束
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.output = output
+        for i, root in enumerate(roots):
+            self.queues[i % len(self.queues)].append(root)
+            self.pending += 1
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+    def next_dir(self, index):
+        own = self.queues[index]
+        try:
+            return own.pop()
+        except IndexError:
+            pass
+        start = random.randrange(len(self.queues))
+        for i in range(len(self.queues)):
+            victim = self.queues[(start + i) % len(self.queues)]
+            try:
+                return victim.popleft()
+            except IndexError:
+                continue
+        return None
+
+    def work(self, index):
+        own = self.queues[index]
+        dir_results = []
+        result_count = 0
+        try:
+            while True:
+                if self.stopped or self.token.cancelled:
+                    break
+                dir_path = self.next_dir(index)
+                if dir_path is None:
+                    # 先交出手头的结果，避免其它线程仍在遍历时结果迟迟不出现
+                    if dir_results:
+                        self.output.put(dir_results)
+                        dir_results, result_count = [], 0
+                    with self.condition:
+                        if self.pending == 0 or self.stopped:
+                            self.condition.notify_all()
+                            break
+                        self.condition.wait(0.01)
+                    continue
+
+                with self.stats.timer("scan_dir"):
+                    sub_dirs, files = self.scan_dir(dir_path)
+                if sub_dirs:
+                    with self.condition:
+                        self.pending += len(sub_dirs)
+                        own.extend(sub_dirs)
+                        self.condition.notify(len(sub_dirs))
+                # 没有匹配文件的目录也产出，建立索引时需要完整的目录表
+                dir_results.append((dir_path, files))
+                result_count += len(files) + 1
+                if result_count >= self.walker.batch_size:
+                    self.output.put(dir_results)
+                    dir_results, result_count = [], 0
+                with self.condition:
+                    self.pending -= 1
+                    if self.pending == 0:
+                        self.condition.notify_all()
+            if dir_results and not self.stopped:
+                self.output.put(dir_results)
+        finally:
+            self.output.put(None)
+
+    def scan_dir(self, dir_path):
+        sub_dirs = []
+        files = []
+        entry_count = stat_count = excluded_count = 0
+        try:
+            with os.scandir(dir_path) as entries:
+                for entry_count, entry in enumerate(entries, 1):
+                    if entry_count % CANCEL_CHECK_ENTRIES == 0 and self.token.cancelled:
+                        break
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if is_dir:
+                        # 与 os.walk 一致，不进入指向目录的符号链接
+                        if entry.is_symlink():
+                            continue
+                        if self.allow_dir is not None and not self.allow_dir(entry.path):
+                            excluded_count += 1
+                            continue
+                        sub_dirs.append(entry.path)
+                        continue
+                    if self.match is not None and not self.match(entry.name):
+                        continue
+                    if self.allow_file is not None and not self.allow_file(entry.path):
+                        continue
+                    stat_count += 1
+                    try:
+                        stat_info = entry.stat()
+                    except OSError:
+                        continue
+                    files.append((entry.name, stat_info.st_size, int(stat_info.st_ctime), int(stat_info.st_mtime)))
+        except OSError:
+            pass
+        if self.stats.enabled:
+            self.stats.count("dirs")
+            self.stats.count("entries", entry_count)
+            self.stats.count("stat_calls", stat_count)
+            self.stats.count("excluded_dirs", excluded_count)
+        return sub_dirs, files
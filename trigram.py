@@ -0,0 +1,36 @@
+import unicodedata
+import zlib
+from array import array
+from itertools import accumulate, chain
+from operator import sub
+
+GRAM_SIZE = 3
+
+
+def normalize(text):
+    """
+    统一 Unicode 表示（全角/半角、组合字符）并忽略大小写，建立索引与忽略大小写搜索时使用
+    """
+    return unicodedata.normalize("NFKC", text).casefold()
+
+
+def trigrams(text):
+    """
+    :param text: 已经过 normalize 的文本
+    :return: text 中所有长度为 3 的子串组成的集合
+    """
+    return {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+
+def encode_postings(ids):
+    """
+    将升序排列的文件编号压缩保存：先转为相邻差值，再整体 zlib 压缩
+    """
+    deltas = array("I", map(sub, ids, chain((0,), ids)))
+    return zlib.compress(deltas.tobytes())
+
+
+def decode_postings(blob):
+    deltas = array("I")
+    deltas.frombytes(zlib.decompress(blob))
+    return accumulate(deltas)
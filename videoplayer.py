@@ -5,8 +5,62 @@ from PyQt5.QtWidgets import (QApplication, QHBoxLayout, QLabel, QPushButton, QSi
 import time
 from ffpyplayer.player import MediaPlayer
 
+# 后台读取第一帧最多等待的时间（秒）
+PROBE_TIMEOUT = 10
+
+
+class VideoPoster(object):
+    """
+    视频的封面（第一帧）与时长，在后台读取，可以存入预览缓存
+    """
+
+    def __init__(self, image, duration):
+        self.image = image
+        self.duration = duration
+
+
+def frame_to_image(img):
+    """
+    把 ffpyplayer 的 rgb24 帧转换为 QImage，复制一份，不再引用解码器的缓冲区
+    """
+    data = img.to_bytearray()[0]
+    width, height = img.get_size()
+    # the technical name for the 'rgb24' default pixel format is RGB888,
+    # which is QImage.Format_RGB888 in the QImage format enum
+    return QtGui.QImage(data, width, height, img.get_linesizes()[0], QtGui.QImage.Format_RGB888).copy()
+
+
+def probe_video(video_path, token, edge=None):
+    """
+    在后台线程中打开视频，读取时长与第一帧，读取时等待解码器不会阻塞界面
+    :param edge: 封面缩小到的最大长边
+    :return: VideoPoster，读取失败、超时或已取消时返回 None
+    """
+    # 不输出声音，读取到第一帧即关闭
+    player = MediaPlayer(video_path, ff_opts={"an": True})
+    try:
+        deadline = time.monotonic() + PROBE_TIMEOUT
+        while not token.cancelled and time.monotonic() < deadline:
+            frame, val = player.get_frame()
+            if val == "eof":
+                return None
+            if frame is None:
+                time.sleep(0.01)
+                continue
+            image = frame_to_image(frame[0])
+            if edge is not None and max(image.width(), image.height()) > edge:
+                image = image.scaled(edge, edge, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+            return VideoPoster(image, player.get_metadata().get("duration"))
+        return None
+    finally:
+        player.close_player()
+
 
 class VideoPlayer(QWidget):
+    """
+    打开时不启动解码器，只显示后台读取的封面，按下播放后才创建 MediaPlayer
+    播放中由定时器按解码器给出的等待时间逐帧显示，不在界面线程中等待
+    """
 
     def __init__(self, video_path, parent=None):
         super(VideoPlayer, self).__init__(parent)
@@ -53,80 +107,88 @@ class VideoPlayer(QWidget):
 
         self.setLayout(layout)
 
+        # 单次触发，每次按下一帧的等待时间重新启动
         self.timer = QTimer()
+        self.timer.setSingleShot(True)
         self.timer.timeout.connect(self.showFrame)
-        self.timer.setInterval(1000 / 8)   # 控制帧数
 
-        self.video_media_data = None
-        self.init_player()
+        self.player = None
+        self.duration = None
+        # 已取出、等待到时显示的帧
+        self.pending_frame = None
 
-    def init_player(self):
+    def set_poster(self, poster):
         """
-        初始化播放器，获取第一帧画面及视频总时长
+        显示后台读取的封面与时长，已开始播放时忽略
         """
-        self.player = MediaPlayer(self.video_path)
-        while 1:
-            if self.showFrame()[0] is not None:
-                self.video_media_data = self.player.get_metadata()
-                self.player.set_pause(True)
-                break
-        self.positionSlider.setRange(0, self.video_media_data['duration'])   # 设置进度条长度
-        self.durationLabel.setText(f"0/{self.video_media_data['duration']}")
+        if poster is None or self.player is not None:
+            return
+        self.set_duration(poster.duration)
+        self.show_image(poster.image)
+
+    def set_duration(self, duration):
+        if duration is None:
+            return
+        self.duration = duration
+        self.positionSlider.setRange(0, int(duration))   # 设置进度条长度
+        self.durationLabel.setText(f"0/{duration}")
 
     def play(self):
-        if not self.timer.isActive():
-            self.player.set_pause(False)
-            self.timer.start()
+        if self.player is None:
+            # 按下播放后才启动解码器
+            self.player = MediaPlayer(self.video_path)
             self.positionSlider.setValue(0)
-        else:
-            self.player.set_pause(False)
+        self.player.set_pause(False)
+        self.timer.start(0)
         self.playButton.hide()
         self.pauseButton.show()
 
     def pause(self):
-        self.player.set_pause(True)
+        if self.player is not None:
+            self.player.set_pause(True)
+        self.timer.stop()
         self.pauseButton.hide()
         self.playButton.show()
 
     def showFrame(self):
-        frame, val = self.player.get_frame()
-
-        if val != 'eof' and frame is not None:
-            time.sleep(val)
-            img, t = frame
+        if self.pending_frame is not None:
+            img, t = self.pending_frame
+            self.pending_frame = None
+            self.show_image(frame_to_image(img))
+            self.positionSlider.setValue(int(t))
+            if self.duration is None:
+                self.set_duration(self.player.get_metadata().get("duration"))
+            if self.duration is not None:
+                self.durationLabel.setText(f"{round(t, 1)}/{self.duration}")
 
-            data = img.to_bytearray()[0]
-            width, height = img.get_size()
-
-            # the technical name for the 'rgb24' default pixel format is RGB888,
-            # which is QImage.Format_RGB888 in the QImage format enum
-            qimage = QtGui.QImage(data, width, height, QtGui.QImage.Format_RGB888)
-            self.pixmap = QtGui.QPixmap.fromImage(qimage)
-            self.pixmap = self.pixmap.scaled(self.label.width(), self.label.height(),
-                                   QtCore.Qt.IgnoreAspectRatio)
-            self.label.setPixmap(self.pixmap)
-            self.update()
-
-            self.positionSlider.setValue(frame[1])
-            if self.video_media_data is not None:
-                self.durationLabel.setText(f"{round(frame[1], 1)}/{self.video_media_data['duration']}")
-
-        elif val == "eof":
+        frame, val = self.player.get_frame()
+        if val == "eof":
             self.player.seek(0, relative=False, accurate=False)            # 跳转回视频开头
             self.player.set_pause(True)
             self.pauseButton.hide()
             self.playButton.show()
-            self.timer.stop()
         elif frame is None:
-            time.sleep(0.01)
-        return frame, val
+            # 解码器尚未准备好下一帧，稍后再取
+            self.timer.start(10)
+        else:
+            # val 为这一帧应当显示前还需等待的秒数
+            self.pending_frame = frame
+            self.timer.start(int(val * 1000))
+
+    def show_image(self, image):
+        self.pixmap = QtGui.QPixmap.fromImage(image)
+        self.pixmap = self.pixmap.scaled(self.label.width(), self.label.height(),
+                               QtCore.Qt.IgnoreAspectRatio)
+        self.label.setPixmap(self.pixmap)
+        self.update()
 
     def setPosition(self, position):
         pass
 
     def closeEvent(self, event):
         self.timer.stop()
-        self.player.close_player()
+        if self.player is not None:
+            self.player.close_player()
 
 
 if __name__ == '__main__':